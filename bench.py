@@ -0,0 +1,277 @@
+#!/usr/bin/python
+"""Micro benchmarks. Run as `python bench.py [name ...]`"""
+import binascii, os, random, sys, timeit
+from functools import reduce
+from bitcoin import *
+
+
+def _payout_tx(n):
+    """1 input, n P2PKH outputs (binary txobj)"""
+    return {
+        "version": 1,
+        "ins": [{"outpoint": {"hash": os.urandom(32), "index": 0},
+                 "script": os.urandom(107), "sequence": 4294967295}],
+        "outs": [{"value": 10000 + i, "script": b'\x76\xa9\x14' + os.urandom(20) + b'\x88\xac'}
+                 for i in range(n)],
+        "locktime": 0,
+    }
+
+
+def _concat_serialize(txobj):
+    # the previous serializer: one small string per field, folded together
+    o = [encode(txobj["version"], 256, 4)[::-1], num_to_var_int(len(txobj["ins"]))]
+    for inp in txobj["ins"]:
+        o.append(inp["outpoint"]["hash"][::-1])
+        o.append(encode(inp["outpoint"]["index"], 256, 4)[::-1])
+        o.append(num_to_var_int(len(inp["script"])) + inp["script"])
+        o.append(encode(inp["sequence"], 256, 4)[::-1])
+    o.append(num_to_var_int(len(txobj["outs"])))
+    for out in txobj["outs"]:
+        o.append(encode(out["value"], 256, 8)[::-1])
+        o.append(num_to_var_int(len(out["script"])) + out["script"])
+    o.append(encode(txobj["locktime"], 256, 4)[::-1])
+    return reduce(lambda x, y: x + y, o, bytes())
+
+
+def _report(name, fn, number):
+    t = min(timeit.repeat(fn, number=number, repeat=3)) / number
+    print("  %-36s %10.3f ms" % (name, t * 1000))
+
+
+def bench_serialize(n=10000):
+    print("serialize, 1-in %d-out payout tx" % n)
+    txobj = _payout_tx(n)
+    tx = Tx.from_dict(txobj)
+    assert _concat_serialize(txobj) == bin_serialize(txobj) == tx.serialize()
+    _report("concat (old)", lambda: _concat_serialize(txobj), 3)
+    _report("bin_serialize", lambda: bin_serialize(txobj), 10)
+    _report("Tx.serialize", lambda: tx.serialize(), 10)
+
+
+def bench_signall(n=200):
+    print("signall, %d-in 2-out P2PKH tx" % n)
+    priv = sha256('bench')
+    ins = ['%064x:0' % i for i in range(n)]
+    tx = binascii.unhexlify(mktx(ins, [privtoaddr(priv) + ':1000', privtoaddr(priv) + ':2000']))
+    txobj = bin_deserialize(tx)
+    cache = SighashCache(tx)
+    script = binascii.unhexlify(mk_pubkey_script(privtoaddr(priv)))
+    # per input: copy the tx, blank the scripts, reserialize and hash it all
+    _report("signature_form per input", lambda: [bin_sighash(bin_serialize(
+        signature_form(txobj, i, script)), 1) for i in range(n)], 3)
+    _report("SighashCache.sighash", lambda: [cache.sighash(i, script) for i in range(n)], 3)
+    _report("bin_signall", lambda: bin_signall(tx, priv), 1)
+    _report("bin_signall, 4 workers", lambda: bin_signall(tx, priv, workers=4), 1)
+
+
+def bench_script(n=200):
+    print("script verification, %d P2PKH spends / Core script vectors" % n)
+    import json
+    from bitcoin.script import _COMPILED
+    previous = get_sigcache()
+    set_sigcache(None)
+    priv = sha256('bench')
+    spk = binascii.unhexlify(mk_pubkey_script(privtoaddr(priv)))
+    tx = bin_signall(binascii.unhexlify(mktx(['%064x:0' % i for i in range(n)],
+                                             [privtoaddr(priv) + ':1000'])), priv)
+    cache = SighashCache(tx)
+    sigs = [inp["script"] for inp in bin_deserialize(tx)["ins"]]
+    _report("P2PKH, template fast path", lambda: [verify_script(sig, spk, cache, i)
+                                                  for i, sig in enumerate(sigs)], 1)
+    _report("P2PKH, interpreter", lambda: [verify_script(sig, spk, cache, i, templates=False)
+                                           for i, sig in enumerate(sigs)], 1)
+    # with every signature in the sigcache only the script handling is left
+    set_sigcache(SigCache())
+    [verify_script(sig, spk, cache, i) for i, sig in enumerate(sigs)]
+    _report("P2PKH, fast path, warm sigcache", lambda: [verify_script(sig, spk, cache, i)
+                                                        for i, sig in enumerate(sigs)], 20)
+    _report("P2PKH, interpreter, warm sigcache", lambda: [verify_script(sig, spk, cache, i, templates=False)
+                                                          for i, sig in enumerate(sigs)], 20)
+    set_sigcache(None)
+
+    vectors = []
+    for path in ['tests/script_valid.json', 'tests/script_invalid.json']:
+        with open(path) as f:
+            vectors += [(binascii.unhexlify(parse_script(tv[0])), binascii.unhexlify(parse_script(tv[1])))
+                        for tv in json.load(f) if len(tv) >= 2]
+    _report("%d vectors, compiled cache" % len(vectors),
+            lambda: [verify_script(a, b) for a, b in vectors], 20)
+
+    def uncached():
+        for a, b in vectors:
+            _COMPILED.clear()
+            verify_script(a, b)
+    _report("%d vectors, no cache" % len(vectors), uncached, 20)
+    set_sigcache(previous)
+
+
+def bench_select(n=100000, payments=20, fee_rate=10):
+    print("coin selection, %d utxos, %d payments at %d sat/byte" % (n, payments, fee_rate))
+    rng = random.Random(0)
+    unspent = [{"output": "%064x:0" % i, "value": int(rng.lognormvariate(12, 2)) + 1}
+                for i in range(n)]
+    targets = [int(rng.lognormvariate(13, 1.5)) for _ in range(payments)]
+    pool = UTXOPool(unspent)
+    fee = 10000     # fixed fee, as send / preparetx use
+    _report("select, list", lambda: [select(unspent, t + fee) for t in targets], 1)
+    _report("select, UTXOPool", lambda: [select(pool, t + fee) for t in targets], 1)
+    _report("select_coins, UTXOPool", lambda: [select_coins(pool, t, fee_rate, rng=rng)
+                                               for t in targets], 1)
+
+    def summary(name, picks):
+        # 1 payment output, plus change if any
+        sizes, fees = [], []
+        for t, sel, change in picks:
+            sizes.append(10 + 34 + 148 * len(sel) + 34 * bool(change))
+            fees.append(sum(u["value"] for u in sel) - t - change)
+        print("  %-36s %6.1f bytes, %6d sat fee avg, %d changeless" % (
+            name, float(sum(sizes)) / len(sizes), sum(fees) // len(fees),
+            sum(1 for t, sel, change in picks if not change)))
+
+    picks = []
+    for t in targets:
+        sel = select(pool, t + fee)
+        change = sum(u["value"] for u in sel) - t - fee
+        picks.append((t, sel, change if change > 5430 else 0))
+    summary("select", picks)
+    summary("select_coins", [(t,) + select_coins(pool, t, fee_rate, rng=rng) for t in targets])
+
+
+def bench_payout(n=30000, recipients=5000):
+    print("payout, %d payments to %d addresses" % (n, recipients))
+    from bitcoin.payout import _SCRIPT_CACHE
+    rng = random.Random(0)
+    addrs = [privtoaddr(sha256(str(i))) for i in range(recipients)]
+    payouts = ["%s:%d" % (rng.choice(addrs), rng.randint(1000, 100000)) for _ in range(n)]
+    unspent = [{"output": "%064x:0" % i, "value": rng.randint(10 ** 7, 10 ** 9)} for i in range(500)]
+    ins = [u["output"] for u in unspent[:50]]
+    _report("mktx (one tx, no dedup)", lambda: mktx(ins, payouts), 1)
+
+    def run():
+        _SCRIPT_CACHE.clear()
+        return mk_payout_txs(unspent, payouts, addrs[0], 10)
+    _report("mk_payout_txs", run, 1)
+    _report("mk_payout_txs, cached scripts", lambda: mk_payout_txs(unspent, payouts, addrs[0], 10), 1)
+
+
+def bench_txid(n=2000, lookups=10):
+    print("txid, %d txs looked up %d times each" % (n, lookups))
+    txobj = _payout_tx(20)
+    raws = []
+    for i in range(n):
+        txobj["locktime"] = i
+        raws.append(bin_serialize(txobj))
+    hexes = [safe_hexlify(raw) for raw in raws]
+    txs = [Tx.from_bytes(raw) for raw in raws]
+    _report("txhash(hex)", lambda: [txhash(h) for _ in range(lookups) for h in hexes], 1)
+    _report("txhash(Tx), memoised", lambda: [txhash(tx) for _ in range(lookups) for tx in txs], 1)
+
+
+def bench_compress(n=200):
+    print("compact encoding, %d signed 2-in 2-out P2PKH txs" % n)
+    priv = sha256('bench') + '01'
+    addr = privtoaddr(priv)
+    txs = [binascii.unhexlify(signall(mktx(['%064x:0' % i, '%064x:1' % i],
+                                           [addr + ':%d' % (i * 100000), addr + ':1000']), priv))
+           for i in range(n)]
+    packed = [compress_tx(tx) for tx in txs]
+    _report("compress_tx", lambda: [compress_tx(tx) for tx in txs], 3)
+    _report("decompress_tx", lambda: [decompress_tx(p) for p in packed], 3)
+    raw, small = sum(len(tx) for tx in txs), sum(len(p) for p in packed)
+    print("  %-36s %10d -> %d bytes (%.1f%%)" % ("size", raw, small, 100.0 * small / raw))
+
+
+def bench_check(n=2000):
+    print("sanity checks, %d signed 2-in 2-out P2PKH txs" % n)
+    priv = sha256('bench') + '01'
+    addr = privtoaddr(priv)
+    tx = binascii.unhexlify(signall(mktx(['%064x:0' % 1, '%064x:1' % 1], [addr + ':1000', addr + ':2000']), priv))
+    txs = [tx] * n
+    _report("bin_deserialize", lambda: [bin_deserialize(t) for t in txs], 3)
+    _report("check_transactions", lambda: check_transactions(txs), 3)
+    _report("prefilter_txs (+ standardness)", lambda: prefilter_txs(txs), 3)
+
+
+def bench_multisig(m=3, n=5):
+    print("multisig combining, %d of %d sigs in reverse key order" % (m, n))
+    privs = [sha256('bench%d' % x) + '01' for x in range(n)]
+    pubs = [privtopub(p) for p in privs]
+    ms = mk_multisig_script(pubs, m, n)
+    tx = mktx(['%064x:0' % 1], [privtoaddr(privs[0]) + ':1000'])
+    sigs = [multisign(tx, 0, ms, privs[x]) for x in range(n - 1, n - 1 - m, -1)]
+
+    def naive():
+        # match each sig by trying keys until one verifies
+        found = []
+        for sig in sigs:
+            found.append(next(k for k, pub in enumerate(pubs) if verify_tx_input(tx, 0, ms, sig, pub)))
+        return apply_multisignatures(tx, 0, ms, [sig for _, sig in sorted(zip(found, sigs))])
+    _report("verify_tx_input per key", naive, 5)
+    _report("combine_multisignatures", lambda: combine_multisignatures(tx, 0, ms, sigs), 5)
+
+
+def bench_utxoset(n=100000):
+    print("UTXO set, %d P2PKH coins" % n)
+    import tempfile
+    script = binascii.unhexlify(mk_pubkey_script(privtoaddr(sha256('bench') + '01')))
+    utxos = [{"output": "%064x:%d" % (i, i % 4), "value": i + 1, "script": script} for i in range(n)]
+    keys = [outpoint_key(u["output"]) for u in utxos]
+    _report("build", lambda: UTXOSet(utxos), 1)
+    coins = UTXOSet(utxos)
+    _report("lookup (36 byte keys)", lambda: [coins.get(k) for k in keys], 3)
+    coins.values        # sorted by value on first use
+    _report("select_coins", lambda: select_coins(coins, n * 10, 2, rng=random.Random(0)), 10)
+
+    def churn():
+        coins.spend(keys[0])
+        coins.add(keys[0], 1, script)
+    _report("spend + add", churn, 100)
+
+    def churn_select():
+        churn()
+        select_coins(coins, n * 10, 2, rng=random.Random(0))
+    _report("spend + add + select_coins", churn_select, 3)
+    path = tempfile.mktemp()
+    try:
+        _report("save", lambda: coins.save(path), 3)
+        _report("load (mmap)", lambda: UTXOSet.load(path), 3)
+    finally:
+        os.remove(path)
+
+
+def _hex_der_decode(sig):
+    # the previous decoder: hex slicing, no validation
+    leftlen = decode(sig[6:8], 16)*2
+    rightlen = decode(sig[10+leftlen:12+leftlen], 16)*2
+    return (None, decode(sig[8:8+leftlen], 16), decode(sig[12+leftlen:12+leftlen+rightlen], 16))
+
+
+def bench_der(n=2000):
+    print("DER decode, %d signatures" % n)
+    sigs = [bin_der_encode_sig(decode(os.urandom(32), 256), decode(os.urandom(32), 256), 1)
+            for _ in range(n)]
+    hexsigs = [safe_hexlify(sig) for sig in sigs]
+    _report("hex slicing (unchecked)", lambda: [_hex_der_decode(h) for h in hexsigs], 20)
+    _report("parse_der_sig (strict)", lambda: [parse_der_sig(sig) for sig in sigs], 20)
+
+
+BENCHMARKS = [
+    ("serialize", bench_serialize),
+    ("signall", bench_signall),
+    ("script", bench_script),
+    ("der", bench_der),
+    ("select", bench_select),
+    ("payout", bench_payout),
+    ("txid", bench_txid),
+    ("compress", bench_compress),
+    ("utxoset", bench_utxoset),
+    ("check", bench_check),
+    ("multisig", bench_multisig),
+]
+
+
+if __name__ == '__main__':
+    wanted = sys.argv[1:]
+    for name, fn in BENCHMARKS:
+        if not wanted or name in wanted:
+            fn()
@@ -1,6 +1,14 @@
+from bitcoin.base58 import *
+from bitcoin.sigcache import *
+from bitcoin.coinselect import *
 from bitcoin.pyspecials import *
 from bitcoin.main import *
 from bitcoin.transaction import *
+from bitcoin.tx import *
+from bitcoin.script import *
+from bitcoin.payout import *
+from bitcoin.compress import *
+from bitcoin.utxoset import *
 from bitcoin.mnemonic import *
 from bitcoin.bci import *
 from bitcoin.composite import *
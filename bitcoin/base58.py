@@ -0,0 +1,212 @@
+#!/usr/bin/python
+import binascii
+import hashlib
+
+is_python2 = (str == bytes)
+
+# Base58 codec
+#
+# Table driven decode, chunked divmod encode. The integer <-> bytes step is a
+# single C call (hexlify/int or int.to_bytes) and leading zeros are counted by
+# stripping rather than by regex.
+
+B58_DIGITS = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+ADDRESS_LEN = 25            # vbyte + hash160 + checksum
+WIF_LEN = 37                # vbyte + privkey + checksum
+WIF_COMPRESSED_LEN = 38     # vbyte + privkey + 0x01 + checksum
+
+# 58**10 < 2**63, so every chunk fits in a machine word
+_CHUNK_DIGITS = 10
+_CHUNK = 58 ** _CHUNK_DIGITS
+_PAIRS = [a + b for a in B58_DIGITS for b in B58_DIGITS]
+
+_DECODE_TABLE = [-1] * 256
+for _i, _c in enumerate(B58_DIGITS):
+    _DECODE_TABLE[ord(_c)] = _i
+del _i, _c
+
+_WIF_CHARS = 51
+_WIF_COMPRESSED_CHARS = 52
+
+
+if is_python2:
+
+    def _bytes_to_int(b):
+        return int(binascii.hexlify(b), 16) if b else 0
+
+    def _int_to_bytes(n, length):
+        h = '%x' % n
+        return binascii.unhexlify(h.zfill(length * 2))
+
+    def _ascii(s):
+        if isinstance(s, unicode):
+            return s.encode('ascii')
+        return s
+
+else:
+
+    def _bytes_to_int(b):
+        return int.from_bytes(b, 'big')
+
+    def _int_to_bytes(n, length):
+        return n.to_bytes(length, 'big')
+
+    def _ascii(s):
+        if isinstance(s, str):
+            return s.encode('ascii')
+        return bytes(s)
+
+
+def _int_bytelen(n):
+    return (n.bit_length() + 7) // 8
+
+
+def _encode_int(n):
+    """Base58 digits of n (no leading zero handling)"""
+    chunks = []
+    while n >= _CHUNK:
+        n, r = divmod(n, _CHUNK)
+        chunks.append(r)
+    pairs = _PAIRS
+    out = []
+    for r in chunks:
+        # full chunks are always exactly 10 digits wide
+        r, a = divmod(r, 3364)
+        r, b = divmod(r, 3364)
+        r, c = divmod(r, 3364)
+        r, d = divmod(r, 3364)
+        out.append(pairs[r] + pairs[d] + pairs[c] + pairs[b] + pairs[a])
+    head = []
+    while n:
+        n, r = divmod(n, 58)
+        head.append(B58_DIGITS[r])
+    out.append(''.join(reversed(head)))
+    return ''.join(reversed(out))
+
+
+def _decode_int(s, start):
+    """Integer value of the base58 ascii bytes s[start:]"""
+    table = _DECODE_TABLE
+    end = len(s)
+    first = start + (end - start) % _CHUNK_DIGITS
+    acc = 0
+    for i in range(start, first):
+        v = table[s[i]]
+        if v < 0:
+            raise ValueError("Invalid base58 character: %r" % chr(s[i]))
+        acc = acc * 58 + v
+    n = acc
+    for j in range(first, end, _CHUNK_DIGITS):
+        acc = 0
+        for i in range(j, j + _CHUNK_DIGITS):
+            v = table[s[i]]
+            if v < 0:
+                raise ValueError("Invalid base58 character: %r" % chr(s[i]))
+            acc = acc * 58 + v
+        n = n * _CHUNK + acc
+    return n
+
+
+def b58encode_int(n):
+    """Base58 digits of a non-negative int ('' for 0)"""
+    return _encode_int(n)
+
+
+def b58decode_int(s):
+    """Int value of a base58 string (no leading-'1' handling)"""
+    return _decode_int(bytearray(_ascii(s)), 0)
+
+
+def b58encode(b):
+    """Encode bytes to a base58 string"""
+    b = bytes(b)
+    stripped = b.lstrip(b'\0')
+    pad = len(b) - len(stripped)
+    return '1' * pad + _encode_int(_bytes_to_int(stripped))
+
+
+def b58decode(s, length=None):
+    """Decode a base58 string to bytes; if length is given the result is
+    fixed width (leading zero bytes come for free)"""
+    s = bytearray(_ascii(s))
+    pad = len(s) - len(s.lstrip(b'1'))
+    n = _decode_int(s, pad)
+    if length is None:
+        return b'\0' * pad + (_int_to_bytes(n, _int_bytelen(n)) if n else b'')
+    if _int_bytelen(n) + pad != length:
+        raise ValueError("Base58 string does not decode to %d bytes" % length)
+    return _int_to_bytes(n, length)
+
+
+def _checksum(b):
+    return hashlib.sha256(hashlib.sha256(b).digest()).digest()[:4]
+
+
+def b58check_encode(payload, magicbyte=0):
+    """Base58check encode payload bytes with a single version byte"""
+    data = bytes(bytearray([int(magicbyte)])) + bytes(payload)
+    return b58encode(data + _checksum(data))
+
+
+def b58check_decode(s, length=None):
+    """Base58check decode to (magicbyte, payload); raises ValueError on a
+    bad checksum. length is the full decoded length incl. vbyte & checksum"""
+    data = b58decode(s, length)
+    if len(data) < 5 or _checksum(data[:-4]) != data[-4:]:
+        raise ValueError("Invalid base58check checksum")
+    return bytearray(data[:1])[0], data[1:-4]
+
+
+# Fixed length fast paths
+
+def b58check_encode_address(h160, magicbyte=0):
+    """hash160 (20 bytes) => address"""
+    if len(h160) != 20:
+        raise ValueError("hash160 must be 20 bytes")
+    return b58check_encode(h160, magicbyte)
+
+
+def b58check_decode_address(addr):
+    """address => (magicbyte, hash160)"""
+    return b58check_decode(addr, ADDRESS_LEN)
+
+
+def b58check_decode_wif(wif):
+    """WIF => (magicbyte, privkey bytes incl. any 0x01 compression flag)"""
+    if len(wif) == _WIF_COMPRESSED_CHARS:
+        return b58check_decode(wif, WIF_COMPRESSED_LEN)
+    elif len(wif) == _WIF_CHARS:
+        return b58check_decode(wif, WIF_LEN)
+    return b58check_decode(wif)
+
+
+# Bulk variants
+
+def b58encode_list(items):
+    return [b58encode(b) for b in items]
+
+
+def b58decode_list(items, length=None):
+    return [b58decode(s, length) for s in items]
+
+
+def b58check_encode_list(payloads, magicbyte=0):
+    """[payload, ...] => [b58check, ...] sharing one version byte"""
+    vb = bytes(bytearray([int(magicbyte)]))
+    sha = hashlib.sha256
+    out = []
+    for p in payloads:
+        data = vb + bytes(p)
+        out.append(b58encode(data + sha(sha(data).digest()).digest()[:4]))
+    return out
+
+
+def b58check_decode_list(items, length=None):
+    """[b58check, ...] => [(magicbyte, payload), ...]"""
+    return [b58check_decode(s, length) for s in items]
+
+
+def addresses_to_hash160s(addrs):
+    """[address, ...] => [hash160 bytes, ...] (checksums verified)"""
+    return [b58check_decode(a, ADDRESS_LEN)[1] for a in addrs]
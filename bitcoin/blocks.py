@@ -7,31 +7,32 @@ from bitcoin.pyspecials import *
 
 def serialize_header(inp):
     o = encode(inp['version'], 256, 4)[::-1] + \
-        unhexify(inp['prevhash'])[::-1] + \
-        unhexify(inp['merkle_root'])[::-1] + \
+        safe_unhexlify(inp['prevhash'])[::-1] + \
+        safe_unhexlify(inp['merkle_root'])[::-1] + \
         encode(inp['timestamp'], 256, 4)[::-1] + \
         encode(inp['bits'], 256, 4)[::-1] + \
         encode(inp['nonce'], 256, 4)[::-1]
-    h = hexify(bin_sha256(bin_sha256(o))[::-1])
+    h = safe_hexlify(bin_sha256(bin_sha256(o))[::-1])
     assert h == inp['hash'], (sha256(o), inp['hash'])
-    return hexify(o)
+    return safe_hexlify(o)
 
 
 def deserialize_header(inp):
-    inp = unhexify(inp)
+    inp = safe_unhexlify(inp)
     return {
         "version": decode(inp[:4][::-1], 256),
-        "prevhash": hexify(inp[4:36][::-1]),
-        "merkle_root": hexify(inp[36:68][::-1]),
+        "prevhash": safe_hexlify(inp[4:36][::-1]),
+        "merkle_root": safe_hexlify(inp[36:68][::-1]),
         "timestamp": decode(inp[68:72][::-1], 256),
         "bits": decode(inp[72:76][::-1], 256),
         "nonce": decode(inp[76:80][::-1], 256),
-        "hash": hexify(bin_sha256(bin_sha256(inp))[::-1])
+        "hash": safe_hexlify(bin_sha256(bin_sha256(inp))[::-1])
     }
 
 
 def mk_merkle_proof(header, hashes, index):
-    nodes = [unhexify(h)[::-1] for h in hashes]
+    """hashes are hex txids, or Tx / TxView objects (memoised txids)"""
+    nodes = [h.bin_txid[::-1] if hasattr(h, 'bin_txid') else safe_unhexlify(h)[::-1] for h in hashes]
     if len(nodes) % 2 and len(nodes) > 2:
         nodes.append(nodes[-1])
     layers = [nodes]
@@ -44,11 +45,11 @@ def mk_merkle_proof(header, hashes, index):
         nodes = newnodes
         layers.append(nodes)
     # Sanity check, make sure merkle root is valid
-    assert hexify(nodes[0][::-1]) == header['merkle_root']
+    assert safe_hexlify(nodes[0][::-1]) == header['merkle_root']
     merkle_siblings = \
         [layers[i][(index >> i) ^ 1] for i in range(len(layers)-1)]
     return {
-        "hash": hashes[index],
-        "siblings": [hexify(x[::-1]) for x in merkle_siblings],
+        "hash": getattr(hashes[index], 'txid', hashes[index]),
+        "siblings": [safe_hexlify(x[::-1]) for x in merkle_siblings],
         "header": header
     }
@@ -0,0 +1,266 @@
+#!/usr/bin/python
+import random
+from bisect import bisect_left, bisect_right
+
+# Coin selection
+#
+# UTXOPool keeps unspent outputs ({"output": "txid:n", "value": v}) sorted
+# by value with an outpoint index, so "smallest coin >= x" is a bisect and
+# range sums come from cached prefix sums instead of a sort per call.
+#
+# select_coins works on effective values (value minus the fee to spend the
+# input at the given fee rate). It first runs a depth first branch-and-bound
+# search for an input set that pays the target with less excess than a
+# change output would cost, and only if there is none falls back to a
+# knapsack search that leaves change.
+
+TX_OVERHEAD_SIZE = 10       # version, in / out counts, locktime
+P2PKH_INPUT_SIZE = 148      # outpoint, 107 byte scriptSig, sequence
+P2PKH_OUTPUT_SIZE = 34      # value, 25 byte scriptPubKey
+DUST_THRESHOLD = 5430
+
+BNB_MAX_TRIES = 10000         # far less than Core's 100000: each try is interpreted
+KNAPSACK_ITERATIONS = 1000
+KNAPSACK_MAX_CANDIDATES = 100
+KNAPSACK_MAX_WORK = 100000     # coins visited, over all iterations
+
+
+def _fee(size, fee_rate):
+    """Fee in satoshis for size bytes at fee_rate sat/byte, rounded up"""
+    fee = size * fee_rate
+    return int(fee) + (fee > int(fee))
+
+
+class UTXOPool(object):
+    """Unspent outputs kept sorted by value (ascending), indexed by outpoint"""
+    __slots__ = ('_utxos', '_values', '_index', '_prefix')
+
+    def __init__(self, unspent=()):
+        self._utxos = sorted(unspent, key=lambda u: u["value"])
+        self._values = [int(u["value"]) for u in self._utxos]
+        self._index = dict((u["output"], u) for u in self._utxos)
+        if len(self._index) != len(self._utxos):
+            raise ValueError("Duplicate outpoint in unspent list")
+        self._prefix = None
+
+    def add(self, utxo):
+        if utxo["output"] in self._index:
+            raise ValueError("Outpoint already in pool: %s" % utxo["output"])
+        value = int(utxo["value"])
+        pos = bisect_right(self._values, value)
+        self._values.insert(pos, value)
+        self._utxos.insert(pos, utxo)
+        self._index[utxo["output"]] = utxo
+        self._prefix = None
+
+    add_utxo = add      # as UTXOSet
+
+    def remove(self, output):
+        """Remove and return the utxo spending outpoint "txid:n" """
+        utxo = self._index.pop(output)
+        pos = bisect_left(self._values, int(utxo["value"]))
+        while self._utxos[pos] is not utxo:
+            pos += 1
+        del self._values[pos], self._utxos[pos]
+        self._prefix = None
+        return utxo
+
+    def spend(self, utxos):
+        """Remove every utxo in utxos (e.g. a selection) from the pool"""
+        for u in utxos:
+            self.remove(u["output"])
+
+    def get(self, output, default=None):
+        return self._index.get(output, default)
+
+    def __contains__(self, output):
+        return output in self._index
+
+    def __len__(self):
+        return len(self._utxos)
+
+    def __iter__(self):
+        return iter(self._utxos)
+
+    @property
+    def utxos(self):
+        """utxos in ascending value order (don't mutate)"""
+        return self._utxos
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def total(self):
+        return self.sum_range(0, len(self._values))
+
+    def bisect(self, value):
+        """Position of the smallest coin worth at least value"""
+        return bisect_left(self._values, value)
+
+    def sum_range(self, lo, hi):
+        """Sum of the values of coins lo..hi-1 (ascending positions)"""
+        if self._prefix is None:
+            prefix, acc = [0] * (len(self._values) + 1), 0
+            for i, v in enumerate(self._values):
+                acc += v
+                prefix[i+1] = acc
+            self._prefix = prefix
+        return self._prefix[hi] - self._prefix[lo]
+
+
+def as_pool(unspent):
+    """unspent as a UTXOPool: a list of utxos, a UTXOPool, or anything
+    with a pool() method (e.g. a UTXOSet)"""
+    if isinstance(unspent, UTXOPool):
+        return unspent
+    if hasattr(unspent, 'pool'):
+        return unspent.pool()
+    return UTXOPool(unspent)
+
+
+def _bnb(values, hi, available, input_fee, target, tolerance, max_tries, max_count=None):
+    """Depth first search over the coins below position hi (largest first;
+    available is their total effective value) for a set of at most
+    max_count coins whose effective value lies in [target, target +
+    tolerance]. Returns the positions of the set with the least excess, or
+    None."""
+    # depth d is the coin at position hi - 1 - d
+    selected, current = [], 0
+    best, best_excess = None, None
+    d = 0
+    for _ in range(max_tries):
+        if current + available < target or current > target + tolerance:
+            backtrack = True
+        elif current < target and len(selected) == max_count:
+            backtrack = True
+        elif current >= target:
+            excess = current - target
+            if best is None or excess < best_excess:
+                best, best_excess = list(selected), excess
+                if excess == 0:
+                    break
+            backtrack = True
+        else:
+            backtrack = False
+
+        if backtrack:
+            if not selected:
+                break
+            # give back the coins skipped since the last inclusion, then drop it
+            last = selected.pop()
+            while d > last + 1:
+                d -= 1
+                available += values[hi - 1 - d] - input_fee
+            d = last
+            current -= values[hi - 1 - d] - input_fee
+        else:
+            ev = values[hi - 1 - d] - input_fee
+            available -= ev
+            # excluding a coin and then including an equal one is a duplicate branch
+            if not selected or selected[-1] == d - 1 or ev != values[hi - d] - input_fee:
+                selected.append(d)
+                current += ev
+        d += 1
+    if best is None:
+        return None
+    return [hi - 1 - d for d in best]
+
+
+def _knapsack(pool, lo, input_fee, target, rng, iterations):
+    """Positions of coins covering target (in effective value), preferring
+    the smallest single coin that does unless a random subset of the
+    largest smaller coins gets closer"""
+    values = pool.values
+    k = pool.bisect(target + input_fee)
+    if k < len(values) and values[k] == target + input_fee:
+        return [k]
+    larger = k if k < len(values) else None
+    if pool.sum_range(lo, k) - (k - lo) * input_fee < target:
+        return None if larger is None else [larger]
+
+    # the largest coins below target are the only ones that matter for closeness
+    cands, acc = [], 0
+    for i in range(k - 1, lo - 1, -1):
+        cands.append(i)
+        acc += values[i] - input_fee
+        if acc >= 2 * target or (acc >= target and len(cands) >= KNAPSACK_MAX_CANDIDATES):
+            break
+
+    evs = [values[i] - input_fee for i in cands]
+    best, best_total = list(range(len(cands))), acc
+    for _ in range(min(iterations, KNAPSACK_MAX_WORK // len(cands) + 1)):
+        if best_total == target:
+            break
+        included, total, reached = [False] * len(cands), 0, False
+        for npass in range(2):
+            if reached:
+                break
+            for j, ev in enumerate(evs):
+                if (rng.random() < 0.5 if npass == 0 else not included[j]):
+                    total += ev
+                    included[j] = True
+                    if total >= target:
+                        reached = True
+                        if total < best_total:
+                            best_total = total
+                            best = [x for x in range(len(cands)) if included[x]]
+                        total -= ev
+                        included[j] = False
+    if larger is not None and values[larger] - input_fee <= best_total:
+        return [larger]
+    return [cands[j] for j in best]
+
+
+def _largest_first(values, lo, input_fee, target, max_count):
+    """Positions of the fewest coins covering target (in effective value),
+    taken largest first, if max_count or fewer do; else None"""
+    picked, acc = [], 0
+    for i in range(len(values) - 1, max(lo, len(values) - max_count) - 1, -1):
+        picked.append(i)
+        acc += values[i] - input_fee
+        if acc >= target:
+            return picked
+    return None
+
+
+def select_coins(unspent, value, fee_rate=0, base_size=TX_OVERHEAD_SIZE + P2PKH_OUTPUT_SIZE,
+                 input_size=P2PKH_INPUT_SIZE, change_size=P2PKH_OUTPUT_SIZE,
+                 min_change=DUST_THRESHOLD, max_tries=BNB_MAX_TRIES,
+                 iterations=KNAPSACK_ITERATIONS, rng=None, max_inputs=None):
+    """Pick coins paying value plus the fee at fee_rate (sat/byte) for a tx
+    of base_size bytes before inputs. unspent is a list, a UTXOPool or a
+    UTXOSet. At most max_inputs coins are picked, if given.
+
+    => (selected utxos, change); change is 0 for a changeless selection.
+    Raises ValueError if the coins can't cover it."""
+    pool = as_pool(unspent)
+    value = int(value)
+    input_fee = _fee(input_size, fee_rate)
+    change_fee = _fee(change_size, fee_rate)
+    target = value + _fee(base_size, fee_rate)
+    # coins that cost more to spend than they're worth are never used
+    lo = pool.bisect(input_fee + 1)
+
+    # changeless: any excess below the cost of a change output (or dust) goes to fees
+    tolerance = max(change_fee + input_fee, min_change + change_fee) - 1
+    hi = pool.bisect(target + tolerance + input_fee + 1)
+    available = pool.sum_range(lo, hi) - (hi - lo) * input_fee if hi > lo else 0
+    picked = _bnb(pool.values, hi, available, input_fee, target, tolerance, max_tries, max_inputs)
+    change = 0
+    if picked is None:
+        picked = _knapsack(pool, lo, input_fee, target + change_fee + min_change,
+                           rng or random, iterations)
+        if picked is None:
+            raise ValueError("Not enough funds")
+        if max_inputs is not None and len(picked) > max_inputs:
+            picked = _largest_first(pool.values, lo, input_fee, target + change_fee + min_change,
+                                    max_inputs)
+            if picked is None:
+                raise ValueError("Not enough funds in %d inputs" % max_inputs)
+        total = sum(pool.values[i] for i in picked)
+        size = base_size + len(picked) * input_size + change_size
+        change = total - value - _fee(size, fee_rate)
+    utxos = pool.utxos
+    return [utxos[i] for i in sorted(picked)], change
@@ -100,7 +100,9 @@ def sign_coinvault_tx(tx, priv):
 
 # Inspects a transaction
 def inspect(tx, **kwargs):
-    d = deserialize(tx)
+    if hasattr(tx, 'to_tx'):
+        tx = tx.to_tx()
+    d = tx.to_dict() if hasattr(tx, 'to_dict') else deserialize(tx)
     isum = 0
     ins = {}
     for _in in d['ins']:
@@ -133,20 +135,24 @@ def merkle_prove(txhash):
 
 def tx_size(txobj, unit="bytes"):
     """Get Tx size in bytes"""
-    if isinstance(txobj, dict):
-        return tx_size(serialize(txobj))
     assert unit in ("bytes", "kilobytes")
+    if hasattr(txobj, 'bin_txid'):      # Tx / TxView
+        size = txobj.size
+    elif isinstance(txobj, dict):
+        size = TxSize.from_txobj(txobj, spend=(0, 0)).size
+    else:
+        size = len(txobj) // 2 if RE_HEX_CHARS.match(txobj) else len(txobj)
     if unit=='bytes':
-        return len(txobj)
+        return size
     elif unit=='kilobytes':
-        return len(txobj) / 1024.0
+        return size / 1024.0
 
 def realtime_tx_fee(txobj, priority='medium'):
     """Get realtime Tx Fee (in Satoshis) for txobj"""
     assert priority in ('low', 'medium', 'high')
-    if isinstance(txobj, dict):
-        return realtime_tx_fee(serialize(txobj), priority)
-    tx_size_kbytes = tx_size(txobj, unit='kilobytes')
+    if not isinstance(txobj, dict):
+        txobj = deserialize(txobj)
+    tx_size_kbytes = TxSize.from_txobj(txobj).vsize / 1024.0
     tx_fee_api = get_fee_estimate(priority)
     return int(tx_size_kbytes * tx_fee_api)
 
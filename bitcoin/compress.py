@@ -0,0 +1,406 @@
+#!/usr/bin/python
+import binascii
+import struct
+
+from bitcoin.main import decompress
+from bitcoin.pyspecials import safe_hexlify, safe_unhexlify, as_buffer
+from bitcoin.transaction import (bin_deserialize, serialize_fields, parse_der_sig,
+                                 bin_der_encode_sig, _is_hex)
+
+# Compact transaction / UTXO encoding
+#
+# Along the lines of Bitcoin Core's chainstate format: integers are Core
+# VARINTs (base 128, MSB first, no redundant encodings), amounts go through
+# CompressAmount and scriptPubKeys through CompressScript (so compressed
+# outputs are byte compatible with Core's). On top of that, standard
+# scriptSigs / witnesses are template coded: a DER signature that is
+# strictly encoded is stored as r || s || hashcode and uncompressed pubkeys
+# as 33 bytes. Anything that wouldn't re-encode to the same bytes is stored
+# raw, so decompressing always reproduces serialize() output exactly.
+#
+# Files are b'PBCZ', a format version, a kind byte ('t' transactions,
+# 'u' utxos), then VARINT length prefixed records.
+
+FILE_MAGIC = b'PBCZ'
+FILE_VERSION = 1
+KIND_TX = b't'
+KIND_UTXO = b'u'
+
+_SPECIAL_SCRIPTS = 6
+_SPECIAL_SCRIPTSIGS = 4     # p2pkh (compressed key), p2pkh (uncompressed), p2pk, p2sh-p2wpkh
+_SPECIAL_WITNESSES = 2      # empty, p2wpkh
+
+_u8 = struct.Struct('<B').unpack_from
+
+
+# Integers
+
+def write_varint(n):
+    """Int => Core VARINT bytes"""
+    out = bytearray()
+    while True:
+        out.append((n & 0x7f) | (0x80 if out else 0))
+        if n <= 0x7f:
+            break
+        n = (n >> 7) - 1
+    out.reverse()
+    return bytes(out)
+
+
+def read_varint(buf, pos=0):
+    """Core VARINT at buf[pos:] => (int, new pos)"""
+    n = 0
+    while True:
+        b = _u8(buf, pos)[0]
+        pos += 1
+        n = (n << 7) | (b & 0x7f)
+        if not b & 0x80:
+            return n, pos
+        n += 1
+
+
+def compress_amount(n):
+    """Satoshis => small int; round amounts (trailing decimal zeros) shrink most"""
+    if n == 0:
+        return 0
+    e = 0
+    while n % 10 == 0 and e < 9:
+        n //= 10
+        e += 1
+    if e < 9:
+        d = n % 10
+        n //= 10
+        return 1 + (n * 9 + d - 1) * 10 + e
+    return 1 + (n - 1) * 10 + 9
+
+
+def decompress_amount(x):
+    if x == 0:
+        return 0
+    x -= 1
+    e = x % 10
+    x //= 10
+    if e < 9:
+        d = x % 9 + 1
+        x //= 9
+        n = x * 10 + d
+    else:
+        n = x + 1
+    return n * 10 ** e
+
+
+# Keys & signatures
+
+def _compact_pubkey(pub):
+    """65 byte pubkey => 33 byte compressed form if it decompresses back, else None"""
+    if len(pub) != 65 or pub[:1] != b'\x04':
+        return None
+    short = bytes(bytearray([2 + (bytearray(pub[64:65])[0] & 1)])) + pub[1:33]
+    try:
+        return short if decompress(short) == pub else None
+    except Exception:
+        return None
+
+
+def _compact_sig(sig):
+    """Strict DER sig + hashcode => r || s || hashcode (65 bytes), or None
+    if the sig wouldn't re-encode to the same bytes"""
+    try:
+        r, s, hashcode = parse_der_sig(sig)
+    except (ValueError, struct.error):
+        return None
+    if hashcode is None or bin_der_encode_sig(r, s, hashcode) != sig:
+        return None
+    return binascii.unhexlify('%064x%064x%02x' % (r, s, hashcode))
+
+
+def _expand_sig(buf, pos):
+    data = buf[pos:pos+65].tobytes()
+    r, s = int(binascii.hexlify(data[:32]), 16), int(binascii.hexlify(data[32:64]), 16)
+    return bin_der_encode_sig(r, s, bytearray(data[64:65])[0]), pos + 65
+
+
+def _push(data):
+    n = len(data)
+    if n < 0x4c:
+        return bytes(bytearray([n])) + data
+    return b'\x4c' + bytes(bytearray([n])) + data     # template pushes are < 256 bytes
+
+
+def _pushes(script, count):
+    """The count data pushes making up script, or None if it's anything else"""
+    out, pos, n = [], 0, len(script)
+    for _ in range(count):
+        if pos >= n:
+            return None
+        op = bytearray(script[pos:pos+1])[0]
+        if 0 < op < 0x4c:
+            size, pos = op, pos + 1
+        elif op == 0x4c and pos + 1 < n and bytearray(script[pos+1:pos+2])[0] >= 0x4c:
+            size, pos = bytearray(script[pos+1:pos+2])[0], pos + 2
+        else:
+            return None
+        out.append(script[pos:pos+size])
+        pos += size
+    return out if pos == n else None
+
+
+# Scripts
+
+def compress_script(script):
+    """Binary scriptPubKey => Core CompressScript bytes"""
+    n = len(script)
+    if n == 25 and script[:3] == b'\x76\xa9\x14' and script[23:] == b'\x88\xac':
+        return b'\x00' + script[3:23]
+    if n == 23 and script[:2] == b'\xa9\x14' and script[22:] == b'\x87':
+        return b'\x01' + script[2:22]
+    if n == 35 and script[:1] == b'\x21' and script[1:2] in (b'\x02', b'\x03') and \
+            script[34:] == b'\xac':
+        return script[1:34]
+    if n == 67 and script[:1] == b'\x41' and script[66:] == b'\xac':
+        short = _compact_pubkey(script[1:66])
+        if short is not None:
+            return bytes(bytearray([bytearray(short[:1])[0] + 2])) + short[1:]
+    return write_varint(n + _SPECIAL_SCRIPTS) + script
+
+
+def decompress_script(buf, pos=0):
+    """CompressScript bytes at buf[pos:] => (binary scriptPubKey, new pos)"""
+    buf = buf if isinstance(buf, memoryview) else memoryview(buf)
+    kind, pos = read_varint(buf, pos)
+    if kind == 0:
+        return b'\x76\xa9\x14' + buf[pos:pos+20].tobytes() + b'\x88\xac', pos + 20
+    elif kind == 1:
+        return b'\xa9\x14' + buf[pos:pos+20].tobytes() + b'\x87', pos + 20
+    elif kind in (2, 3):
+        return b'\x21' + bytes(bytearray([kind])) + buf[pos:pos+32].tobytes() + b'\xac', pos + 32
+    elif kind in (4, 5):
+        pub = decompress(bytes(bytearray([kind - 2])) + buf[pos:pos+32].tobytes())
+        return b'\x41' + pub + b'\xac', pos + 32
+    n = kind - _SPECIAL_SCRIPTS
+    if pos + n > len(buf):
+        raise ValueError("Truncated compressed script")
+    return buf[pos:pos+n].tobytes(), pos + n
+
+
+def _compress_scriptsig(script):
+    items = _pushes(script, 2)
+    if items is not None:
+        sig, pub = _compact_sig(items[0]), items[1]
+        if sig is not None and len(pub) == 33 and pub[:1] in (b'\x02', b'\x03'):
+            return b'\x00' + sig + pub
+        short = _compact_pubkey(pub)
+        if sig is not None and short is not None:
+            return b'\x01' + sig + short
+    items = _pushes(script, 1)
+    if items is not None:
+        if len(items[0]) == 22 and items[0][:2] == b'\x00\x14':
+            return b'\x03' + items[0][2:]
+        sig = _compact_sig(items[0])
+        if sig is not None:
+            return b'\x02' + sig
+    return write_varint(len(script) + _SPECIAL_SCRIPTSIGS) + script
+
+
+def _decompress_scriptsig(buf, pos):
+    kind, pos = read_varint(buf, pos)
+    if kind < 3:
+        sig, pos = _expand_sig(buf, pos)
+        if kind == 2:
+            return _push(sig), pos
+        pub = buf[pos:pos+33].tobytes()
+        return _push(sig) + _push(pub if kind == 0 else decompress(pub)), pos + 33
+    elif kind == 3:
+        return b'\x16\x00\x14' + buf[pos:pos+20].tobytes(), pos + 20
+    n = kind - _SPECIAL_SCRIPTSIGS
+    return buf[pos:pos+n].tobytes(), pos + n
+
+
+def _compress_witness(items):
+    if not items:
+        return b'\x00'
+    if len(items) == 2 and len(items[1]) == 33 and items[1][:1] in (b'\x02', b'\x03'):
+        sig = _compact_sig(items[0])
+        if sig is not None:
+            return b'\x01' + sig + items[1]
+    return write_varint(len(items) + _SPECIAL_WITNESSES) + b''.join(
+        write_varint(len(item)) + item for item in items)
+
+
+def _decompress_witness(buf, pos):
+    kind, pos = read_varint(buf, pos)
+    if kind == 0:
+        return [], pos
+    elif kind == 1:
+        sig, pos = _expand_sig(buf, pos)
+        return [sig, buf[pos:pos+33].tobytes()], pos + 33
+    items = []
+    for _ in range(kind - _SPECIAL_WITNESSES):
+        n, pos = read_varint(buf, pos)
+        items.append(buf[pos:pos+n].tobytes())
+        pos += n
+    return items, pos
+
+
+# Transactions
+
+def compress_tx(tx):
+    """Binary (or hex) serialized tx => compact bytes"""
+    if _is_hex(tx):
+        tx = safe_unhexlify(tx)
+    txobj = bin_deserialize(tx)
+    ins, outs = txobj["ins"], txobj["outs"]
+    witness = any(inp.get("witness") for inp in ins)
+    o = [write_varint(txobj["version"]), write_varint(len(ins) * 2 + witness)]
+    for inp in ins:
+        o.append(inp["outpoint"]["hash"][::-1])
+        o.append(write_varint(inp["outpoint"]["index"]))
+        o.append(_compress_scriptsig(inp["script"]))
+        o.append(write_varint(0xffffffff - inp["sequence"]))
+    o.append(write_varint(len(outs)))
+    for out in outs:
+        o.append(write_varint(compress_amount(out["value"])))
+        o.append(compress_script(out["script"]))
+    if witness:
+        o.extend(_compress_witness(inp.get("witness")) for inp in ins)
+    o.append(write_varint(txobj["locktime"]))
+    return b''.join(o)
+
+
+def decompress_tx(data, pos=0):
+    """Compact tx at data[pos:] => (serialized tx, new pos)"""
+    buf = data if isinstance(data, memoryview) else memoryview(data)
+    try:
+        version, pos = read_varint(buf, pos)
+        n, pos = read_varint(buf, pos)
+        n, witness = n >> 1, n & 1
+        ins = []
+        for _ in range(n):
+            h = buf[pos:pos+32].tobytes()
+            index, pos = read_varint(buf, pos + 32)
+            script, pos = _decompress_scriptsig(buf, pos)
+            sequence, pos = read_varint(buf, pos)
+            ins.append((h, index, script, 0xffffffff - sequence))
+        n, pos = read_varint(buf, pos)
+        outs = []
+        for _ in range(n):
+            amount, pos = read_varint(buf, pos)
+            script, pos = decompress_script(buf, pos)
+            outs.append((decompress_amount(amount), script))
+        witnesses = None
+        if witness:
+            witnesses = []
+            for _ in ins:
+                items, pos = _decompress_witness(buf, pos)
+                witnesses.append(items)
+        locktime, pos = read_varint(buf, pos)
+    except struct.error:
+        raise ValueError("Truncated compressed transaction")
+    return serialize_fields(version, ins, outs, locktime, witnesses), pos
+
+
+# UTXOs
+
+def compress_utxo(utxo):
+    """{"output": "txid:n", "value": v, "script": hex or binary scriptPubKey
+    [, "height": h, "coinbase": bool]} => compact bytes"""
+    txid, index = utxo["output"].split(':')
+    script = utxo.get("script", b'')
+    if _is_hex(script):
+        script = safe_unhexlify(script)
+    return b''.join([
+        binascii.unhexlify(txid)[::-1], write_varint(int(index)),
+        write_varint(utxo.get("height", 0) * 2 + bool(utxo.get("coinbase"))),
+        write_varint(compress_amount(utxo["value"])), compress_script(script)])
+
+
+def decompress_utxo(data, pos=0):
+    """Compact utxo at data[pos:] => (utxo dict with hex script, new pos)"""
+    buf = data if isinstance(data, memoryview) else memoryview(data)
+    try:
+        txid = safe_hexlify(buf[pos:pos+32].tobytes()[::-1])
+        index, pos = read_varint(buf, pos + 32)
+        code, pos = read_varint(buf, pos)
+        amount, pos = read_varint(buf, pos)
+        script, pos = decompress_script(buf, pos)
+    except struct.error:
+        raise ValueError("Truncated compressed utxo")
+    return {"output": "%s:%d" % (txid, index), "value": decompress_amount(amount),
+            "script": safe_hexlify(script), "height": code >> 1, "coinbase": bool(code & 1)}, pos
+
+
+# Files
+
+class CompressedWriter(object):
+    """Writes a compressed stream of txs (kind KIND_TX) or utxos (KIND_UTXO)
+    to file object f"""
+    __slots__ = ('_f', '_encode', 'kind', 'count')
+
+    def __init__(self, f, kind=KIND_TX):
+        if kind not in (KIND_TX, KIND_UTXO):
+            raise ValueError("Unknown stream kind %r" % kind)
+        self._f, self.kind, self.count = f, kind, 0
+        self._encode = compress_tx if kind == KIND_TX else compress_utxo
+        f.write(FILE_MAGIC + write_varint(FILE_VERSION) + kind)
+
+    def write(self, item):
+        record = self._encode(item)
+        self._f.write(write_varint(len(record)) + record)
+        self.count += 1
+
+    def write_all(self, items):
+        for item in items:
+            self.write(item)
+
+
+def _record_end(buf, pos):
+    """End of the record at buf[pos:] (VARINT length + data), None if incomplete"""
+    try:
+        n, start = read_varint(buf, pos)
+    except struct.error:
+        return None
+    return start, start + n if start + n <= len(buf) else None
+
+
+def iter_compressed(source, chunk_size=1 << 16):
+    """Yield the serialized txs (or utxo dicts) from a compressed stream;
+    source is bytes / mmap / memoryview, decoded in place, or a file-like
+    object, which is read chunk_size bytes at a time"""
+    # mmap has read() too, but is decoded in place like any buffer
+    buf, read = as_buffer(source), None
+    if buf is not None:
+        head = buf[:16].tobytes()
+    else:
+        read = getattr(source, 'read', None)
+        if read is None:
+            raise TypeError("Expected a buffer or a file-like object, got %r" % type(source))
+        buf = bytearray(read(max(chunk_size, 16)))
+        head = bytes(buf[:16])
+    if head[:4] != FILE_MAGIC:
+        raise ValueError("Not a compressed stream")
+    version, pos = read_varint(head, 4)
+    if version != FILE_VERSION:
+        raise ValueError("Unsupported compressed stream version %d" % version)
+    kind = head[pos:pos+1]
+    if kind == KIND_TX:
+        decode = decompress_tx
+    elif kind == KIND_UTXO:
+        decode = decompress_utxo
+    else:
+        raise ValueError("Unknown record kind %r" % kind)
+    pos += 1
+    while True:
+        span = _record_end(buf, pos)
+        if span is None or span[1] is None:
+            chunk = read(chunk_size) if read is not None else None
+            if not chunk:
+                if pos < len(buf):
+                    raise ValueError("Truncated compressed stream")
+                return
+            del buf[:pos]
+            buf.extend(chunk)
+            pos = 0
+            continue
+        start, pos = span
+        # a view is decoded as is; a stream's buffer is reused, so copy out
+        yield decode(buf[start:pos] if read is None else bytes(buf[start:pos]))[0]
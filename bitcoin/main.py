@@ -3,11 +3,14 @@ from bitcoin.pyspecials import *
 import binascii
 import hashlib
 import re
+import struct
 import base64
 import time
 import random
 import hmac
 from bitcoin.ripemd import *
+from bitcoin.base58 import b58check_decode
+from bitcoin.sigcache import get_sigcache, sigcache_key
 
 is_python2 = str == bytes
 
@@ -468,17 +471,21 @@ def slowsha(string):
 
 
 def hash_to_int(x):
-    if re.match('^[0-9a-fA-F]*$', x) and len(x) in [40, 64]:
+    if len(x) in [40, 64] and re.match('^[0-9a-fA-F]*$', st(x)):
         return decode(x, 16)
     return decode(x, 256)
 
 
+_pack_u8, _pack_u16 = struct.Struct('<B').pack, struct.Struct('<H').pack
+_pack_u32, _pack_u64 = struct.Struct('<I').pack, struct.Struct('<Q').pack
+
+
 def num_to_var_int(x):
     x = int(x)
-    if x < 253:       return from_int_to_byte(x)
-    elif x < 2**16:   return from_int_to_byte(253) + encode(x, 256, 2)[::-1]
-    elif x < 2**32:   return from_int_to_byte(254) + encode(x, 256, 4)[::-1]
-    elif x < 2**64:   return from_int_to_byte(255) + encode(x, 256, 8)[::-1]
+    if x < 253:       return _pack_u8(x)
+    elif x < 2**16:   return b'\xfd' + _pack_u16(x)
+    elif x < 2**32:   return b'\xfe' + _pack_u32(x)
+    elif x < 2**64:   return b'\xff' + _pack_u64(x)
     else:             raise ValueError(x < 2**64)
 
 
@@ -546,15 +553,11 @@ def random_mini_key():
 
 # Encodings
 def b58check_to_bin(inp):
-    data = changebase(inp, 58, 256)
-    assert bin_dbl_sha256(data[:-4])[:4] == data[-4:]
-    return data[1:-4]
+    return b58check_decode(inp)[1]
 
 
 def get_version_byte(inp):
-    data = changebase(inp, 58, 256)
-    assert bin_dbl_sha256(data[:-4])[:4] == data[-4:]
-    return ord(data[0])
+    return b58check_decode(inp)[0]
 
 
 def hex_to_b58check(inp, magicbyte=0):
@@ -649,8 +652,62 @@ def ecdsa_raw_verify(msghash, vrs, pub):
 
     u1, u2 = z*w % N, r*w % N
     pub = decode_pubkey(pub)
+    cache = get_sigcache()
+    if cache is not None:
+        key = sigcache_key(z, r, s, pub)
+        if cache.lookup(key):
+            return True
     x, y = fast_add(fast_multiply(G, u1), fast_multiply(pub, u2))
-    return bool(r == x and ((r % N) != 0 and (s % N) != 0))
+    ok = bool(r == x and ((r % N) != 0 and (s % N) != 0))
+    if ok and cache is not None:
+        cache.add(key)
+    return ok
+
+
+def ecdsa_raw_verify_batch(items):
+    """[(msghash, (v,r,s), pub), ...] => [bool, ...]
+
+    Same result as ecdsa_raw_verify per item, but all s values share one
+    modular inversion (Montgomery's trick), each distinct pubkey is decoded
+    once and R is compared in Jacobian coordinates, so no field inversion is
+    done per signature."""
+    items = list(items)
+    results = [False] * len(items)
+    todo = [k for k, (_, (v, r, s), _) in enumerate(items)
+            if (r % N) != 0 and (s % N) != 0 and r < P]
+    if not todo:
+        return results
+
+    # batch inverse of every s
+    prefix, acc = [], 1
+    for k in todo:
+        prefix.append(acc)
+        acc = acc * items[k][1][2] % N
+    acc_inv = inv(acc, N)
+    ws = [0] * len(todo)
+    for j in range(len(todo) - 1, -1, -1):
+        s = items[todo[j]][1][2]
+        ws[j] = acc_inv * prefix[j] % N
+        acc_inv = acc_inv * s % N
+
+    gj, points, cache = to_jacobian(G), {}, get_sigcache()
+    for k, w in zip(todo, ws):
+        msghash, (v, r, s), pub = items[k]
+        key = pub if not isinstance(pub, list) else tuple(pub)
+        if key not in points:
+            points[key] = decode_pubkey(pub)
+        z = hash_to_int(msghash)
+        if cache is not None:
+            ckey = sigcache_key(z, r, s, points[key])
+            if cache.lookup(ckey):
+                results[k] = True
+                continue
+        x, y, zz = jacobian_add(jacobian_multiply(gj, z * w % N),
+                                jacobian_multiply(to_jacobian(points[key]), r * w % N))
+        results[k] = zz % P != 0 and x == (r * zz * zz) % P
+        if results[k] and cache is not None:
+            cache.add(ckey)
+    return results
 
 
 # For BitcoinCore
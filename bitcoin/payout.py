@@ -0,0 +1,141 @@
+#!/usr/bin/python
+import binascii
+
+from bitcoin.base58 import ADDRESS_LEN, b58check_decode_list
+from bitcoin.pyspecials import safe_hexlify, safe_unhexlify, string_types, RE_HEX_CHARS
+from bitcoin.coinselect import as_pool, select_coins
+from bitcoin.transaction import (TxSize, spend_size, serialize_fields, var_int_size,
+                                 SCRIPT_P2PKH, MAX_STANDARD_TX_WEIGHT)
+
+# Payout builder
+#
+# For runs paying tens of thousands of recipients: addresses are decoded in
+# bulk (each distinct address once, remembered across runs), repeated
+# recipients are merged, and the outputs are split over as many transactions
+# as it takes to keep each one under the standard weight limit. Every tx is
+# funded from a UTXOPool (or a UTXOSet) at a fee rate and written with serialize_fields,
+# i.e. into one preallocated buffer.
+
+MIN_OUTPUT_VALUE = 546          # smallest non-dust P2PKH output at the default relay fee
+
+_SCRIPT_CACHE = {}
+_SCRIPT_CACHE_MAX = 100000
+_P2PKH_VBYTES = (0, 111)        # mainnet, testnet
+_P2SH_VBYTES = (5, 196)
+
+
+def addresses_to_scripts(addrs):
+    """[address, ...] => [binary scriptPubKey, ...]; each distinct address is
+    base58check decoded once and the script cached. Raises ValueError for a
+    version byte other than bitcoin (main or testnet) P2PKH / P2SH."""
+    cache = _SCRIPT_CACHE
+    missing = list(set(a for a in addrs if a not in cache))
+    if missing:
+        if len(cache) + len(missing) > _SCRIPT_CACHE_MAX:
+            cache.clear()
+        for addr, (vbyte, h160) in zip(missing, b58check_decode_list(missing, ADDRESS_LEN)):
+            if vbyte in _P2PKH_VBYTES:
+                cache[addr] = b'\x76\xa9\x14' + h160 + b'\x88\xac'
+            elif vbyte in _P2SH_VBYTES:
+                cache[addr] = b'\xa9\x14' + h160 + b'\x87'
+            else:
+                raise ValueError("Unknown address version %d: %s" % (vbyte, addr))
+    return [cache[a] for a in addrs]
+
+
+def merge_payouts(payouts):
+    """["addr:value" | (addr or hex script, value), ...] => [(binary script,
+    value), ...] with repeated recipients summed, in first seen order"""
+    targets, values = [], []
+    for p in payouts:
+        if isinstance(p, string_types):
+            sep = p.find(':')
+            p = (p[:sep], p[sep+1:])
+        targets.append(p[0])
+        values.append(int(p[1]))
+    addrs = [t for t in targets if not RE_HEX_CHARS.match(t)]
+    scripts = dict(zip(addrs, addresses_to_scripts(addrs)))
+    totals, order = {}, []
+    for t, v in zip(targets, values):
+        script = scripts[t] if t in scripts else safe_unhexlify(t)
+        if script not in totals:
+            totals[script] = 0
+            order.append(script)
+        totals[script] += v
+    return [(script, totals[script]) for script in order]
+
+
+def split_payouts(outs, max_weight=MAX_STANDARD_TX_WEIGHT, max_outputs=None,
+                  reserve=0):
+    """[(script, value), ...] => [[(script, value), ...], ...], each group
+    fitting a tx of at most max_weight with reserve vbytes to spare (for
+    inputs & change)"""
+    budget = max_weight // 4 - 10 - reserve     # 10: version, counts, locktime
+    groups, group, used = [], [], 0
+    for script, value in outs:
+        size = 8 + var_int_size(len(script)) + len(script)
+        if group and (used + size > budget or len(group) == max_outputs):
+            groups.append(group)
+            group, used = [], 0
+        if size > budget:
+            raise ValueError("Output script too large for max_weight")
+        group.append((script, value))
+        used += size
+    if group:
+        groups.append(group)
+    return groups
+
+
+def bin_mk_payout_txs(unspent, payouts, change, fee_rate, max_weight=MAX_STANDARD_TX_WEIGHT,
+                      max_outputs=None, max_inputs=50, spend_type=SCRIPT_P2PKH,
+                      min_value=MIN_OUTPUT_VALUE):
+    """Unsigned payout txs (binary) paying every recipient in payouts, funded
+    from unspent (a list, or a UTXOPool or UTXOSet, which is spent from in
+    place) at fee_rate sat/vbyte with change to address change. Each tx has
+    at most max_inputs spend_type inputs. If a tx can't be funded, coins
+    already taken from the pool are put back before the ValueError is
+    raised."""
+    outs = merge_payouts(payouts)
+    for script, value in outs:
+        if value < min_value:
+            raise ValueError("Payout of %d to %s is dust" % (value, safe_hexlify(script)))
+    pool = as_pool(unspent)
+    change_script = addresses_to_scripts([change])[0]
+    change_size = 8 + var_int_size(len(change_script)) + len(change_script)
+    scriptsig, witness = spend_size(spend_type)
+    input_size = 40 + var_int_size(scriptsig) + scriptsig + (witness + 3) // 4
+    # + input count growth & segwit marker
+    slack = 2 + (1 if witness else 0)
+
+    txs, taken = [], []
+    groups = split_payouts(outs, max_weight, max_outputs,
+                           reserve=max_inputs * input_size + change_size + slack)
+    try:
+        for group in groups:
+            sizer = TxSize()
+            for script, _ in group:
+                sizer.add_output(len(script))
+            selected, change_value = select_coins(pool, sum(v for _, v in group), fee_rate,
+                                                  base_size=sizer.vsize + slack,
+                                                  input_size=input_size, change_size=change_size,
+                                                  max_inputs=max_inputs)
+            taken += [pool.remove(u["output"]) for u in selected]
+            ins = []
+            for u in selected:
+                h, index = u["output"].split(':')
+                ins.append((binascii.unhexlify(h)[::-1], int(index), b'', 0xffffffff))
+            outs = [(value, script) for script, value in group]
+            if change_value:
+                outs.append((change_value, change_script))
+            txs.append(serialize_fields(1, ins, outs, 0))
+    except Exception:
+        # all or nothing: the pool is left as it was
+        for u in taken:
+            pool.add_utxo(u)
+        raise
+    return txs
+
+
+def mk_payout_txs(*args, **kwargs):
+    """Hex version of bin_mk_payout_txs"""
+    return [safe_hexlify(tx) for tx in bin_mk_payout_txs(*args, **kwargs)]
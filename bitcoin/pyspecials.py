@@ -5,6 +5,9 @@ import os
 import hashlib
 import struct
 
+from bitcoin.base58 import b58encode, b58decode, b58check_encode, \
+                           b58encode_int, b58decode_int
+
 
 is_python2 = (str == bytes)
 is_ios = "Pythonista" in os.environ.get("XPC_SERVICE_NAME", "")		# for Pythonista iOS
@@ -38,6 +41,7 @@ if is_python2:
 
     string_types = (str, unicode)
     string_or_bytes_types = (str, unicode)
+    bytes_types = (str, bytearray, memoryview)
     int_types = (int, float, long)
 
     # Base switching
@@ -146,27 +150,23 @@ if is_python2:
     def changebase(string, frm, to, minlen=0):
         if frm == to:
             return lpad(string, get_code_string(frm)[0], minlen)
-        elif frm in (16, 256) and to == 58:
-            if frm == 16:
-                nblen = len(re.match('^(00)*', string).group(0))//2
-            else:
-                nblen = len(re.match('^(\x00)*', string).group(0))
+        elif frm == 256 and to == 58:
+            return b58encode(string)
+        elif frm == 58 and to == 256:
+            return b58decode(string)
+        elif frm == 16 and to == 58:
+            nblen = len(re.match('^(00)*', string).group(0))//2
             padding = lpad('', '1', nblen)
             return padding + encode(decode(string, frm), 58)
-        elif frm == 58 and to in (16, 256):
+        elif frm == 58 and to == 16:
             nblen = len(re.match('^(1)*', string).group(0))
-            if to == 16:
-                padding = lpad('', '00', nblen)
-            else:
-                padding = lpad('', '\0', nblen)
+            padding = lpad('', '00', nblen)
             return padding + encode(decode(string, 58), to)
         return encode(decode(string, frm), to, minlen)
 
 
     def bin_to_b58check(inp, magicbyte=0):
-        inp_fmtd = from_int_to_byte(int(magicbyte)) + inp
-        checksum = bin_dbl_sha256(inp_fmtd)[:4]
-        return changebase(inp_fmtd + checksum, 256, 58)
+        return b58check_encode(inp, magicbyte)
 
 
     def safe_hexlify(b):
@@ -246,19 +246,34 @@ if is_python2:
 	
     def encode(val, base, minlen=0):
         base, minlen = int(base), int(minlen)
-        code_string = get_code_string(base)
-        result = ""
-        while val > 0:
-            result = code_string[val % base] + result
-            val //= base
-        return code_string[0] * max(minlen - len(result), 0) + result
+        if base == 256:
+            if val > 0:
+                h = '%x' % val
+                result = binascii.unhexlify(h if not len(h) % 2 else '0' + h)
+            else:
+                result = ''
+        elif base == 16:
+            result = '%x' % val if val > 0 else ''
+        elif base == 58:
+            result = b58encode_int(val) if val > 0 else ''
+        else:
+            code_string = get_code_string(base)
+            result = ""
+            while val > 0:
+                result = code_string[val % base] + result
+                val //= base
+        return get_code_string(base)[0] * max(minlen - len(result), 0) + result
 
     def decode(string, base):
         base = int(base)
+        if base == 256:
+            return int(binascii.hexlify(string), 16) if string else 0
+        elif base == 16:
+            return int(string, 16) if string else 0
+        elif base == 58:
+            return b58decode_int(string)
         code_string = get_code_string(base)
         result = 0
-        if base == 16:
-            string = string.lower()
         while len(string) > 0:
             result *= base
             result += code_string.find(string[0])
@@ -268,6 +283,20 @@ if is_python2:
     def random_string(x):
         return os.urandom(x)
 
+    def as_buffer(obj):
+        """memoryview over obj if it exposes its memory (str, bytearray,
+        mmap, memoryview), else None; mmap only has the old style buffer"""
+        if isinstance(obj, memoryview):
+            return obj
+        try:
+            return memoryview(obj)
+        except TypeError:
+            pass
+        try:
+            return memoryview(buffer(obj))
+        except TypeError:
+            return None
+
 
 #   PYTHON 3
 elif sys.version_info.major > 2:
@@ -275,6 +304,7 @@ elif sys.version_info.major > 2:
     xrange = range
     string_types = str
     string_or_bytes_types = (str, bytes)
+    bytes_types = (bytes, bytearray, memoryview)
     int_types = (int, float)
 
     st = lambda s: str(s, 'utf-8') if not isinstance(s, str) else s
@@ -313,7 +343,7 @@ elif sys.version_info.major > 2:
             return True
 
     def json_changebase(obj, changer):
-        if isinstance(obj, string_types):
+        if isinstance(obj, string_or_bytes_types):
             return changer(obj)
         elif isinstance(obj, int_types) or obj is None:
             return obj
@@ -322,7 +352,7 @@ elif sys.version_info.major > 2:
         return dict((x, json_changebase(obj[x], changer)) for x in obj)
 
     def json_hexlify(obj):
-        return json_changebase(obj, lambda x: binascii.hexlify(x))
+        return json_changebase(obj, lambda x: st(binascii.hexlify(x)))
 
     def json_unhexlify(obj):
         return json_changebase(obj, lambda x: binascii.unhexlify(x))
@@ -346,30 +376,27 @@ elif sys.version_info.major > 2:
         string = by(string)
         if frm == to:
             return lpad(string, by(get_code_string(frm)[0]), minlen)
-        elif frm in (16, 256) and to == 58:
-            nblen = len(re.match(b'^(00)*', string).group(0))//2 if frm == 16 else \
-                    len(re.match(b'^(\0)*', string).group(0))
+        elif frm == 256 and to == 58:
+            return b58encode(string)
+        elif frm == 58 and to == 256:
+            return b58decode(string)
+        elif frm == 16 and to == 58:
+            nblen = len(re.match(b'^(00)*', string).group(0))//2
             return lpad('', '1', nblen) + encode(decode(string, frm), 58)
-        elif frm == 58 and to in (16, 256):
+        elif frm == 58 and to == 16:
             nblen = len(re.match(b'^(1)*', string).group(0))
-            padding = lpad(b'', b'00', nblen) if to == 16 else \
-                      lpad(b'', b'\0', nblen)
+            padding = lpad(b'', b'00', nblen)
             return padding + encode(decode(string, 58), to)
         return encode(decode(string, frm), to, minlen)
 
     def bin_to_b58check(inp, magicbyte=0):
-        inp_fmtd = from_int_to_byte(int(magicbyte)) + inp
-        checksum = bin_dbl_sha256(inp_fmtd)[:4]
-        leadingzbytes = 0
-        for x in inp_fmtd:
-            if x != 0:
-                break
-            leadingzbytes += 1
-        return '1' * leadingzbytes + changebase(inp_fmtd+checksum, 256, 58)
+        return b58check_encode(inp, magicbyte)
 
     def safe_hexlify(b):
-        if isinstance(b, string_or_bytes_types):
-            return st(binascii.hexlify(b))
+        if isinstance(b, bytes_types):
+            return b.hex()
+        elif isinstance(b, str):
+            return by(b).hex()
         elif isinstance(b, dict):
             return json_hexlify(b)
         elif isinstance(b, int_types) or (b is None):
@@ -378,7 +405,9 @@ elif sys.version_info.major > 2:
             return [hexlify(x) for x in b]
 
     def safe_unhexlify(s):
-        if isinstance(s, string_or_bytes_types):
+        if isinstance(s, str):
+            return bytes.fromhex(s)
+        elif isinstance(s, bytes_types):
             return binascii.unhexlify(s)
         elif isinstance(s, dict):
             return json_unhexlify(s)
@@ -400,11 +429,13 @@ elif sys.version_info.major > 2:
     def from_int_to_bytes(v, length=1, byteorder='little'):
         return int.to_bytes(v, length, byteorder)
 
+    _BYTES = [bytes((i,)) for i in range(256)]
+
     def from_int_to_byte(a):
-        return bytes([a])
+        return _BYTES[a]
 
     def from_byte_to_int(a):
-        return a
+        return a if isinstance(a, int) else a[0]
 
     def from_le_bytes_to_int(bstr):
         return from_bytes_to_int(bstr, byteorder='little', signed=False)
@@ -413,7 +444,7 @@ elif sys.version_info.major > 2:
         return int.from_bytes(bstr, byteorder=byteorder, signed=signed)
 
     def from_str_to_bytes(a):
-        return by(a)
+        return a.encode('utf-8') if isinstance(a, str) else a
 
     def from_bytes_to_str(a):
         return st(a)
@@ -427,8 +458,7 @@ elif sys.version_info.major > 2:
         t = by(hexstr)
         return t[0:4]+"..."+t[-4:]
 
-    def encode(val, base, minlen=0):
-        base, minlen = int(base), int(minlen)
+    def _encode_generic(val, base, minlen):
         code_string = get_code_string(base)
         result_bytes = bytearray()
         while val > 0:
@@ -447,20 +477,10 @@ elif sys.version_info.major > 2:
 
         return result
 
-    def decode(string, base):
-        if base == 256 and isinstance(string, str):
-            string = bytes.fromhex(string)
-        base = int(base)
+    def _decode_generic(string, base):
         code_string = get_code_string(base)
-        if base == 256:
-            def extract(d, cs):
-                return d
-        else:
-            def extract(d, cs):
-                return cs.find(d if isinstance(d, str) else chr(d))
-
-        if base == 16:
-            string = string.lower()
+        def extract(d, cs):
+            return cs.find(d if isinstance(d, str) else chr(d))
         result = 0
         while len(string) > 0:
             result *= base
@@ -468,8 +488,68 @@ elif sys.version_info.major > 2:
             string = string[1:]
         return result
 
+    # Single C call conversions for the common bases; everything else
+    # falls back to the digit-by-digit codec above
+    def _encode_256(val, minlen):
+        if val <= 0:
+            return b'\x00' * minlen
+        return val.to_bytes(max((val.bit_length() + 7) // 8, minlen), 'big')
+
+    def _encode_16(val, minlen):
+        return ('%x' % val if val > 0 else '').rjust(minlen, '0')
+
+    def _encode_10(val, minlen):
+        return (str(val) if val > 0 else '').rjust(minlen, '0')
+
+    def _encode_2(val, minlen):
+        return ('{0:b}'.format(val) if val > 0 else '').rjust(minlen, '0')
+
+    def _encode_58(val, minlen):
+        return (b58encode_int(val) if val > 0 else '').rjust(minlen, '1')
+
+    def _decode_256(string):
+        if isinstance(string, str):
+            string = bytes.fromhex(string)
+        return int.from_bytes(string, 'big')
+
+    def _decode_16(string):
+        return int(string, 16) if string else 0
+
+    def _decode_10(string):
+        return int(string) if string else 0
+
+    def _decode_2(string):
+        return int(string, 2) if string else 0
+
+    _ENCODERS = {256: _encode_256, 16: _encode_16, 10: _encode_10, 2: _encode_2, 58: _encode_58}
+    _DECODERS = {256: _decode_256, 16: _decode_16, 10: _decode_10, 2: _decode_2, 58: b58decode_int}
+
+    def encode(val, base, minlen=0):
+        base, minlen = int(base), int(minlen)
+        encoder = _ENCODERS.get(base)
+        if encoder is None:
+            return _encode_generic(val, base, minlen)
+        return encoder(val, minlen)
+
+    def decode(string, base):
+        base = int(base)
+        decoder = _DECODERS.get(base)
+        if decoder is None:
+            return _decode_generic(string, base)
+        return decoder(string)
+
     def random_string(x):
         return str(os.urandom(x))
 
+    def as_buffer(obj):
+        """memoryview over obj if it exposes its memory (bytes, bytearray,
+        mmap, memoryview), else None"""
+        if isinstance(obj, memoryview):
+            return obj
+        try:
+            return memoryview(obj)
+        except TypeError:
+            return None
+
 else:
     raise ImportError("pyspecials import error!")
@@ -0,0 +1,605 @@
+#!/usr/bin/python
+import hashlib
+
+from bitcoin.main import bin_hash160, bin_ripemd160, bin_dbl_sha256, ecdsa_raw_verify
+from bitcoin.transaction import SighashCache, serialize_script_unit, _bin_der_decode_sig
+
+# Script interpreter
+#
+# Scripts are compiled once into a list of (opcode, push data, end offset)
+# tuples. Everything that fails a script regardless of which branch runs
+# (truncated or >520 byte pushes, disabled opcodes, VERIF/VERNOTIF, more
+# than 201 counted opcodes, >10000 bytes) is found at compile time, so the
+# evaluation loop only deals with executed semantics. Compiled scriptPubKeys
+# and redeem scripts are memoized, and P2PKH / P2SH multisig spends are
+# checked directly without running the stack machine.
+#
+# Consensus rules are those of legacy (pre-segwit) validation with P2SH.
+
+OP_0 = 0x00
+OP_PUSHDATA1 = 0x4c
+OP_PUSHDATA2 = 0x4d
+OP_PUSHDATA4 = 0x4e
+OP_1NEGATE = 0x4f
+OP_RESERVED = 0x50
+OP_1 = 0x51
+OP_16 = 0x60
+OP_NOP = 0x61
+OP_VER = 0x62
+OP_IF = 0x63
+OP_NOTIF = 0x64
+OP_VERIF = 0x65
+OP_VERNOTIF = 0x66
+OP_ELSE = 0x67
+OP_ENDIF = 0x68
+OP_VERIFY = 0x69
+OP_RETURN = 0x6a
+OP_TOALTSTACK = 0x6b
+OP_FROMALTSTACK = 0x6c
+OP_2DROP = 0x6d
+OP_2DUP = 0x6e
+OP_3DUP = 0x6f
+OP_2OVER = 0x70
+OP_2ROT = 0x71
+OP_2SWAP = 0x72
+OP_IFDUP = 0x73
+OP_DEPTH = 0x74
+OP_DROP = 0x75
+OP_DUP = 0x76
+OP_NIP = 0x77
+OP_OVER = 0x78
+OP_PICK = 0x79
+OP_ROLL = 0x7a
+OP_ROT = 0x7b
+OP_SWAP = 0x7c
+OP_TUCK = 0x7d
+OP_SIZE = 0x82
+OP_EQUAL = 0x87
+OP_EQUALVERIFY = 0x88
+OP_1ADD = 0x8b
+OP_1SUB = 0x8c
+OP_NEGATE = 0x8f
+OP_ABS = 0x90
+OP_NOT = 0x91
+OP_0NOTEQUAL = 0x92
+OP_ADD = 0x93
+OP_SUB = 0x94
+OP_BOOLAND = 0x9a
+OP_BOOLOR = 0x9b
+OP_NUMEQUAL = 0x9c
+OP_NUMEQUALVERIFY = 0x9d
+OP_NUMNOTEQUAL = 0x9e
+OP_LESSTHAN = 0x9f
+OP_GREATERTHAN = 0xa0
+OP_LESSTHANOREQUAL = 0xa1
+OP_GREATERTHANOREQUAL = 0xa2
+OP_MIN = 0xa3
+OP_MAX = 0xa4
+OP_WITHIN = 0xa5
+OP_RIPEMD160 = 0xa6
+OP_SHA1 = 0xa7
+OP_SHA256 = 0xa8
+OP_HASH160 = 0xa9
+OP_HASH256 = 0xaa
+OP_CODESEPARATOR = 0xab
+OP_CHECKSIG = 0xac
+OP_CHECKSIGVERIFY = 0xad
+OP_CHECKMULTISIG = 0xae
+OP_CHECKMULTISIGVERIFY = 0xaf
+OP_NOP1 = 0xb0
+OP_NOP10 = 0xb9
+
+DISABLED_OPCODES = frozenset([0x7e, 0x7f, 0x80, 0x81,       # CAT SUBSTR LEFT RIGHT
+                              0x83, 0x84, 0x85, 0x86,       # INVERT AND OR XOR
+                              0x8d, 0x8e,                   # 2MUL 2DIV
+                              0x95, 0x96, 0x97, 0x98, 0x99])    # MUL DIV MOD LSHIFT RSHIFT
+
+MAX_SCRIPT_SIZE = 10000
+MAX_PUSH_SIZE = 520
+MAX_OPS = 201
+MAX_STACK_SIZE = 1000
+MAX_PUBKEYS_PER_MULTISIG = 20
+
+_TRUE, _FALSE = b'\x01', b''
+
+
+class _ScriptFailure(Exception):
+    pass
+
+
+# Script numbers: little endian, sign bit in the top byte
+
+def decode_num(b, maxlen=4):
+    """Script number bytes => int; fails if longer than maxlen"""
+    if len(b) > maxlen:
+        raise _ScriptFailure("script number overflow")
+    if not b:
+        return 0
+    ba = bytearray(b)
+    n = 0
+    for c in reversed(ba):
+        n = (n << 8) | c
+    if ba[-1] & 0x80:
+        return -(n & ~(0x80 << (8 * (len(ba) - 1))))
+    return n
+
+
+def encode_num(n):
+    """int => minimal script number bytes"""
+    if n == 0:
+        return b''
+    neg, a = n < 0, abs(n)
+    out = bytearray()
+    while a:
+        out.append(a & 0xff)
+        a >>= 8
+    if out[-1] & 0x80:
+        out.append(0x80 if neg else 0)
+    elif neg:
+        out[-1] |= 0x80
+    return bytes(out)
+
+
+def cast_to_bool(b):
+    ba = bytearray(b)
+    for k, c in enumerate(ba):
+        if c:
+            return not (k == len(ba) - 1 and c == 0x80)
+    return False
+
+
+# Compilation
+
+class CompiledScript(object):
+    """Pre-tokenized script.
+
+    ops: [(opcode, push data or None, end offset), ...]
+    ok: False if the script fails whichever branches run
+    n_counted: opcodes counted towards the 201 limit
+    template: 'p2pkh', 'p2sh', 'multisig' or None, with template_data
+    (hash160, hash160, (m, [pubkeys]) respectively)"""
+    __slots__ = ('raw', 'ops', 'ok', 'n_counted', 'push_only', 'template', 'template_data')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.ops = ops = []
+        self.ok = len(raw) <= MAX_SCRIPT_SIZE
+        counted = 0
+        b = bytearray(raw)
+        pos, end = 0, len(b)
+        while pos < end:
+            op = b[pos]
+            pos += 1
+            data = None
+            if op <= OP_PUSHDATA4:
+                if op < OP_PUSHDATA1:
+                    size = op
+                elif op == OP_PUSHDATA1:
+                    size = b[pos] if pos < end else -1
+                    pos += 1
+                elif op == OP_PUSHDATA2:
+                    size = b[pos] | b[pos+1] << 8 if pos + 2 <= end else -1
+                    pos += 2
+                else:
+                    size = (b[pos] | b[pos+1] << 8 | b[pos+2] << 16 | b[pos+3] << 24
+                            if pos + 4 <= end else -1)
+                    pos += 4
+                if size < 0 or pos + size > end:
+                    self.ok = False
+                    break
+                data = raw[pos:pos+size]
+                pos += size
+                if size > MAX_PUSH_SIZE:
+                    self.ok = False
+            elif op > OP_16:
+                counted += 1
+                if op in DISABLED_OPCODES or op == OP_VERIF or op == OP_VERNOTIF:
+                    self.ok = False
+            ops.append((op, data, pos))
+        self.n_counted = counted
+        if counted > MAX_OPS:
+            self.ok = False
+        self.push_only = self.ok and all(op <= OP_16 for op, _, _ in ops)
+        self.template, self.template_data = _match_template(raw, ops)
+
+
+def _match_template(raw, ops):
+    n = len(raw)
+    if n == 25 and raw[:3] == b'\x76\xa9\x14' and raw[23:] == b'\x88\xac':
+        return 'p2pkh', raw[3:23]
+    if n == 23 and raw[:2] == b'\xa9\x14' and raw[22:] == b'\x87':
+        return 'p2sh', raw[2:22]
+    if len(ops) >= 4 and ops[-1][0] == OP_CHECKMULTISIG:
+        m, n = ops[0][0] - OP_1 + 1, ops[-2][0] - OP_1 + 1
+        pubs = [data for _, data, _ in ops[1:-2]]
+        if (1 <= m <= n <= 16 and len(pubs) == n and
+                all(data is not None and len(data) in (33, 65) for data in pubs)):
+            return 'multisig', (m, pubs)
+    return None, None
+
+
+_COMPILED = {}
+COMPILE_CACHE_SIZE = 10000
+
+
+def compile_script(script, cache=True):
+    """Binary script => CompiledScript; memoized unless cache is False"""
+    if not cache:
+        return CompiledScript(script)
+    compiled = _COMPILED.get(script)
+    if compiled is None:
+        if len(_COMPILED) >= COMPILE_CACHE_SIZE:
+            _COMPILED.clear()
+        compiled = _COMPILED[script] = CompiledScript(script)
+    return compiled
+
+
+# Signature checks
+
+def _find_and_delete(script, sigs):
+    """The legacy scriptCode: script minus its OP_CODESEPARATORs and every
+    op that is exactly the push of one of sigs"""
+    pushes = set(serialize_script_unit(sig) for sig in sigs)
+    out, start = [], 0
+    for op, data, end in compile_script(script, False).ops:
+        raw = script[start:end]
+        if op != 0xab and raw not in pushes:
+            out.append(raw)
+        start = end
+    return b''.join(out)
+
+
+def _check_sig(sig, pub, script_code, sighasher, i):
+    if not sig or sighasher is None:
+        return False
+    try:
+        z = sighasher.sighash(i, script_code, bytearray(sig[-1:])[0])
+        return ecdsa_raw_verify(z, _bin_der_decode_sig(sig), pub)
+    except Exception:
+        # undecodable signature or pubkey: the check fails, the script does not
+        return False
+
+
+def _check_multisig(sigs, pubs, script_code, sighasher, i):
+    """OP_CHECKMULTISIG's in-order matching of sigs against pubs"""
+    isig = ikey = 0
+    while isig < len(sigs):
+        if len(sigs) - isig > len(pubs) - ikey:
+            return False
+        if _check_sig(sigs[isig], pubs[ikey], script_code, sighasher, i):
+            isig += 1
+        ikey += 1
+    return True
+
+
+# Evaluation
+
+def _eval(stack, script, sighasher, i):
+    if not script.ok:
+        raise _ScriptFailure("bad script")
+    altstack, vfexec = [], []
+    raw = script.raw
+    codehash = 0
+    extra_ops = 0
+
+    def need(n):
+        if len(stack) < n:
+            raise _ScriptFailure("stack underflow")
+
+    for op, data, end in script.ops:
+        fexec = False not in vfexec
+        if op <= OP_16:
+            if fexec:
+                if data is not None:
+                    stack.append(data)
+                elif op == OP_1NEGATE:
+                    stack.append(b'\x81')
+                elif op == OP_RESERVED:
+                    raise _ScriptFailure("reserved opcode")
+                else:
+                    stack.append(encode_num(op - OP_1 + 1))
+        elif not fexec and not OP_IF <= op <= OP_ENDIF:
+            pass
+
+        # control flow
+        elif op == OP_IF or op == OP_NOTIF:
+            value = False
+            if fexec:
+                need(1)
+                value = cast_to_bool(stack.pop())
+                if op == OP_NOTIF:
+                    value = not value
+            vfexec.append(value)
+        elif op == OP_ELSE:
+            if not vfexec:
+                raise _ScriptFailure("ELSE without IF")
+            vfexec[-1] = not vfexec[-1]
+        elif op == OP_ENDIF:
+            if not vfexec:
+                raise _ScriptFailure("ENDIF without IF")
+            vfexec.pop()
+        elif op == OP_NOP or OP_NOP1 <= op <= OP_NOP10:
+            pass
+        elif op == OP_VERIFY:
+            need(1)
+            if not cast_to_bool(stack.pop()):
+                raise _ScriptFailure("VERIFY failed")
+        elif op == OP_RETURN:
+            raise _ScriptFailure("OP_RETURN")
+
+        # stack ops
+        elif op == OP_DUP:
+            need(1)
+            stack.append(stack[-1])
+        elif op == OP_DROP:
+            need(1)
+            stack.pop()
+        elif op == OP_SWAP:
+            need(2)
+            stack[-1], stack[-2] = stack[-2], stack[-1]
+        elif op == OP_TOALTSTACK:
+            need(1)
+            altstack.append(stack.pop())
+        elif op == OP_FROMALTSTACK:
+            if not altstack:
+                raise _ScriptFailure("altstack underflow")
+            stack.append(altstack.pop())
+        elif op == OP_2DROP:
+            need(2)
+            del stack[-2:]
+        elif op == OP_2DUP:
+            need(2)
+            stack.extend(stack[-2:])
+        elif op == OP_3DUP:
+            need(3)
+            stack.extend(stack[-3:])
+        elif op == OP_2OVER:
+            need(4)
+            stack.extend(stack[-4:-2])
+        elif op == OP_2ROT:
+            need(6)
+            moved = stack[-6:-4]
+            del stack[-6:-4]
+            stack.extend(moved)
+        elif op == OP_2SWAP:
+            need(4)
+            stack[-4:] = stack[-2:] + stack[-4:-2]
+        elif op == OP_IFDUP:
+            need(1)
+            if cast_to_bool(stack[-1]):
+                stack.append(stack[-1])
+        elif op == OP_DEPTH:
+            stack.append(encode_num(len(stack)))
+        elif op == OP_NIP:
+            need(2)
+            del stack[-2]
+        elif op == OP_OVER:
+            need(2)
+            stack.append(stack[-2])
+        elif op == OP_PICK or op == OP_ROLL:
+            need(2)
+            n = decode_num(stack.pop())
+            if n < 0 or n >= len(stack):
+                raise _ScriptFailure("PICK/ROLL out of range")
+            item = stack[-n-1]
+            if op == OP_ROLL:
+                del stack[-n-1]
+            stack.append(item)
+        elif op == OP_ROT:
+            need(3)
+            stack.append(stack.pop(-3))
+        elif op == OP_TUCK:
+            need(2)
+            stack.insert(-2, stack[-1])
+        elif op == OP_SIZE:
+            need(1)
+            stack.append(encode_num(len(stack[-1])))
+
+        # bitwise logic
+        elif op == OP_EQUAL or op == OP_EQUALVERIFY:
+            need(2)
+            equal = stack.pop() == stack.pop()
+            if op == OP_EQUALVERIFY:
+                if not equal:
+                    raise _ScriptFailure("EQUALVERIFY failed")
+            else:
+                stack.append(_TRUE if equal else _FALSE)
+
+        # numeric
+        elif OP_1ADD <= op <= OP_0NOTEQUAL:
+            need(1)
+            n = decode_num(stack.pop())
+            if op == OP_1ADD:
+                n += 1
+            elif op == OP_1SUB:
+                n -= 1
+            elif op == OP_NEGATE:
+                n = -n
+            elif op == OP_ABS:
+                n = abs(n)
+            elif op == OP_NOT:
+                n = int(n == 0)
+            elif op == OP_0NOTEQUAL:
+                n = int(n != 0)
+            else:
+                raise _ScriptFailure("bad opcode")
+            stack.append(encode_num(n))
+        elif OP_ADD <= op <= OP_MAX:
+            need(2)
+            b = decode_num(stack.pop())
+            a = decode_num(stack.pop())
+            if op == OP_ADD:
+                n = a + b
+            elif op == OP_SUB:
+                n = a - b
+            elif op == OP_BOOLAND:
+                n = int(a != 0 and b != 0)
+            elif op == OP_BOOLOR:
+                n = int(a != 0 or b != 0)
+            elif op == OP_NUMEQUAL or op == OP_NUMEQUALVERIFY:
+                n = int(a == b)
+            elif op == OP_NUMNOTEQUAL:
+                n = int(a != b)
+            elif op == OP_LESSTHAN:
+                n = int(a < b)
+            elif op == OP_GREATERTHAN:
+                n = int(a > b)
+            elif op == OP_LESSTHANOREQUAL:
+                n = int(a <= b)
+            elif op == OP_GREATERTHANOREQUAL:
+                n = int(a >= b)
+            elif op == OP_MIN:
+                n = min(a, b)
+            elif op == OP_MAX:
+                n = max(a, b)
+            else:
+                raise _ScriptFailure("bad opcode")
+            if op == OP_NUMEQUALVERIFY:
+                if not n:
+                    raise _ScriptFailure("NUMEQUALVERIFY failed")
+            else:
+                stack.append(encode_num(n))
+        elif op == OP_WITHIN:
+            need(3)
+            hi = decode_num(stack.pop())
+            lo = decode_num(stack.pop())
+            x = decode_num(stack.pop())
+            stack.append(_TRUE if lo <= x < hi else _FALSE)
+
+        # crypto
+        elif op == OP_HASH160:
+            need(1)
+            stack.append(bin_hash160(stack.pop()))
+        elif op == OP_SHA256:
+            need(1)
+            stack.append(hashlib.sha256(stack.pop()).digest())
+        elif op == OP_HASH256:
+            need(1)
+            stack.append(bin_dbl_sha256(stack.pop()))
+        elif op == OP_RIPEMD160:
+            need(1)
+            stack.append(bin_ripemd160(stack.pop()))
+        elif op == OP_SHA1:
+            need(1)
+            stack.append(hashlib.sha1(stack.pop()).digest())
+        elif op == OP_CODESEPARATOR:
+            codehash = end
+        elif op == OP_CHECKSIG or op == OP_CHECKSIGVERIFY:
+            need(2)
+            pub, sig = stack.pop(), stack.pop()
+            script_code = _find_and_delete(raw[codehash:], [sig])
+            ok = _check_sig(sig, pub, script_code, sighasher, i)
+            if op == OP_CHECKSIGVERIFY:
+                if not ok:
+                    raise _ScriptFailure("CHECKSIGVERIFY failed")
+            else:
+                stack.append(_TRUE if ok else _FALSE)
+        elif op == OP_CHECKMULTISIG or op == OP_CHECKMULTISIGVERIFY:
+            need(1)
+            nkeys = decode_num(stack[-1])
+            if nkeys < 0 or nkeys > MAX_PUBKEYS_PER_MULTISIG:
+                raise _ScriptFailure("bad pubkey count")
+            extra_ops += nkeys
+            if script.n_counted + extra_ops > MAX_OPS:
+                raise _ScriptFailure("op count")
+            need(2 + nkeys)
+            nsigs = decode_num(stack[-2-nkeys])
+            if nsigs < 0 or nsigs > nkeys:
+                raise _ScriptFailure("bad sig count")
+            need(3 + nkeys + nsigs)     # incl. the extra dummy element
+            pubs = stack[-1-nkeys:-1][::-1]
+            sigs = stack[-2-nkeys-nsigs:-2-nkeys][::-1]
+            script_code = _find_and_delete(raw[codehash:], sigs)
+            ok = _check_multisig(sigs, pubs, script_code, sighasher, i)
+            del stack[-3-nkeys-nsigs:]
+            if op == OP_CHECKMULTISIGVERIFY:
+                if not ok:
+                    raise _ScriptFailure("CHECKMULTISIGVERIFY failed")
+            else:
+                stack.append(_TRUE if ok else _FALSE)
+        else:
+            # VER, RESERVED1/2 and everything above NOP10
+            raise _ScriptFailure("bad opcode")
+
+        if len(stack) + len(altstack) > MAX_STACK_SIZE:
+            raise _ScriptFailure("stack size")
+
+    if vfexec:
+        raise _ScriptFailure("unbalanced conditional")
+    if script.n_counted + extra_ops > MAX_OPS:
+        raise _ScriptFailure("op count")
+
+
+def _sighasher(tx):
+    if tx is None or isinstance(tx, SighashCache):
+        return tx
+    return SighashCache(tx)
+
+
+def eval_script(stack, script, tx=None, i=0):
+    """Run binary script on stack (a list, modified in place) => bool success.
+    tx (raw / txobj / SighashCache) & input index i give signature context;
+    without it every signature check is false."""
+    try:
+        _eval(stack, compile_script(script), _sighasher(tx), int(i))
+        return True
+    except _ScriptFailure:
+        return False
+
+
+def _fast_verify(sig_script, spk, sighasher, i):
+    """Direct check of P2PKH and P2SH multisig spends => bool, or None if the
+    spend is not in one of those shapes"""
+    if not sig_script.push_only or any(data is None for _, data, _ in sig_script.ops):
+        return None
+    items = [data for _, data, _ in sig_script.ops]
+    if spk.template == 'p2pkh' and len(items) == 2:
+        sig, pub = items
+        if bin_hash160(pub) != spk.template_data:
+            return False
+        return _check_sig(sig, pub, _find_and_delete(spk.raw, [sig]), sighasher, i)
+    if spk.template == 'p2sh' and len(items) >= 3:
+        redeem = compile_script(items[-1])
+        if redeem.template != 'multisig':
+            return None
+        m, pubs = redeem.template_data
+        if len(items) != m + 2:
+            return None
+        if bin_hash160(redeem.raw) != spk.template_data:
+            return False
+        sigs = items[1:-1]
+        return _check_multisig(sigs, pubs, _find_and_delete(redeem.raw, sigs), sighasher, i)
+    return None
+
+
+def verify_script(script_sig, script_pubkey, tx=None, i=0, p2sh=True, templates=True):
+    """Binary scriptSig & scriptPubKey => bool
+
+    tx (raw / txobj / SighashCache) and input index i are the signature
+    context. templates=False always runs the full interpreter."""
+    sig_script = compile_script(script_sig, False)
+    spk = compile_script(script_pubkey)
+    sighasher, i = _sighasher(tx), int(i)
+
+    if templates and (p2sh or spk.template != 'p2sh'):
+        result = _fast_verify(sig_script, spk, sighasher, i)
+        if result is not None:
+            return result
+
+    stack = []
+    try:
+        _eval(stack, sig_script, sighasher, i)
+        copy = list(stack)
+        _eval(stack, spk, sighasher, i)
+        if not stack or not cast_to_bool(stack[-1]):
+            return False
+        if p2sh and spk.template == 'p2sh':
+            if not sig_script.push_only:
+                return False
+            stack = copy
+            redeem = compile_script(stack.pop())
+            _eval(stack, redeem, sighasher, i)
+            return bool(stack) and cast_to_bool(stack[-1])
+        return True
+    except _ScriptFailure:
+        return False
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Signature verification cache
+#
+# Only successful verifications are remembered, keyed by a digest of
+# (sighash, r, s, pubkey point), so a hit can never turn a bad signature
+# good. The cache is bounded (least recently used entries are evicted),
+# guarded by a lock and can be saved to / loaded from a flat file of
+# 32-byte keys.
+#
+# Caching is opt-in: ecdsa_raw_verify consults a process wide cache only
+# once one is installed with set_sigcache(SigCache()), since a cache of
+# verified signatures is state that outlives a call and costs memory.
+
+DEFAULT_MAX_ENTRIES = 100000
+KEY_LEN = 32
+
+
+def sigcache_key(z, r, s, pub):
+    """Ints z, r, s & pubkey point (x, y) => 32 byte cache key"""
+    return hashlib.sha256(('%064x' * 5 % (z, r, s, pub[0], pub[1])).encode('ascii')).digest()
+
+
+class SigCache(object):
+    __slots__ = ('max_entries', 'path', 'hits', 'misses', '_entries', '_lock')
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def lookup(self, key):
+        """True if key was verified before; counts a hit or a miss"""
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries[key] = self._entries.pop(key)    # most recently used
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = True
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def stats(self):
+        return {"entries": len(self._entries), "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate}
+
+    def save(self, path=None):
+        """Write the keys (oldest first) to path. They go to a temp file in
+        the same directory which is then renamed over path, so readers see
+        either the old file or the new one, never a partial one"""
+        path = path or self.path
+        with self._lock:
+            data = b''.join(self._entries)
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + '.',
+                                   dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            _replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def load(self, path=None):
+        """Add the keys stored at path; a truncated trailing key is ignored"""
+        with open(path or self.path, 'rb') as f:
+            data = f.read()
+        for pos in range(0, len(data) - KEY_LEN + 1, KEY_LEN):
+            self.add(data[pos:pos+KEY_LEN])
+
+
+# os.rename replaces an existing file atomically on POSIX only
+_replace = getattr(os, 'replace', os.rename)
+
+_sigcache = None
+
+
+def get_sigcache():
+    """The process wide SigCache consulted by ecdsa_raw_verify; None (the
+    default) when caching is off"""
+    return _sigcache
+
+
+def set_sigcache(cache):
+    """Install cache (a SigCache) as the process wide cache; None turns
+    caching off again"""
+    global _sigcache
+    _sigcache = cache
@@ -1,16 +1,37 @@
 #!/usr/bin/python
-import binascii, re, json, sys, binascii
+import binascii, re, json, sys, binascii, struct, hashlib
+import multiprocessing
+from array import array
+from bisect import bisect_left
 from bitcoin.main import *
-from _functools import reduce
 from bitcoin.pyspecials import *
 from bitcoin.bci import fetchtx
+from bitcoin.coinselect import UTXOPool, as_pool, select_coins, _fee
+
+
+_pack_u32 = struct.Struct('<I').pack
+_pack_u64 = struct.Struct('<Q').pack
+_pack_u16_into = struct.Struct('<H').pack_into
+_unpack_u8 = struct.Struct('<B').unpack_from
+_unpack_2u8 = struct.Struct('<2B').unpack_from
+_unpack_4u8 = struct.Struct('<4B').unpack_from
+_unpack_u16 = struct.Struct('<H').unpack_from
+_unpack_u32 = struct.Struct('<I').unpack_from
+_unpack_u64 = struct.Struct('<Q').unpack_from
+_pack_u32_into = struct.Struct('<I').pack_into
+_pack_u64_into = struct.Struct('<Q').pack_into
 
 
 # Transaction serialization and deserialization
 
 def deserialize(tx):
-    if isinstance(tx, str) and RE_HEX_CHARS.match(tx):
-        return json_hexlify(deserialize(binascii.unhexlify(tx)))
+    if _is_hex(tx):
+        return _hexlify_txobj(bin_deserialize(binascii.unhexlify(tx)))
+    return bin_deserialize(tx)
+
+
+def bin_deserialize(tx):
+    """Deserialize binary tx => txobj with binary hashes & scripts"""
     # http://stackoverflow.com/questions/4851463/python-closure-write-to-variable-in-parent-scope
     # Python's scoping rules are demented, requiring me to make pos an object
     # so that it is call-by-reference
@@ -38,6 +59,10 @@ def deserialize(tx):
 
     obj = {"ins": [], "outs": []}
     obj["version"] = read_as_int(4)
+    # BIP144 marker & flag
+    segwit = tx[4:6] == b'\x00\x01'
+    if segwit:
+        pos[0] += 2
     ins = read_var_int()
     for i in range(ins):
         obj["ins"].append(
@@ -56,32 +81,231 @@ def deserialize(tx):
             "value": read_as_int(8),
             "script": read_var_string()
         })
+    if segwit:
+        for inp in obj["ins"]:
+            inp["witness"] = [read_var_string() for _ in range(read_var_int())]
     obj["locktime"] = read_as_int(4)
     return obj
-        
+
+
+def _hexlify_txobj(txobj):
+    """Binary txobj => hex txobj (only the hash, script & witness fields change)"""
+    obj = {
+        "version": txobj["version"],
+        "ins": [{
+            "outpoint": {
+                "hash": safe_hexlify(inp["outpoint"]["hash"]),
+                "index": inp["outpoint"]["index"]
+            },
+            "script": safe_hexlify(inp["script"]),
+            "sequence": inp["sequence"]
+        } for inp in txobj["ins"]],
+        "outs": [{
+            "value": out["value"],
+            "script": safe_hexlify(out["script"])
+        } for out in txobj["outs"]],
+        "locktime": txobj["locktime"]
+    }
+    for inp, newinp in zip(txobj["ins"], obj["ins"]):
+        if "witness" in inp:
+            newinp["witness"] = [safe_hexlify(w) for w in inp["witness"]]
+    return obj
+
+
+def _unhexlify_txobj(txobj):
+    """Hex txobj => binary txobj"""
+    obj = {
+        "version": txobj["version"],
+        "ins": [{
+            "outpoint": {
+                "hash": binascii.unhexlify(inp["outpoint"]["hash"]),
+                "index": inp["outpoint"]["index"]
+            },
+            "script": binascii.unhexlify(inp["script"]),
+            "sequence": inp["sequence"]
+        } for inp in txobj["ins"]],
+        "outs": [{
+            "value": out["value"],
+            "script": binascii.unhexlify(out["script"])
+        } for out in txobj["outs"]],
+        "locktime": txobj["locktime"]
+    }
+    for inp, newinp in zip(txobj["ins"], obj["ins"]):
+        if "witness" in inp:
+            newinp["witness"] = [binascii.unhexlify(w) for w in inp["witness"]]
+    return obj
+
+
+def _is_hex_txobj(txobj):
+    """Cheap check for hex txobj: looks at one hash (or one script) only"""
+    for inp in txobj.get("ins", []):
+        return len(inp["outpoint"]["hash"]) == 64
+    for out in txobj.get("outs", []):
+        script = out["script"]
+        return isinstance(script, string_types) and bool(RE_HEX_CHARS.match(script))
+    return True
+
 
 def serialize(txobj):
-    #if isinstance(txobj, bytes):
-    #    txobj = bytes_to_hex_string(txobj)
-    o = []
-    if json_is_base(txobj, 16):
-        json_changedbase = json_unhexlify(txobj)
-        hexlified = safe_hexlify(serialize(json_changedbase))
-        return hexlified
-    o.append(encode(txobj["version"], 256, 4)[::-1])
-    o.append(num_to_var_int(len(txobj["ins"])))
-    for inp in txobj["ins"]:
-        o.append(inp["outpoint"]["hash"][::-1])
-        o.append(encode(inp["outpoint"]["index"], 256, 4)[::-1])
-        o.append(num_to_var_int(len(inp["script"]))+(inp["script"] if inp["script"] or is_python2 else bytes()))
-        o.append(encode(inp["sequence"], 256, 4)[::-1])
-    o.append(num_to_var_int(len(txobj["outs"])))
-    for out in txobj["outs"]:
-        o.append(encode(out["value"], 256, 8)[::-1])
-        o.append(num_to_var_int(len(out["script"]))+out["script"])
-    o.append(encode(txobj["locktime"], 256, 4)[::-1])
-
-    return ''.join(o) if is_python2 else reduce(lambda x,y: x+y, o, bytes())
+    if _is_hex_txobj(txobj):
+        return safe_hexlify(bin_serialize(_unhexlify_txobj(txobj)))
+    return bin_serialize(txobj)
+
+
+def var_int_size(n):
+    """Serialized length of varint n"""
+    return 1 if n < 0xfd else 3 if n <= 0xffff else 5 if n <= 0xffffffff else 9
+
+
+def _pack_var_int_into(buf, pos, n):
+    if n < 0xfd:
+        buf[pos] = n
+        return pos + 1
+    elif n <= 0xffff:
+        buf[pos] = 0xfd
+        _pack_u16_into(buf, pos + 1, n)
+        return pos + 3
+    elif n <= 0xffffffff:
+        buf[pos] = 0xfe
+        _pack_u32_into(buf, pos + 1, n)
+        return pos + 5
+    buf[pos] = 0xff
+    _pack_u64_into(buf, pos + 1, n)
+    return pos + 9
+
+
+def serialize_fields(version, ins, outs, locktime, witnesses=None):
+    """Serialize from flat fields in one preallocated buffer.
+
+    ins: [(hash in wire order, index, script, sequence), ...]
+    outs: [(value, script), ...]
+    witnesses: optional [[item, ...], ...] per input (BIP144 format if any)
+    The exact size is computed first, then every field is written in place
+    with struct.pack_into, so the cost is linear in the tx size."""
+    if witnesses is not None and not any(witnesses):
+        witnesses = None
+    size = 8 + var_int_size(len(ins)) + var_int_size(len(outs))
+    for _, _, script, _ in ins:
+        n = len(script)
+        size += 40 + var_int_size(n) + n
+    for _, script in outs:
+        n = len(script)
+        size += 8 + var_int_size(n) + n
+    if witnesses is not None:
+        size += 2
+        for items in witnesses:
+            size += var_int_size(len(items or ()))
+            for item in items or ():
+                size += var_int_size(len(item)) + len(item)
+
+    buf = bytearray(size)
+    pack_u32_into, pack_var_int_into = _pack_u32_into, _pack_var_int_into
+    pack_u32_into(buf, 0, version)
+    pos = 4
+    if witnesses is not None:
+        buf[4:6] = b'\x00\x01'
+        pos = 6
+    pos = pack_var_int_into(buf, pos, len(ins))
+    for h, index, script, sequence in ins:
+        buf[pos:pos+32] = h
+        pack_u32_into(buf, pos + 32, index)
+        n = len(script)
+        pos = pack_var_int_into(buf, pos + 36, n)
+        buf[pos:pos+n] = script
+        pos += n
+        pack_u32_into(buf, pos, sequence)
+        pos += 4
+    pos = pack_var_int_into(buf, pos, len(outs))
+    for value, script in outs:
+        _pack_u64_into(buf, pos, value)
+        n = len(script)
+        pos = pack_var_int_into(buf, pos + 8, n)
+        buf[pos:pos+n] = script
+        pos += n
+    if witnesses is not None:
+        for items in witnesses:
+            pos = pack_var_int_into(buf, pos, len(items or ()))
+            for item in items or ():
+                n = len(item)
+                pos = pack_var_int_into(buf, pos, n)
+                buf[pos:pos+n] = item
+                pos += n
+    pack_u32_into(buf, pos, locktime)
+    return bytes(buf)
+
+
+def read_var_int(buf, pos):
+    """varint at buf[pos] => (value, new pos)"""
+    n = _unpack_u8(buf, pos)[0]
+    if n < 0xfd:
+        return n, pos + 1
+    elif n == 0xfd:
+        return _unpack_u16(buf, pos + 1)[0], pos + 3
+    elif n == 0xfe:
+        return _unpack_u32(buf, pos + 1)[0], pos + 5
+    return _unpack_u64(buf, pos + 1)[0], pos + 9
+
+
+def input_script_spans(tx):
+    """Binary tx => [(scriptSig varint pos, scriptSig end), ...] per input"""
+    n, pos = read_var_int(tx, 6 if tx[4:6] == b'\x00\x01' else 4)
+    spans = []
+    for _ in range(n):
+        size, spos = read_var_int(tx, pos + 36)
+        spans.append((pos + 36, spos + size))
+        pos = spos + size + 4
+    return spans
+
+
+def bin_strip_witness(tx):
+    """Binary tx => binary tx without the BIP144 marker, flag & witnesses,
+    the serialization its txid commits to; non-segwit txs are returned as is"""
+    if tx[4:6] != b'\x00\x01':
+        return tx
+    n, pos = read_var_int(tx, 6)
+    for _ in range(n):
+        size, pos = read_var_int(tx, pos + 36)
+        pos += size + 4
+    n, pos = read_var_int(tx, pos)
+    for _ in range(n):
+        size, pos = read_var_int(tx, pos + 8)
+        pos += size
+    return tx[:4] + tx[6:pos] + tx[-4:]
+
+
+def bin_splice_scripts(tx, scripts, spans=None):
+    """Binary tx & {input index: scriptSig} => binary tx.
+
+    Only the scriptSigs and their varint lengths are rewritten; everything
+    between them is copied across in one pass. spans is an optional
+    precomputed input_script_spans(tx)."""
+    if spans is None:
+        spans = input_script_spans(tx)
+    edits = [(spans[int(i)], num_to_var_int(len(s)) + s) for i, s in sorted(scripts.items())]
+    size = len(tx) + sum(len(new) - (end - start) for (start, end), new in edits)
+    src = memoryview(tx)
+    buf = bytearray(size)
+    pos = dst = 0
+    for (start, end), new in edits:
+        n = start - pos
+        buf[dst:dst+n] = src[pos:start]
+        dst += n
+        buf[dst:dst+len(new)] = new
+        dst += len(new)
+        pos = end
+    buf[dst:] = src[pos:]
+    return bytes(buf)
+
+
+def bin_serialize(txobj):
+    """Serialize txobj with binary hashes & scripts => binary tx"""
+    return serialize_fields(
+        txobj["version"],
+        [(inp["outpoint"]["hash"][::-1], inp["outpoint"]["index"], inp["script"] or b'',
+          inp["sequence"]) for inp in txobj["ins"]],
+        [(out["value"], out["script"]) for out in txobj["outs"]],
+        txobj["locktime"],
+        [inp.get("witness") for inp in txobj["ins"]])
 
 # Hashing transactions for signing
 
@@ -95,31 +319,274 @@ SIGHASH_ANYONECANPAY = SIGHASH_ACP | SIGHASH_ALL
 
 
 def signature_form(tx, i, script, hashcode=SIGHASH_ALL):
-    import copy
     i, hashcode = int(i), int(hashcode)
     if isinstance(tx, string_or_bytes_types):
-        return serialize(signature_form(deserialize(tx), i, script, hashcode))
-    newtx = copy.deepcopy(tx)
-    for inp in newtx["ins"]:
-        inp["script"] = ""
+        if _is_hex(tx):
+            if _is_hex(script):
+                script = binascii.unhexlify(script)
+            return safe_hexlify(bin_signature_form(binascii.unhexlify(tx), i, script, hashcode))
+        return bin_signature_form(tx, i, script, hashcode)
+    return _signature_form_obj(tx, i, script, hashcode, '' if _is_hex_txobj(tx) else b'')
+
+
+def bin_signature_form(tx, i, script, hashcode=SIGHASH_ALL):
+    """Binary tx & scriptPubKey => binary tx to be hashed for signing input i"""
+    return SighashCache(tx).signature_form(i, script, hashcode)
+
+
+def _signature_form_obj(tx, i, script, hashcode, empty):
+    # shallow copies: only the fields we blank are replaced, nothing is mutated
+    base = hashcode & 0x1f
+    newtx = dict(tx)
+    newtx["ins"] = [dict(inp, script=empty) for inp in tx["ins"]]
     newtx["ins"][i]["script"] = script
-    if hashcode == SIGHASH_NONE:
+    newtx["outs"] = list(tx["outs"])
+    if base == SIGHASH_NONE:
         newtx["outs"] = []
-    elif hashcode == SIGHASH_SINGLE:
-        num_ins = len(newtx["ins"])
-        newtx["outs"] = newtx["outs"][:num_ins]
-        for out in newtx["outs"][:num_ins - 1]:     # del outs @ lower index
-            out['value'] = 2**64 - 1
-            out['script'] = ""
-    elif hashcode == SIGHASH_ANYONECANPAY:
+    elif base == SIGHASH_SINGLE:
+        if i >= len(newtx["outs"]):
+            raise ValueError("SIGHASH_SINGLE input %d has no matching output" % i)
+        newtx["outs"] = newtx["outs"][:i+1]
+        for j in range(i):      # del outs @ lower index
+            newtx["outs"][j] = {"value": 2**64 - 1, "script": empty}
+    if base == SIGHASH_NONE or base == SIGHASH_SINGLE:
+        for j, inp in enumerate(newtx["ins"]):
+            if j != i:
+                inp["sequence"] = 0
+    if hashcode & SIGHASH_ACP:
         newtx["ins"] = [newtx["ins"][i]]
-    else:
-        pass
     return newtx
 
 
+_SIGHASH_ONE = b'\x01' + b'\x00' * 31      # uint256(1): SIGHASH_SINGLE without a matching output
+
+
+def _strip_codeseparators(script):
+    """script with its OP_CODESEPARATORs (not push data) removed, as
+    Core serializes a legacy scriptCode; a truncated push is kept as is"""
+    if b'\xab' not in script:
+        return script
+    out, pos, start, n = [], 0, 0, len(script)
+    while pos < n:
+        code = _unpack_u8(script, pos)[0]
+        if code == 0xab:
+            out.append(script[start:pos])
+            start = pos + 1
+        pos += 1
+        try:
+            if code < 76:
+                pos += code
+            elif code == 76:
+                pos += 1 + _unpack_u8(script, pos)[0]
+            elif code == 77:
+                pos += 2 + _unpack_u16(script, pos)[0]
+            elif code == 78:
+                pos += 4 + _unpack_u32(script, pos)[0]
+        except struct.error:
+            break
+    out.append(script[start:])
+    return b''.join(out)
+
+
+class SighashCache(object):
+    """Legacy sighash engine for one transaction.
+
+    The blanked inputs and output blocks are serialized once. A digest hashes
+    on from a SHA-256 midstate over the version and the blanked inputs before
+    input i, splices in input i's script, then the cached remainder. Signing
+    inputs in order advances the shared midstate instead of rehashing it.
+    The hash types follow Core's SignatureHash, SIGHASH_SINGLE bug included."""
+
+    __slots__ = ('_header', '_ins', '_blank', '_blank_noseq', '_outs', '_n_outs', '_locktime',
+                 '_outblocks', '_mid', '_mid_i', '_bip143')
+
+    def __init__(self, tx):
+        if isinstance(tx, dict):
+            txobj = _unhexlify_txobj(tx) if _is_hex_txobj(tx) else tx
+        else:
+            txobj = bin_deserialize(binascii.unhexlify(tx) if _is_hex(tx) else tx)
+        ins = txobj["ins"]
+        self._header = _pack_u32(txobj["version"]) + num_to_var_int(len(ins))
+        # (outpoint, sequence) per input; blanked inputs are 41 bytes each
+        self._ins = [(inp["outpoint"]["hash"][::-1] + _pack_u32(inp["outpoint"]["index"]),
+                      _pack_u32(inp["sequence"])) for inp in ins]
+        self._blank = b''.join(op + b'\x00' + seq for op, seq in self._ins)
+        self._blank_noseq = None
+        self._outs = [_pack_u64(out["value"]) + num_to_var_int(len(out["script"])) + out["script"]
+                      for out in txobj["outs"]]
+        self._locktime = _pack_u32(txobj["locktime"])
+        self._outblocks = {}
+        self._mid, self._mid_i = hashlib.sha256(self._header), 0
+        self._bip143 = None
+
+    def _outputs(self, base, i):
+        if base == SIGHASH_NONE:
+            return b'\x00'
+        if base == SIGHASH_SINGLE:
+            # outputs up to i, all but the last blanked (value -1, empty script)
+            return num_to_var_int(i + 1) + (b'\xff' * 8 + b'\x00') * i + self._outs[i]
+        block = self._outblocks.get(SIGHASH_ALL)
+        if block is None:
+            block = self._outblocks[SIGHASH_ALL] = num_to_var_int(len(self._outs)) + b''.join(self._outs)
+        return block
+
+    def _prefix(self, i):
+        if i < self._mid_i:
+            self._mid, self._mid_i = hashlib.sha256(self._header), 0
+        if i > self._mid_i:
+            self._mid.update(memoryview(self._blank)[41 * self._mid_i:41 * i])
+            self._mid_i = i
+        return self._mid.copy()
+
+    def _input(self, i, script):
+        op, seq = self._ins[i]
+        return op + num_to_var_int(len(script)) + script + seq
+
+    def _inputs(self, i, script, base, acp):
+        """Serialized inputs (with count) for input i's sighash"""
+        if acp:
+            return b'\x01' + self._input(i, script)
+        blank = self._blank
+        if base == SIGHASH_NONE or base == SIGHASH_SINGLE:
+            # the other inputs' sequences are zeroed
+            if self._blank_noseq is None:
+                self._blank_noseq = b''.join(op + b'\x00' + b'\x00' * 4 for op, _ in self._ins)
+            blank = self._blank_noseq
+        return (self._header[4:] + blank[:41 * i] + self._input(i, script) +
+                blank[41 * (i + 1):])
+
+    def signature_form(self, i, script, hashcode=SIGHASH_ALL):
+        """=> binary tx to be hashed for signing input i; ValueError for
+        SIGHASH_SINGLE without a matching output (see sighash)"""
+        i, hashcode = int(i), int(hashcode)
+        if _is_hex(script):
+            script = binascii.unhexlify(script)
+        base, acp = hashcode & 0x1f, hashcode & SIGHASH_ACP
+        if base == SIGHASH_SINGLE and i >= len(self._outs):
+            raise ValueError("SIGHASH_SINGLE input %d has no matching output" % i)
+        return (self._header[:4] + self._inputs(i, _strip_codeseparators(script), base, acp) +
+                self._outputs(base, i) + self._locktime)
+
+    def sighash(self, i, script, hashcode=SIGHASH_ALL):
+        """=> binary digest signed for input i"""
+        i, hashcode = int(i), int(hashcode)
+        if _is_hex(script):
+            script = binascii.unhexlify(script)
+        script = _strip_codeseparators(script)
+        base, acp = hashcode & 0x1f, hashcode & SIGHASH_ACP
+        if base == SIGHASH_SINGLE and i >= len(self._outs):
+            return _SIGHASH_ONE
+        if acp or base == SIGHASH_NONE or base == SIGHASH_SINGLE:
+            h = hashlib.sha256(self._header[:4])
+            h.update(self._inputs(i, script, base, acp))
+        else:
+            h = self._prefix(i)
+            h.update(self._input(i, script))
+            h.update(memoryview(self._blank)[41 * (i + 1):])
+        h.update(self._outputs(base, i))
+        h.update(self._locktime + _pack_u32(hashcode & 0xffffffff))
+        return hashlib.sha256(h.digest()).digest()
+
+    # BIP143 (segwit v0)
+
+    def _bip143_hashes(self):
+        # hashPrevouts, hashSequence, hashOutputs: computed once per tx
+        if self._bip143 is None:
+            self._bip143 = (bin_dbl_sha256(b''.join(op for op, _ in self._ins)),
+                            bin_dbl_sha256(b''.join(seq for _, seq in self._ins)),
+                            bin_dbl_sha256(b''.join(self._outs)))
+        return self._bip143
+
+    def segwit_signature_form(self, i, script_code, amount, hashcode=SIGHASH_ALL):
+        """=> BIP143 preimage for input i spending amount satoshis"""
+        i, hashcode = int(i), int(hashcode)
+        if _is_hex(script_code):
+            script_code = binascii.unhexlify(script_code)
+        hash_prevouts, hash_sequence, hash_outputs = self._bip143_hashes()
+        zero = b'\x00' * 32
+        base = hashcode & 0x1f
+        if hashcode & SIGHASH_ACP:
+            hash_prevouts = zero
+        if hashcode & SIGHASH_ACP or base in (SIGHASH_NONE, SIGHASH_SINGLE):
+            hash_sequence = zero
+        if base == SIGHASH_SINGLE:
+            hash_outputs = bin_dbl_sha256(self._outs[i]) if i < len(self._outs) else zero
+        elif base == SIGHASH_NONE:
+            hash_outputs = zero
+        op, seq = self._ins[i]
+        return b''.join([self._header[:4], hash_prevouts, hash_sequence, op,
+                         num_to_var_int(len(script_code)), script_code, _pack_u64(int(amount)),
+                         seq, hash_outputs, self._locktime, _pack_u32(hashcode)])
+
+    def segwit_sighash(self, i, script_code, amount, hashcode=SIGHASH_ALL):
+        """=> BIP143 digest signed for input i (script_code w/o length prefix)"""
+        return bin_dbl_sha256(self.segwit_signature_form(i, script_code, amount, hashcode))
+
+
 # Making the actual signatures
 
+# DER signatures are handled at the byte level: one pass over a memoryview
+# splits r, s & hashcode, checking the encoding as it goes.
+
+def _der_int(mv, pos, size):
+    return int(binascii.hexlify(mv[pos:pos+size]), 16) if size else 0
+
+
+def parse_der_sig(sig, strict=True):
+    """Binary DER sig (w/ or w/o hashcode) => (r, s, hashcode or None)
+
+    strict enforces BIP66 (minimal, non-negative integers, exact lengths);
+    otherwise only the framing is checked. Raises ValueError."""
+    mv = sig if isinstance(sig, memoryview) else memoryview(sig)
+    n = len(mv)
+    if n < 8:
+        raise ValueError("Not a DER signature")
+    tag, total, rtag, rlen = _unpack_4u8(mv, 0)
+    total += 2
+    if tag != 0x30 or rtag != 0x02:
+        raise ValueError("Not a DER signature")
+    if n == total:
+        hashcode = None
+    elif n == total + 1 or (n > total and not strict):
+        hashcode = _unpack_u8(mv, total)[0]
+    else:
+        raise ValueError("Bad DER length")
+    if 6 + rlen >= total:
+        raise ValueError("Bad DER framing")
+    stag, slen = _unpack_2u8(mv, 4 + rlen)
+    if stag != 0x02 or 6 + rlen + slen != total:
+        raise ValueError("Bad DER framing")
+    if strict:
+        # BIP66: size incl. hashcode <= 73, non-empty, non-negative & minimal R and S
+        if total > 72 or rlen == 0 or slen == 0:
+            raise ValueError("Non-BIP66 DER signature")
+        r0, r1 = _unpack_2u8(mv, 4)
+        s0 = _unpack_u8(mv, 6 + rlen)[0]
+        if r0 & 0x80 or s0 & 0x80:
+            raise ValueError("Non-BIP66 DER signature: negative integer")
+        if (rlen > 1 and r0 == 0 and not r1 & 0x80) or \
+                (slen > 1 and s0 == 0 and not _unpack_u8(mv, 7 + rlen)[0] & 0x80):
+            raise ValueError("Non-BIP66 DER signature: excess padding")
+    return _der_int(mv, 4, rlen), _der_int(mv, 6 + rlen, slen), hashcode
+
+
+def bin_der_encode_sig(r, s, hashcode=None):
+    """Ints r, s (& optional hashcode) => binary DER sig, written into one buffer"""
+    rb, sb = encode(r, 256), encode(s, 256)
+    rpad = 1 if not rb or bytearray(rb[:1])[0] & 0x80 else 0    # keep integers non-negative
+    spad = 1 if not sb or bytearray(sb[:1])[0] & 0x80 else 0
+    rlen, slen = len(rb) + rpad, len(sb) + spad
+    total = 6 + rlen + slen
+    buf = bytearray(total + (hashcode is not None))
+    buf[0], buf[1], buf[2], buf[3] = 0x30, total - 2, 0x02, rlen
+    buf[4+rpad:4+rlen] = rb
+    buf[4+rlen], buf[5+rlen] = 0x02, slen
+    buf[6+rlen+spad:total] = sb
+    if hashcode is not None:
+        buf[total] = int(hashcode)
+    return bytes(buf)
+
+
 def der_encode_sig(*args):
     """Takes ([vbyte], r, s) as ints and returns hex der encode sig"""
     if len(args) == 3:
@@ -128,69 +595,74 @@ def der_encode_sig(*args):
         r,s = args
     elif len(args) == 1 and isinstance(args[0], tuple):
         return der_encode_sig(*args[0])
-    b1, b2 = encode(r, 256), encode(s, 256)
-    if len(b1) and changebase(b1[0], 256, 16, 1) in "89abcdef":	# add null bytes if interpreted as negative number
-        b1 = b'\x00' + b1
-    if len(b2) and ord(b2[0]) & 0x80:
-        b2 = b'\x00' + b2
-    left  = b'\x02' + encode(len(b1), 256, 1) + b1
-    right = b'\x02' + encode(len(b2), 256, 1) + b2
-    sighex = safe_hexlify(b'\x30' + encode(len(left+right), 256, 1) + left + right)
-    #assert is_bip66(sighex)
-    return sighex
+    return safe_hexlify(bin_der_encode_sig(r, s))
 
 
 def der_decode_sig(sig):
     """Takes DER sig (incl. hashcode), returns v,r,s as ints"""
-    leftlen = decode(sig[6:8], 16)*2
-    left = sig[8:8+leftlen]
-    rightlen = decode(sig[10+leftlen:12+leftlen], 16)*2
-    right = sig[12+leftlen:12+leftlen+rightlen]
-    #assert 3*2 + leftlen + 3*2 + rightlen + 1*2 == len(sig) 	
-    return (None, decode(left, 16), decode(right, 16))
-    
+    if _is_hex(sig):
+        sig = binascii.unhexlify(sig)
+    r, s, _ = parse_der_sig(sig, strict=False)
+    return None, r, s
+
 
 def is_bip66(sig):
-    """Checks hex DER sig for BIP66 compliance"""
+    """Checks hex or binary DER sig (w/ or w/o hashcode) for BIP66 compliance"""
     #https://raw.githubusercontent.com/bitcoin/bips/master/bip-0066.mediawiki
     #0x30  [total-len]  0x02  [R-len]  [R]  0x02  [S-len]  [S]  [sighash]
-    sig = bytearray.fromhex(sig) if (isinstance(sig, string_types) and
-             RE_HEX_CHARS.match(sig)) else bytearray(sig)
-    if sig[1] == len(sig)-2: 
-        sig.extend(b"\1")		# add SIGHASH for BIP66 check
-
-    if len(sig) < 9 or len(sig) > 73: return False
-    if (sig[0] != 0x30): return False
-    if (sig[1] != len(sig)-3): return False
-    rlen = sig[3]
-    if (5+rlen >= len(sig)): return False
-    slen = sig[5+rlen]
-    if (rlen + slen + 7 != len(sig)): return False
-    if (sig[2] != 0x02): return False
-    if (rlen == 0): return False
-    if (sig[4] & 0x80): return False
-    if (rlen > 1 and (sig[4] == 0) and not (sig[5] & 0x80)): return False
-    if (sig[4+rlen] != 0x02): return False
-    if (slen == 0): return False
-    if (sig[rlen+6] & 0x80): return False
-    if (slen > 1 and (sig[6+rlen] == 0) and not (sig[7+rlen] & 0x80)): return False
-    
-    return True
+    if isinstance(sig, string_types) and RE_HEX_CHARS.match(sig):
+        sig = binascii.unhexlify(sig)
+    try:
+        parse_der_sig(sig)
+        return True
+    except (ValueError, struct.error):
+        return False
 
 
 def txhash(tx, hashcode=None):
+    if hasattr(tx, 'bin_txid'):     # Tx / TxView: serialization & txid are memoised
+        if hashcode is None:
+            return tx.txid
+        tx = tx.serialize()
     if isinstance(tx, string_types) and RE_HEX_CHARS.match(tx):
         tx = changebase(tx, 16, 256)
     if hashcode is not None:
         return dbl_sha256(from_str_to_bytes(tx) + from_int_to_le_bytes(int(hashcode), 4))
     else:
-        return safe_hexlify(bin_dbl_sha256(tx)[::-1])
+        return safe_hexlify(bin_dbl_sha256(bin_strip_witness(tx))[::-1])
 
 
 def bin_txhash(tx, hashcode=None):
+    if hashcode is None and hasattr(tx, 'bin_txid'):
+        return tx.bin_txid
     return binascii.unhexlify(txhash(tx, hashcode))
 
 
+def bin_wtxid(tx):
+    """Hex / binary tx, Tx or TxView => binary wtxid (BIP141), in display
+    order; the same as the txid unless tx has witnesses"""
+    if hasattr(tx, 'serialize'):
+        tx = tx.serialize()
+    elif _is_hex(tx):
+        tx = binascii.unhexlify(tx)
+    return bin_dbl_sha256(tx)[::-1]
+
+
+def wtxid(tx):
+    return safe_hexlify(bin_wtxid(tx))
+
+
+def bin_sighash(tx, hashcode=SIGHASH_ALL):
+    """Binary signature form => binary digest signed for hashcode"""
+    return bin_dbl_sha256(tx + _pack_u32(int(hashcode)))
+
+
+def _bin_der_decode_sig(sig):
+    """Binary DER sig (w/ or w/o hashcode) => (None, r, s)"""
+    r, s, _ = parse_der_sig(sig, strict=False)
+    return None, r, s
+
+
 def ecdsa_tx_sign(tx, priv, hashcode=SIGHASH_ALL):
     """Returns DER sig for rawtx w/ hashcode appended"""
     rawsig = ecdsa_raw_sign(bin_txhash(tx, hashcode), priv)
@@ -220,6 +692,11 @@ def mk_scripthash_script(addr):
     return 'a914' + b58check_to_hex(addr) + '87'
 
 
+def mk_p2wpkh_script(pub):
+    """pubkey => P2WPKH witness program (hex); wrap with p2sh_scriptaddr for P2SH-P2WPKH"""
+    return '0014' + hash160(binascii.unhexlify(pub) if _is_hex(pub) else pub)
+
+
 # Address representation to output script
 
 def address_to_script(addr):
@@ -228,13 +705,92 @@ def address_to_script(addr):
     else:
         return mk_pubkey_script(addr)
 
+# Output script templates
+
+SCRIPT_NONSTANDARD = 0
+SCRIPT_P2PKH = 1
+SCRIPT_P2SH = 2
+SCRIPT_P2PK = 3
+SCRIPT_MULTISIG = 4
+SCRIPT_NULL_DATA = 5
+SCRIPT_P2WPKH = 6
+SCRIPT_P2WSH = 7
+SCRIPT_WITNESS_UNKNOWN = 8
+
+SCRIPT_TYPE_NAMES = ('nonstandard', 'p2pkh', 'p2sh', 'p2pk', 'multisig', 'nulldata',
+                     'p2wpkh', 'p2wsh', 'witness_unknown')
+
+
+def classify_script(script):
+    """Binary scriptPubKey => (SCRIPT_* type, payload memoryview)
+
+    Payload is the hash160 (P2PKH, P2SH, P2WPKH), pubkey (P2PK), witness
+    program (P2WSH, other versions), data after OP_RETURN, or the whole
+    script (multisig, nonstandard). Only fixed offsets are compared and the
+    payload is a view, nothing is copied."""
+    mv = script if isinstance(script, memoryview) else memoryview(script)
+    n = len(mv)
+    if n == 0:
+        return SCRIPT_NONSTANDARD, mv
+    first, last = _unpack_u8(mv, 0)[0], _unpack_u8(mv, n - 1)[0]
+    if n == 25 and mv[:3] == b'\x76\xa9\x14' and mv[23:] == b'\x88\xac':
+        return SCRIPT_P2PKH, mv[3:23]
+    if n == 23 and mv[:2] == b'\xa9\x14' and last == 0x87:
+        return SCRIPT_P2SH, mv[2:22]
+    if first == 0x6a:
+        return SCRIPT_NULL_DATA, mv[1:]
+    if 4 <= n <= 42 and (first == 0 or 0x51 <= first <= 0x60) and _unpack_u8(mv, 1)[0] == n - 2:
+        if first == 0:
+            if n == 22:
+                return SCRIPT_P2WPKH, mv[2:]
+            if n == 34:
+                return SCRIPT_P2WSH, mv[2:]
+            return SCRIPT_NONSTANDARD, mv
+        return SCRIPT_WITNESS_UNKNOWN, mv[2:]
+    if last == 0xac:
+        if n == 35 and first == 33 and _unpack_u8(mv, 1)[0] in (2, 3):
+            return SCRIPT_P2PK, mv[1:34]
+        if n == 67 and first == 65 and _unpack_u8(mv, 1)[0] == 4:
+            return SCRIPT_P2PK, mv[1:66]
+    if last == 0xae and 0x51 <= first <= 0x60 and n >= 37:
+        pos, keys = 1, 0
+        while pos < n - 2:
+            size = _unpack_u8(mv, pos)[0]
+            if size != 33 and size != 65:
+                break
+            pos += 1 + size
+            keys += 1
+        if (pos == n - 2 and first - 0x50 <= keys <= 16 and
+                _unpack_u8(mv, pos)[0] == 0x50 + keys):
+            return SCRIPT_MULTISIG, mv
+    return SCRIPT_NONSTANDARD, mv
+
+
+def classify_scripts(scripts):
+    """[binary scriptPubKey, ...] => (array('B') of SCRIPT_* types,
+    bytearray of 20 byte hash160s, zeros where the type has none).
+    P2PK outputs get the hash160 of their pubkey."""
+    scripts = list(scripts)
+    types = array('B', [0]) * len(scripts)
+    hashes = bytearray(20 * len(scripts))
+    for k, script in enumerate(scripts):
+        t, payload = classify_script(script)
+        types[k] = t
+        if t == SCRIPT_P2PKH or t == SCRIPT_P2SH or t == SCRIPT_P2WPKH:
+            hashes[20*k:20*k+20] = payload
+        elif t == SCRIPT_P2PK:
+            hashes[20*k:20*k+20] = bin_hash160(payload.tobytes())
+    return types, hashes
+
+
 # Output script to address representation
 
 def script_to_address(script, vbyte=0):
     if RE_HEX_CHARS.match(script):
         script = binascii.unhexlify(script)
-    if script[:3] == b'\x76\xa9\x14' and script[-2:] == b'\x88\xac' and len(script) == 25:
-        return bin_to_b58check(script[3:-2], vbyte)  # pubkey hash addresses
+    t, payload = classify_script(script)
+    if t == SCRIPT_P2PKH:
+        return bin_to_b58check(payload.tobytes(), vbyte)  # pubkey hash addresses
     else:
         if vbyte in [111, 196]:     # Testnet
             scripthash_byte = 196
@@ -252,7 +808,9 @@ scriptaddr = p2sh_scriptaddr
 
 
 def deserialize_script(script):
-    if isinstance(script, str) and RE_HEX_CHARS.match(script):
+    if not script:
+        return []
+    if _is_hex(script):
        return json_hexlify(deserialize_script(safe_unhexlify(script)))
     out, pos = [], 0
     while pos < len(script):
@@ -277,6 +835,30 @@ def deserialize_script(script):
     return out
 
 
+def script_pushes(script):
+    """Binary script => memoryviews of its data pushes, in order (stops at
+    a truncated push)"""
+    mv = script if isinstance(script, memoryview) else memoryview(script)
+    n, pos = len(mv), 0
+    while pos < n:
+        code = _unpack_u8(mv, pos)[0]
+        pos += 1
+        if code > 78:
+            continue
+        if code == 76:
+            size, pos = _unpack_u8(mv, pos)[0], pos + 1
+        elif code == 77:
+            size, pos = _unpack_u16(mv, pos)[0], pos + 2
+        elif code == 78:
+            size, pos = _unpack_u32(mv, pos)[0], pos + 4
+        else:
+            size = code
+        if pos + size > n:
+            return
+        yield mv[pos:pos+size]
+        pos += size
+
+
 def serialize_script_unit(unit):
     if isinstance(unit, int):
         if unit < 16:
@@ -296,22 +878,26 @@ def serialize_script_unit(unit):
             return from_int_to_byte(78)+encode(len(unit), 256, 4)[::-1]+unit
 
 
-if is_python2:
-    def serialize_script(script):
-        if json_is_base(script, 16):
-            return binascii.hexlify(serialize_script(json_changebase(script,
-                                    lambda x: binascii.unhexlify(x))))
-        return ''.join(map(serialize_script_unit, script))
-else:
-    def serialize_script(script):
-        if json_is_base(script, 16):
-            script_bin = json_unhexlify(script)
-            return safe_hexlify(serialize_script(script_bin))
-        else:
-            result = bytes()
-            for b in map(serialize_script_unit, script):
-                result += b if isinstance(b, bytes) else bytes(b, 'utf-8')
-            return result
+def _is_hex_script(script):
+    for unit in script:
+        if isinstance(unit, string_types):
+            if not RE_HEX_CHARS.match(unit):
+                return False
+        elif not (unit is None or isinstance(unit, int_types)):
+            return False
+    return True
+
+
+def serialize_script(script):
+    if _is_hex_script(script):
+        return safe_hexlify(bin_serialize_script(
+            [binascii.unhexlify(u) if isinstance(u, string_types) else u for u in script]))
+    return bin_serialize_script(script)
+
+
+def bin_serialize_script(script):
+    """[binary push data / opcode ints / None, ...] => binary script"""
+    return b''.join(map(serialize_script_unit, script))
 
 
 def mk_multisig_script(*args):  
@@ -325,53 +911,265 @@ def mk_multisig_script(*args):
 
 # Signing and verifying
 
+def _is_hex(s):
+    """Hex text (str, or unicode on python 2), as opposed to binary"""
+    return isinstance(s, string_types) and bool(RE_HEX_CHARS.match(s))
+
+
+def _bin_pubkey(pub):
+    return binascii.unhexlify(pub) if len(pub) in (66, 130) else pub
+
+
 def verify_tx_input(tx, i, script, sig, pub):
     """tx = scriptsig replaced by scriptPubKey"""
-    if RE_HEX_CHARS.match(tx):
+    if _is_hex(tx):
         tx = binascii.unhexlify(tx)
-    if RE_HEX_CHARS.match(script):
+    if _is_hex(script):
         script = binascii.unhexlify(script)
-    if not (RE_DER.match(sig) or RE_HEX_CHARS.match(sig)):
-        sig = safe_hexlify(sig)
-    hashcode = decode(sig[-2:], 16)
-    modtx = signature_form(tx, int(i), script, hashcode)
-    return ecdsa_tx_verify(modtx, sig, pub, hashcode)
+    if _is_hex(sig):
+        sig = binascii.unhexlify(sig)
+    if _is_hex(pub):
+        pub = binascii.unhexlify(pub)
+    return bin_verify_tx_input(tx, i, script, sig, pub)
+
+
+def bin_verify_tx_input(tx, i, script, sig, pub):
+    """Binary tx, scriptPubKey, DER sig (incl. hashcode) & pubkey => bool"""
+    hashcode = bytearray(sig[-1:])[0]
+    z = SighashCache(tx).sighash(i, script, hashcode)
+    return ecdsa_raw_verify(z, _bin_der_decode_sig(sig), pub)
+
+
+def verify_tx(tx, prevout_scripts, amounts=None):
+    """Verify every input => [bool, ...] per input
+
+    prevout_scripts are the spent scriptPubKeys in input order; amounts (in
+    satoshis) are needed for segwit inputs. Handles P2PKH, P2PK, bare and
+    P2SH multisig, P2WPKH and P2SH-P2WPKH; anything else verifies False.
+    All signatures are checked in one ecdsa_raw_verify_batch call."""
+    if _is_hex(tx):
+        tx = binascii.unhexlify(tx)
+    txobj = bin_deserialize(tx)
+    cache = SighashCache(txobj)
+    jobs, checks = [], []
+    for i, inp in enumerate(txobj["ins"]):
+        try:
+            prevout = prevout_scripts[i]
+            if _is_hex(prevout):
+                prevout = binascii.unhexlify(prevout)
+            # missing amounts only fail the segwit inputs that need them
+            amount = amounts[i] if amounts is not None and i < len(amounts) else None
+            checks.append(_verify_jobs(cache, i, inp, prevout, amount, jobs))
+        except (IndexError, ValueError, TypeError, KeyError):
+            checks.append(None)
+    ok = ecdsa_raw_verify_batch(jobs)
+    return [check is not None and check(ok) for check in checks]
+
+
+def _sig_job(z, sig, pub):
+    return z, _bin_der_decode_sig(sig), pub
+
+
+def _verify_jobs(cache, i, inp, prevout, amount, jobs):
+    """Append (z, vrs, pub) jobs for input i to jobs => check(results) -> bool"""
+    script = inp["script"]
+    witness = inp.get("witness") or []
+    if prevout[:2] == b'\xa9\x14' and prevout[-1:] == b'\x87' and len(prevout) == 23:
+        # P2SH: the last push is the redeem script, which must hash to the prevout
+        units = deserialize_script(script)
+        redeem = units[-1]
+        if bin_hash160(redeem) != prevout[2:22]:
+            return None
+        if redeem[:2] == b'\x00\x14' and len(redeem) == 22:
+            return _p2wpkh_jobs(cache, i, redeem, witness, amount, jobs)
+        return _multisig_jobs(cache, i, redeem, units[1:-1], jobs)
+    if prevout[:2] == b'\x00\x14' and len(prevout) == 22:
+        return _p2wpkh_jobs(cache, i, prevout, witness, amount, jobs)
+    if prevout[:3] == b'\x76\xa9\x14' and prevout[-2:] == b'\x88\xac' and len(prevout) == 25:
+        sig, pub = deserialize_script(script)
+        if bin_hash160(pub) != prevout[3:23]:
+            return None
+        return _single_job(cache.sighash(i, prevout, bytearray(sig[-1:])[0]), sig, pub, jobs)
+    if prevout[-1:] == b'\xac' and len(prevout) in (35, 67):
+        sig, = deserialize_script(script)
+        return _single_job(cache.sighash(i, prevout, bytearray(sig[-1:])[0]), sig, prevout[1:-1], jobs)
+    if prevout[-1:] == b'\xae':
+        return _multisig_jobs(cache, i, prevout, deserialize_script(script)[1:], jobs)
+    return None
+
+
+def _single_job(z, sig, pub, jobs):
+    k = len(jobs)
+    jobs.append(_sig_job(z, sig, pub))
+    return lambda ok: ok[k]
+
+
+def _p2wpkh_jobs(cache, i, program, witness, amount, jobs):
+    sig, pub = witness
+    if amount is None or bin_hash160(pub) != program[2:22]:
+        return None
+    script_code = b'\x76\xa9\x14' + program[2:22] + b'\x88\xac'
+    return _single_job(cache.segwit_sighash(i, script_code, amount, bytearray(sig[-1:])[0]),
+                       sig, pub, jobs)
+
+
+def _multisig_jobs(cache, i, redeem, sigs, jobs):
+    # every sig x pub pair goes into the batch; OP_CHECKMULTISIG's in-order
+    # matching is then replayed over the results
+    units = deserialize_script(redeem)
+    m, pubs = units[0], units[1:-2]
+    if units[-1] != 0xae or len(sigs) != m:
+        return None
+    base = len(jobs)
+    for sig in sigs:
+        z = cache.sighash(i, redeem, bytearray(sig[-1:])[0])
+        vrs = _bin_der_decode_sig(sig)
+        jobs.extend((z, vrs, pub) for pub in pubs)
+
+    def check(ok):
+        j = 0
+        for k in range(len(sigs)):
+            while j < len(pubs) and not ok[base + k * len(pubs) + j]:
+                j += 1
+            if j == len(pubs):
+                return False
+            j += 1
+        return True
+    return check
 
 
 def sign(tx, i, priv, hashcode=SIGHASH_ALL):
+    if _is_hex(tx):
+        return safe_hexlify(bin_sign(binascii.unhexlify(tx), i, priv, hashcode))
+    return bin_sign(tx, i, priv, hashcode)
+
+
+def bin_sign(tx, i, priv, hashcode=SIGHASH_ALL):
+    """Sign input i of binary tx (P2PKH) => binary tx"""
     i = int(i)
-    if (not is_python2 and isinstance(re, bytes)) or not RE_HEX_CHARS.match(tx):
-        return binascii.unhexlify(sign(safe_hexlify(tx), i, priv))
+    return bin_splice_scripts(tx, {i: _p2pkh_scriptsig(SighashCache(tx), i, priv, hashcode)})
+
+
+def _p2pkh_key(priv):
+    """priv => (hex priv, binary pubkey, P2PKH scriptPubKey)"""
     if len(priv) <= 33:
         priv = safe_hexlify(priv)
-    pub = privkey_to_pubkey(priv)
-    address = pubkey_to_address(pub)
-    signing_tx = signature_form(tx, i, mk_pubkey_script(address), hashcode)
-    sig = ecdsa_tx_sign(signing_tx, priv, hashcode)
-    txobj = deserialize(tx)
-    txobj["ins"][i]["script"] = serialize_script([sig, pub])
-    return serialize(txobj)
+    pub = _bin_pubkey(privkey_to_pubkey(priv))
+    return priv, pub, b'\x76\xa9\x14' + bin_hash160(pub) + b'\x88\xac'
+
+
+def _p2pkh_scriptsig(cache, i, priv, hashcode=SIGHASH_ALL):
+    priv, pub, script = _p2pkh_key(priv)
+    sig = _bin_sign_digest(cache.sighash(i, script, hashcode), priv, hashcode)
+    return bin_serialize_script([sig, pub])
+
 
+def _sign_job(job):
+    # module level so it pickles for the process pool
+    z, priv, pub, hashcode = job
+    return bin_serialize_script([_bin_sign_digest(z, priv, hashcode), pub])
 
-def signall(tx, priv):
+
+def signall(tx, priv, workers=None):
+    if _is_hex(tx):
+        return safe_hexlify(bin_signall(binascii.unhexlify(tx), priv, workers))
+    return bin_signall(tx, priv, workers)
+
+
+def bin_signall(tx, priv, workers=None):
+    """Sign every input (P2PKH) => binary tx
+
+    workers > 1 spreads the ECDSA signing over a process pool of that size;
+    signatures are deterministic (RFC6979) so the result is identical."""
     # if priv is a dictionary, assume format is { 'txinhash:txinidx' : privkey }
-    if isinstance(priv, dict):
-        for e, i in enumerate(deserialize(tx)["ins"]):
-            k = priv["%s:%d" % (i["outpoint"]["hash"], i["outpoint"]["index"])]
-            tx = sign(tx, e, k)
+    # other inputs' scripts are blanked when hashing, so one sighash cache
+    # over the unsigned tx serves every input
+    txobj = bin_deserialize(tx)
+    cache = SighashCache(txobj)
+    keys, jobs = {}, []
+    for e, inp in enumerate(txobj["ins"]):
+        if isinstance(priv, dict):
+            k = priv["%s:%d" % (safe_hexlify(inp["outpoint"]["hash"]), inp["outpoint"]["index"])]
+        else:
+            k = priv
+        if k not in keys:
+            keys[k] = _p2pkh_key(k)
+        hexpriv, pub, script = keys[k]
+        jobs.append((cache.sighash(e, script, SIGHASH_ALL), hexpriv, pub, SIGHASH_ALL))
+
+    if workers and workers > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            scripts = pool.map(_sign_job, jobs, max(1, len(jobs) // (4 * workers)))
+        finally:
+            pool.close()
+            pool.join()
     else:
-        for i in range(len(deserialize(tx)["ins"])):
-            tx = sign(tx, i, priv)
-    return tx
+        scripts = [_sign_job(job) for job in jobs]
+    return bin_splice_scripts(tx, dict(enumerate(scripts)))
 
 
 def multisign(tx, i, script, pk, hashcode=SIGHASH_ALL):
-    if RE_HEX_CHARS.match(tx):
+    if _is_hex(tx):
         tx = binascii.unhexlify(tx)
-    if RE_HEX_CHARS.match(script):
+    if _is_hex(script):
         script = binascii.unhexlify(script)
-    modtx = signature_form(tx, i, script, hashcode)
-    return ecdsa_tx_sign(modtx, pk, hashcode)
+    return safe_hexlify(bin_multisign(tx, i, script, pk, hashcode))
+
+
+def bin_multisign(tx, i, script, pk, hashcode=SIGHASH_ALL):
+    """Binary tx & script => binary DER sig w/ hashcode appended"""
+    return _bin_sign_digest(SighashCache(tx).sighash(i, script, hashcode), pk, hashcode)
+
+
+def segwit_sign(tx, i, priv, amount, hashcode=SIGHASH_ALL, p2sh=False):
+    if _is_hex(tx):
+        return safe_hexlify(bin_segwit_sign(binascii.unhexlify(tx), i, priv, amount, hashcode, p2sh))
+    return bin_segwit_sign(tx, i, priv, amount, hashcode, p2sh)
+
+
+def bin_segwit_sign(tx, i, priv, amount, hashcode=SIGHASH_ALL, p2sh=False):
+    """Sign P2WPKH (or P2SH-P2WPKH if p2sh) input i spending amount => binary tx"""
+    txobj = bin_deserialize(tx)
+    _p2wpkh_sign_obj(txobj, SighashCache(txobj), int(i), priv, amount, hashcode, p2sh)
+    return bin_serialize(txobj)
+
+
+def segwit_signall(tx, priv, amounts, p2sh=False):
+    if _is_hex(tx):
+        return safe_hexlify(bin_segwit_signall(binascii.unhexlify(tx), priv, amounts, p2sh))
+    return bin_segwit_signall(tx, priv, amounts, p2sh)
+
+
+def bin_segwit_signall(tx, priv, amounts, p2sh=False):
+    """Sign every input as P2WPKH (P2SH-P2WPKH if p2sh); amounts per input.
+    priv is a key or { 'txinhash:txinidx' : privkey } as for signall"""
+    txobj = bin_deserialize(tx)
+    cache = SighashCache(txobj)
+    for e, inp in enumerate(txobj["ins"]):
+        if isinstance(priv, dict):
+            k = priv["%s:%d" % (safe_hexlify(inp["outpoint"]["hash"]), inp["outpoint"]["index"])]
+        else:
+            k = priv
+        _p2wpkh_sign_obj(txobj, cache, e, k, amounts[e], SIGHASH_ALL, p2sh)
+    return bin_serialize(txobj)
+
+
+def _p2wpkh_sign_obj(txobj, cache, i, priv, amount, hashcode, p2sh):
+    priv, pub, script_code = _p2pkh_key(priv)
+    if len(pub) != 33:
+        raise ValueError("Segwit inputs require a compressed pubkey")
+    sig = _bin_sign_digest(cache.segwit_sighash(i, script_code, amount, hashcode), priv, hashcode)
+    for inp in txobj["ins"]:
+        inp.setdefault("witness", [])
+    txobj["ins"][i]["witness"] = [sig, pub]
+    if p2sh:
+        txobj["ins"][i]["script"] = b'\x16\x00\x14' + script_code[3:23]
+
+
+def _bin_sign_digest(z, pk, hashcode):
+    _, r, s = ecdsa_raw_sign(z, pk)
+    return bin_der_encode_sig(r, s, hashcode)
 
 
 def apply_multisignatures(*args):
@@ -379,16 +1177,131 @@ def apply_multisignatures(*args):
     tx, i, script = args[0], int(args[1]), args[2]
     sigs = args[3] if isinstance(args[3], list) else list(args[3:])
 
-    if isinstance(script, str) and RE_HEX_CHARS.match(script):
+    if _is_hex(script):
         script = binascii.unhexlify(script)
-    sigs = [binascii.unhexlify(x) if x[:2] == '30' else x for x in sigs]
-    if isinstance(tx, str) and RE_HEX_CHARS.match(tx):
-        tx = binascii.unhexlify(tx)
-        return safe_hexlify(apply_multisignatures(tx, i, script, sigs))
+    sigs = [binascii.unhexlify(x) if _is_hex(x) else x for x in sigs]
+    if _is_hex(tx):
+        return safe_hexlify(bin_apply_multisignatures(binascii.unhexlify(tx), i, script, sigs))
+    return bin_apply_multisignatures(tx, i, script, sigs)
 
-    txobj = deserialize(tx)
-    txobj["ins"][i]["script"] = serialize_script([None]+sigs+[script])
-    return serialize(txobj)
+
+def bin_apply_multisignatures(tx, i, script, sigs):
+    """Binary tx, redeem script & [sig, ...] => binary tx"""
+    return bin_splice_scripts(tx, {int(i): bin_serialize_script([None]+list(sigs)+[script])})
+
+
+# Multisig combining
+#
+# Which key a signature is by falls out of public key recovery: both
+# candidate keys come from one multiplication of R and one of G (they
+# differ only in the sign of the R term), and a dict of the redeem
+# script's keys as points names the signer. That is m recoveries in place
+# of up to m * n verifications, against one sighash per hashcode.
+
+def _recover_points(z, r, s):
+    """The two points (r, s) is a valid signature of digest z for (the
+    r + N case aside); [] if r isn't an x coordinate on the curve"""
+    alpha = (r * r * r + A * r + B) % P
+    beta = pow(alpha, (P + 1) // 4, P)
+    if (beta * beta - alpha) % P or not r % N or not s % N:
+        return []
+    rinv = inv(r, N)
+    sr = fast_multiply((r, beta), s * rinv % N)
+    zg = fast_multiply(G, hash_to_int(z) * rinv % N)
+    zg = (zg[0], (P - zg[1]) % P)
+    return [fast_add(sr, zg), fast_add((sr[0], (P - sr[1]) % P), zg)]
+
+
+class MultisigCombiner(object):
+    """Signatures for multisig (P2SH) input i of tx, each matched to its
+    key in the redeem script by public key recovery.
+
+    Signatures already in the input's scriptSig are picked up, so a
+    partially signed tx (see partial()) carries the state from one
+    cosigner to the next."""
+    __slots__ = ('_tx', '_hex', 'i', 'script', 'm', 'pubs', '_keys', '_cache', '_sighashes',
+                 '_sigs', '_seen')
+
+    def __init__(self, tx, i, script):
+        self._hex = _is_hex(tx)
+        self._tx = binascii.unhexlify(tx) if self._hex else tx
+        self.i = int(i)
+        self.script = binascii.unhexlify(script) if _is_hex(script) else script
+        units = deserialize_script(self.script)
+        if (len(units) < 4 or units[-1] != 0xae or not isinstance(units[0], int_types)
+                or not 1 <= units[0] <= len(units) - 3):
+            raise ValueError("Not a multisig script")
+        self.m, self.pubs = units[0], units[1:-2]
+        self._keys = dict((tuple(decode_pubkey(pub)), k) for k, pub in enumerate(self.pubs))
+        self._cache, self._sighashes = SighashCache(self._tx), {}
+        self._sigs = [None] * len(self.pubs)
+        self._seen = {}
+        units = deserialize_script(bin_deserialize(self._tx)["ins"][self.i]["script"])
+        if units and units[-1] == self.script:
+            for sig in units[1:-1]:
+                if sig:
+                    self.add(sig)
+
+    def add(self, sig):
+        """Add a signature (hex or binary) => index of the key it's by;
+        ValueError if it's by none of them"""
+        if _is_hex(sig):
+            sig = binascii.unhexlify(sig)
+        k = self._seen.get(sig)
+        if k is None:
+            r, s, hashcode = parse_der_sig(sig, strict=False)
+            if hashcode is None:
+                raise ValueError("Signature has no hashcode")
+            z = self._sighashes.get(hashcode)
+            if z is None:
+                z = self._sighashes[hashcode] = self._cache.sighash(self.i, self.script, hashcode)
+            for point in _recover_points(z, r, s):
+                k = self._keys.get(point)
+                if k is not None:
+                    break
+            else:
+                raise ValueError("Signature matches no key in the script")
+            self._seen[sig] = k
+        self._sigs[k] = sig
+        return k
+
+    def add_all(self, sigs):
+        return [self.add(sig) for sig in sigs]
+
+    @property
+    def count(self):
+        return sum(1 for sig in self._sigs if sig is not None)
+
+    @property
+    def complete(self):
+        return self.count >= self.m
+
+    @property
+    def signatures(self):
+        """Signatures (binary) in key order, at most m of them"""
+        return [sig for sig in self._sigs if sig is not None][:self.m]
+
+    def partial(self):
+        """tx with the signatures so far (hex if given hex)"""
+        tx = bin_apply_multisignatures(self._tx, self.i, self.script, self.signatures)
+        return safe_hexlify(tx) if self._hex else tx
+
+    def apply(self):
+        """Fully signed tx (hex if given hex); ValueError if under m sigs"""
+        if not self.complete:
+            raise ValueError("Have %d of %d signatures" % (self.count, self.m))
+        return self.partial()
+
+
+def combine_multisignatures(*args):
+    """apply_multisignatures with the sigs in any order (and any number of
+    extras): each is matched to its key, and the first m in redeem script
+    order go in. Sigs already in the scriptSig count too."""
+    tx, i, script = args[0], int(args[1]), args[2]
+    sigs = args[3] if isinstance(args[3], list) else list(args[3:])
+    combiner = MultisigCombiner(tx, i, script)
+    combiner.add_all(sigs)
+    return combiner.apply()
 
 
 def is_inp(arg):
@@ -467,34 +1380,183 @@ def mktx(*args, **kwargs):
 
 
 def select(unspent, value):
+    """Smallest single utxo covering value, else largest first. unspent is
+    a list, a UTXOPool or a UTXOSet (see select_coins for fee aware selection)"""
     value = int(value)
-    high = [u for u in unspent if u["value"] >= value]
-    high.sort(key=lambda u: u["value"])
-    low = [u for u in unspent if u["value"] < value]
-    low.sort(key=lambda u: -u["value"])
-    if len(high):
-        return [high[0]]
-    i, tv = 0, 0
-    while tv < value and i < len(low):
-        tv += low[i]["value"]
-        i += 1
+    if isinstance(unspent, UTXOPool) or hasattr(unspent, 'pool'):
+        pool = as_pool(unspent)
+        utxos, values = pool.utxos, pool.values
+    else:
+        utxos = sorted(unspent, key=lambda u: u["value"])
+        values = [u["value"] for u in utxos]
+    i = bisect_left(values, value)
+    if i < len(utxos):
+        return [utxos[i]]
+    j, tv = i, 0
+    while tv < value and j > 0:
+        j -= 1
+        tv += values[j]
     if tv < value:
         raise Exception("Not enough funds")
-    return low[:i]
+    return utxos[j:i][::-1]
+
+
+# Size & fee model
+#
+# Sizes are exact: scripts are counted byte for byte and a spend's size is
+# derived from its script type and signature / pubkey lengths, so fees can
+# be computed before anything is signed or serialized.
+
+MAX_SIG_SIZE = 72       # low-S DER signature + hashcode
+
+
+def _push_size(n):
+    """Bytes used by a script push of n bytes of data"""
+    return n + (1 if n < 76 else 2 if n < 256 else 3 if n < 65536 else 5)
+
+
+def spend_size(script_type, sig_size=MAX_SIG_SIZE, pub_size=33, m=1, n=1, p2sh=False):
+    """Size of the scriptSig & witness (incl. item count) spending an output
+    of script_type => (scriptsig bytes, witness bytes). SCRIPT_P2SH and
+    SCRIPT_P2WSH mean an m-of-n multisig redeem / witness script; p2sh
+    nests SCRIPT_P2WPKH / SCRIPT_P2WSH in P2SH."""
+    redeem = 3 + n * (1 + pub_size)
+    if script_type == SCRIPT_P2PKH:
+        return _push_size(sig_size) + _push_size(pub_size), 0
+    elif script_type == SCRIPT_P2PK:
+        return _push_size(sig_size), 0
+    elif script_type == SCRIPT_MULTISIG:
+        return 1 + m * _push_size(sig_size), 0
+    elif script_type == SCRIPT_P2SH:
+        return 1 + m * _push_size(sig_size) + _push_size(redeem), 0
+    elif script_type == SCRIPT_P2WPKH:
+        return (23 if p2sh else 0), 1 + 2 + sig_size + pub_size
+    elif script_type == SCRIPT_P2WSH:
+        witness = var_int_size(m + 2) + 1 + m * (1 + sig_size) + var_int_size(redeem) + redeem
+        return (35 if p2sh else 0), witness
+    raise ValueError("Can't size a spend of script type %r" % script_type)
+
+
+class TxSize(object):
+    """Exact size, weight & vsize of a tx, built up one input / output at a
+    time; nothing is serialized"""
+    __slots__ = ('n_ins', 'n_outs', '_ins', '_outs', '_witness', '_segwit')
+
+    def __init__(self):
+        self.n_ins = self.n_outs = 0
+        self._ins = self._outs = self._witness = 0
+        self._segwit = False
+
+    @classmethod
+    def from_txobj(cls, txobj, spend=None):
+        """Size a txobj (hex or binary). Inputs with neither scriptSig nor
+        witness are counted as spend, a (scriptsig, witness) size pair
+        (default: P2PKH with a compressed key)"""
+        if isinstance(txobj, string_or_bytes_types):
+            txobj = deserialize(txobj)
+        div = 2 if _is_hex_txobj(txobj) else 1
+        spend = spend or spend_size(SCRIPT_P2PKH)
+        sizer = cls()
+        for inp in txobj["ins"]:
+            witness = inp.get("witness") or []
+            if not inp["script"] and not witness:
+                sizer.add_input(*spend)
+                continue
+            sizer.add_input(len(inp["script"]) // div, (var_int_size(len(witness)) + sum(
+                var_int_size(len(w) // div) + len(w) // div for w in witness)) if witness else 0)
+        for out in txobj["outs"]:
+            sizer.add_output(len(out["script"]) // div)
+        return sizer
+
+    def copy(self):
+        new = TxSize()
+        new.n_ins, new.n_outs, new._ins, new._outs = self.n_ins, self.n_outs, self._ins, self._outs
+        new._witness, new._segwit = self._witness, self._segwit
+        return new
+
+    def add_input(self, scriptsig_size=0, witness_size=0):
+        self.n_ins += 1
+        self._ins += 40 + var_int_size(scriptsig_size) + scriptsig_size
+        self._witness += witness_size or 1        # an empty witness is a 0 item count
+        self._segwit = self._segwit or witness_size > 0
+        return self
+
+    def add_spend(self, script_type, **kwargs):
+        """Add an input spending script_type (see spend_size)"""
+        return self.add_input(*spend_size(script_type, **kwargs))
+
+    def add_output(self, script_size=25):
+        self.n_outs += 1
+        self._outs += 8 + var_int_size(script_size) + script_size
+        return self
+
+    @property
+    def base_size(self):
+        """Size without witness data"""
+        return 8 + var_int_size(self.n_ins) + var_int_size(self.n_outs) + self._ins + self._outs
+
+    @property
+    def size(self):
+        return self.base_size + (2 + self._witness if self._segwit else 0)
+
+    @property
+    def weight(self):
+        return 3 * self.base_size + self.size
+
+    @property
+    def vsize(self):
+        return (self.weight + 3) // 4
+
+    def fee(self, fee_rate):
+        """Fee for the vsize at fee_rate sat/byte, rounded up"""
+        return _fee(self.vsize, fee_rate)
+
+
+def _output_script_size(o):
+    if "script" in o:
+        script = o["script"]
+        return len(script) // 2 if _is_hex(script) else len(script)
+    return len(address_to_script(o["address"])) // 2
+
+
+def _fund(source, outputs, value, change, fee, fee_rate, spend_type):
+    """Inputs from source (a UTXOPool / UTXOSet) paying value + fee, and
+    with fee_rate the fee for the tx's exact size"""
+    if fee_rate is None:
+        return select(source, value + fee)
+    sizer = TxSize()
+    for o in outputs:
+        sizer.add_output(_output_script_size(o))
+    scriptsig, witness = spend_size(spend_type)
+    change_script = _output_script_size({"address": change})
+    ins, _ = select_coins(source, value + fee, fee_rate,
+                          base_size=sizer.vsize + 2 + (1 if witness else 0),
+                          input_size=40 + var_int_size(scriptsig) + scriptsig + (witness + 3) // 4,
+                          change_size=8 + var_int_size(change_script) + change_script)
+    return ins
 
 
 # Only takes inputs of the form { "output": blah, "value": foo }
 def mksend(*args, **kwargs):
+    """mksend(ins..., outs..., change, fee[, fee_rate=sat/byte, spend_type=SCRIPT_P2PKH])
+
+    With fee_rate the fee is at least fee_rate times the exact vsize of the
+    signed tx, inputs being sized as spend_type spends; change is added
+    when it's above dust after paying for itself. In place of the inputs a
+    UTXOPool or UTXOSet may be given to select them from."""
+    fee_rate = kwargs.pop('fee_rate', None)
+    spend_type = kwargs.pop('spend_type', SCRIPT_P2PKH)
     argz, change, fee = args[:-2], args[-2], int(args[-1])
-    ins, outs = [], []
+    ins, outs, source = [], [], None
     for arg in argz:
-        if isinstance(arg, list):
+        if isinstance(arg, UTXOPool) or hasattr(arg, 'pool'):
+            source = arg
+        elif isinstance(arg, list):
             for a in arg:
                 (ins if is_inp(a) else outs).append(a)
         else:
             (ins if is_inp(arg) else outs).append(arg)
 
-    isum = sum([i["value"] for i in ins])
     osum, outputs2 = 0, []
     for o in outs:
         if isinstance(o, string_types):
@@ -505,11 +1567,25 @@ def mksend(*args, **kwargs):
             o2 = o
         outputs2.append(o2)
         osum += o2["value"]
+    if source is not None:
+        ins = ins + _fund(source, outputs2, osum - sum(i["value"] for i in ins),
+                          change, fee, fee_rate, spend_type)
+    isum = sum([i["value"] for i in ins])
+
+    change_fee = fee
+    if fee_rate is not None:
+        sizer, spend = TxSize(), spend_size(spend_type)
+        for _ in ins:
+            sizer.add_input(*spend)
+        for o in outputs2:
+            sizer.add_output(_output_script_size(o))
+        fee = max(fee, sizer.fee(fee_rate))
+        change_fee = max(fee, sizer.add_output(_output_script_size({"address": change})).fee(fee_rate))
 
     if isum < osum+fee:
         raise Exception("Not enough money")
-    elif isum > osum+fee+5430:
-        outputs2 += [{"address": change, "value": isum-osum-fee}]
+    elif isum > osum+change_fee+5430:
+        outputs2 += [{"address": change, "value": isum-osum-change_fee}]
 
     return mktx(ins, outputs2, **kwargs)
 
@@ -594,78 +1670,310 @@ def get_outpoints(rawtx, i=None):
 
 extract_tx_outpoints = get_outpoints
 
-# https://github.com/richardkiss/pycoin/blob/master/tests/bc_transaction_test.py#L177-L210
-# def check_transaction(tx):
-#     if isinstance(tx, string_types):
-#         if RE_HEX_CHARS.match(tx):
-#             txo = json_unhexlify(deserialize(tx))
-#         else:
-#             txo = deserialize(tx)
-#     elif isinstance(tx, dict):
-#         txo = json_unhexlify(tx) if json_is_base(tx, 16) else tx
-#     else: raise Exception("JSON must be base16)")  # Dict with base256 *values*
-#
-#     if 'ins' not in txo:
-#         raise Exception("TxIns missing")
-#     if 'outs' not in txo:
-#         raise Exception("TxOuts missing")
-#
-#     #Size limits
-#     MAX_BLOCK_SIZE = 1000000
-#     if len(serialize(txo)) > MAX_BLOCK_SIZE:
-#         raise Exception("size exceeds MAX BLOCK SIZE: %d" % MAX_BLOCK_SIZE)
-#
-#     #Check for negative or overflow output values
-#     MAX_MONEY = 21000000 * 100000000
-#     nValueOut = 0
-#     for i, txout in enumerate(txo['outs']):
-#         if not (0 <= txout['value'] <= MAX_MONEY):
-#             raise Exception("TxOut %d: value negative or out of range" % i)
-#         nValueOut += txout['value']
-#         if nValueOut > MAX_MONEY:
-#             raise Exception("TxOuts' total out of range")
+# Transaction sanity checks
 #
-#     #Check for duplicate inputs
-#     INS = txo['ins']
-#     OUTPOINTS = multiaccess(INS, 'outpoint')
-#     if len(set(("%s:%d" % (x["hash"], x["index"]) for x in OUTPOINTS))) < len(txo["ins"]):
-#         raise Exception("duplicate inputs")
-#
-#     #Check is coinbase
-#     NULL = (b'00'*32, b'\0'*32, 0, 0x80)
-#     NEG_ONE = (-1, 0x81, 0xffffffff, b"ff"*4)
-#     if len(INS) == 1 and (OUTPOINTS[0]["hash"] in NULL) and (OUTPOINTS[0]["index"] in NEG_ONE):
-#         if len(INS[0]["script"]) not in xrange(2, 101):    # script's len 2<=len<=100
-#             raise Exception("bad coinbase script size")
-#
-#     #Check ins aren't missing
-#     if not len(INS):        # if len(INS) == 0
-#         raise Exception("prevout is null")
+# Bitcoin Core's CheckTransaction (plus the deserializer's own checks) in
+# one struct scan of the raw tx: nothing is decoded into objects, no
+# script is run and no signature touched, so junk can be thrown out
+# before it reaches the signature workers. Failures are reported with
+# Core's reject reasons.
+
+MAX_BLOCK_WEIGHT = 4000000
+MAX_MONEY = 21000000 * 100000000
+NULL_OUTPOINT = b'\x00' * 32 + b'\xff' * 4
+
+_unpack_i64 = struct.Struct('<q').unpack_from
+_MALFORMED = ('tx-truncated', 'tx-trailing-data', 'tx-superfluous-witness')
+
+
+def _check_tx_scan(tx, segwit):
+    """Reject reason for binary tx read with / without BIP144 framing, or None"""
+    try:
+        n_in, pos = read_var_int(tx, 6 if segwit else 4)
+        if n_in > len(tx) // 41:
+            return 'tx-truncated'
+        outpoints, cb_size = [], 0
+        for _ in range(n_in):
+            outpoints.append(tx[pos:pos+36])
+            size, spos = read_var_int(tx, pos + 36)
+            cb_size, pos = size, spos + size + 4
+        n_out, pos = read_var_int(tx, pos)
+        if n_out > len(tx) // 9:
+            return 'tx-truncated'
+        values = []
+        for _ in range(n_out):
+            values.append(_unpack_i64(tx, pos)[0])
+            size, spos = read_var_int(tx, pos + 8)
+            pos = spos + size
+        stripped = pos + 4 - (2 if segwit else 0)
+        if segwit:
+            witnessed = False
+            for _ in range(n_in):
+                n, pos = read_var_int(tx, pos)
+                witnessed = witnessed or n > 0
+                for _ in range(n):
+                    size, pos = read_var_int(tx, pos)
+                    pos += size
+            if not witnessed:
+                return 'tx-superfluous-witness'
+    except struct.error:
+        return 'tx-truncated'
+    if pos + 4 != len(tx):
+        return 'tx-truncated' if pos + 4 > len(tx) else 'tx-trailing-data'
+
+    if not n_in:
+        return 'bad-txns-vin-empty'
+    if not n_out:
+        return 'bad-txns-vout-empty'
+    if stripped * 4 > MAX_BLOCK_WEIGHT:
+        return 'bad-txns-oversize'
+    total = 0
+    for value in values:
+        if value < 0:
+            return 'bad-txns-vout-negative'
+        if value > MAX_MONEY:
+            return 'bad-txns-vout-toolarge'
+        total += value
+        if total > MAX_MONEY:
+            return 'bad-txns-txouttotal-toolarge'
+    unique = set(outpoints)
+    if len(unique) != n_in:
+        return 'bad-txns-inputs-duplicate'
+    if n_in == 1 and outpoints[0] == NULL_OUTPOINT:
+        if not 2 <= cb_size <= 100:
+            return 'bad-cb-length'
+    elif NULL_OUTPOINT in unique:
+        return 'bad-txns-prevout-null'
+    return None
+
+
+def _tx_bytes(tx):
+    """Hex / binary tx, txobj, Tx or TxView => binary tx (bytes)"""
+    if _is_hex(tx):
+        tx = binascii.unhexlify(tx)
+    elif isinstance(tx, dict):
+        tx = bin_serialize(_unhexlify_txobj(tx) if _is_hex_txobj(tx) else tx)
+    elif hasattr(tx, 'serialize'):
+        tx = tx.serialize()
+    if isinstance(tx, memoryview):
+        return tx.tobytes()
+    return tx if isinstance(tx, bytes) else bytes(tx)
+
+
+def _check_tx_reason(tx):
+    tx = _tx_bytes(tx)
+    if tx[4:6] != b'\x00\x01':
+        return _check_tx_scan(tx, False)
+    reason = _check_tx_scan(tx, True)
+    if reason in _MALFORMED:
+        # could be a tx with no inputs and one output, which reads as a marker
+        legacy = _check_tx_scan(tx, False)
+        if legacy not in _MALFORMED:
+            return legacy
+    return reason
+
+
+def check_transaction(tx):
+    """Context free consensus checks on a tx (hex, binary, txobj, Tx or
+    TxView) => True; raises ValueError with the reject reason"""
+    reason = _check_tx_reason(tx)
+    if reason is not None:
+        raise ValueError(reason)
+    return True
+
+
+def check_transactions(txs):
+    """Batch check_transaction => [None or reject reason, ...] per tx;
+    txs that can't be read at all are 'tx-malformed'"""
+    reasons = []
+    for tx in txs:
+        try:
+            reasons.append(_check_tx_reason(tx))
+        except (ValueError, TypeError, KeyError, struct.error, binascii.Error):
+            reasons.append('tx-malformed')
+    return reasons
+
+
+# Standardness
 #
-#     return True
+# Bitcoin Core's relay policy (IsStandardTx, AreInputsStandard and the
+# sigop limit) as a prefilter: every scriptSig and scriptPubKey is read
+# once, through deserialize_script, for its sigop counts and whether it
+# is push only, so a tx can be turned away before any EC work is spent
+# on it. Each failure is a (reason, index) pair, index being the input
+# or output concerned (None for the tx as a whole).
+
+MAX_STANDARD_TX_WEIGHT = 400000
+MAX_STANDARD_TX_SIGOPS = 4000       # Core's 16000 sigop cost, without witness scaling
+MAX_P2SH_SIGOPS = 15
+MAX_STANDARD_SCRIPTSIG_SIZE = 1650
+MAX_OP_RETURN_RELAY = 83
+DUST_RELAY_FEE = 3                  # sat/vbyte
+
+
+def _script_info(script):
+    """Binary script => (sigops, accurate sigops, push only, last push)"""
+    sigops = accurate = 0
+    push_only, last, prev = True, None, None
+    for unit in deserialize_script(script):
+        # opcodes come out as ints > 16, small number pushes as -1..16
+        if isinstance(unit, int_types) and unit > 16:
+            push_only = False
+            if unit == 0xac or unit == 0xad:
+                sigops += 1
+                accurate += 1
+            elif unit == 0xae or unit == 0xaf:
+                sigops += 20
+                accurate += prev if isinstance(prev, int_types) and 1 <= prev <= 16 else 20
+        else:
+            last = unit
+        prev = unit
+    return sigops, accurate, push_only, last
+
+
+def count_sigops(script, accurate=False):
+    """Sigops in script (hex or binary); CHECKMULTISIGs count 20 unless
+    accurate, when a preceding OP_1..OP_16 gives the key count"""
+    if _is_hex(script):
+        script = binascii.unhexlify(script)
+    return _script_info(script)[1 if accurate else 0]
+
+
+def dust_threshold(script, fee_rate=DUST_RELAY_FEE):
+    """Smallest output value paying script (binary) that isn't dust: the
+    cost at fee_rate of creating and then spending the output"""
+    if script[:1] == b'\x6a' or len(script) > 10000:
+        return 0
+    size = 8 + var_int_size(len(script)) + len(script)
+    witness = classify_script(script)[0] in (SCRIPT_P2WPKH, SCRIPT_P2WSH, SCRIPT_WITNESS_UNKNOWN)
+    return (size + (67 if witness else 148)) * fee_rate
+
+
+def tx_sigops(tx, prevout_scripts=None):
+    """=> (legacy sigops, P2SH sigops) of tx; P2SH sigops need the spent
+    scriptPubKeys (hex or binary, in input order)"""
+    txobj = bin_deserialize(_tx_bytes(tx))
+    legacy = sum(_script_info(inp["script"])[0] for inp in txobj["ins"])
+    legacy += sum(_script_info(out["script"])[0] for out in txobj["outs"])
+    p2sh = 0
+    for i, inp in enumerate(txobj["ins"]):
+        prevout = prevout_scripts[i] if prevout_scripts is not None else b''
+        if _is_hex(prevout):
+            prevout = binascii.unhexlify(prevout)
+        if classify_script(prevout)[0] == SCRIPT_P2SH:
+            _, _, push_only, redeem = _script_info(inp["script"])
+            if push_only and isinstance(redeem, bytes):
+                p2sh += _script_info(redeem)[1]
+    return legacy, p2sh
+
+
+def standardness(tx, prevout_scripts=None):
+    """Relay policy checks on tx (hex, binary, txobj, Tx or TxView) =>
+    [(reason, index), ...], empty if standard. With prevout_scripts the
+    inputs are checked too (AreInputsStandard, P2SH sigops)."""
+    btx = _tx_bytes(tx)
+    txobj = bin_deserialize(btx)
+    ins, outs = txobj["ins"], txobj["outs"]
+    reasons = []
+    if not 1 <= txobj["version"] <= 2:
+        reasons.append(('version', None))
+    stripped = 8 + var_int_size(len(ins)) + var_int_size(len(outs))
+    stripped += sum(40 + var_int_size(len(i["script"])) + len(i["script"]) for i in ins)
+    stripped += sum(8 + var_int_size(len(o["script"])) + len(o["script"]) for o in outs)
+    if 3 * stripped + len(btx) > MAX_STANDARD_TX_WEIGHT:
+        reasons.append(('tx-size', None))
+
+    sigops = 0
+    for k, inp in enumerate(ins):
+        script = inp["script"]
+        n, _, push_only, redeem = _script_info(script)
+        sigops += n
+        if len(script) > MAX_STANDARD_SCRIPTSIG_SIZE:
+            reasons.append(('scriptsig-size', k))
+        if not push_only:
+            reasons.append(('scriptsig-not-pushonly', k))
+        if prevout_scripts is None:
+            continue
+        prevout = prevout_scripts[k]
+        if _is_hex(prevout):
+            prevout = binascii.unhexlify(prevout)
+        t = classify_script(prevout)[0]
+        if t == SCRIPT_NONSTANDARD:
+            reasons.append(('bad-txns-nonstandard-inputs', k))
+        elif t == SCRIPT_P2SH:
+            p2sh = _script_info(redeem)[1] if push_only and isinstance(redeem, bytes) else 0
+            if p2sh > MAX_P2SH_SIGOPS:
+                reasons.append(('bad-txns-nonstandard-inputs', k))
+            sigops += p2sh
+
+    op_returns = 0
+    for k, out in enumerate(outs):
+        script = out["script"]
+        sigops += _script_info(script)[0]
+        t, payload = classify_script(script)
+        if t == SCRIPT_NULL_DATA:
+            op_returns += 1
+            if len(script) > MAX_OP_RETURN_RELAY or not _script_info(payload.tobytes())[2]:
+                reasons.append(('scriptpubkey', k))
+        elif t == SCRIPT_NONSTANDARD:
+            reasons.append(('scriptpubkey', k))
+        elif t == SCRIPT_MULTISIG:
+            m, n = bytearray(script[:1])[0] - 80, bytearray(script[-2:-1])[0] - 80
+            if not 1 <= m <= n <= 3:
+                reasons.append(('scriptpubkey', k))
+        if t != SCRIPT_NULL_DATA and out["value"] < dust_threshold(script):
+            reasons.append(('dust', k))
+    if op_returns > 1:
+        reasons.append(('multi-op-return', None))
+    if sigops > MAX_STANDARD_TX_SIGOPS:
+        reasons.append(('bad-txns-too-many-sigops', None))
+    return reasons
+
+
+def prefilter_txs(txs, prevout_scripts=None):
+    """check_transaction then standardness for each tx => [[(reason,
+    index), ...], ...]; an empty list means the tx may go on to signature
+    checks. prevout_scripts is a list (per tx) of spent scriptPubKeys."""
+    results = []
+    for k, tx in enumerate(txs):
+        try:
+            reason = _check_tx_reason(tx)
+            if reason is not None:
+                results.append([(reason, None)])
+            else:
+                results.append(standardness(tx, prevout_scripts[k] if prevout_scripts else None))
+        except (ValueError, TypeError, KeyError, struct.error, binascii.Error):
+            results.append([('tx-malformed', None)])
+    return results
+
+
+def verify_txs(txs, prevout_scripts, amounts=None):
+    """verify_tx over a batch, signatures only being checked for txs that
+    pass prefilter_txs => [(reasons, [bool per input] or None), ...]"""
+    out = []
+    for k, reasons in enumerate(prefilter_txs(txs, prevout_scripts)):
+        if reasons:
+            out.append((reasons, None))
+        else:
+            out.append(([], verify_tx(_tx_bytes(txs[k]), prevout_scripts[k],
+                                      amounts[k] if amounts is not None else None)))
+    return out
+
 
 def estimate_tx_size(rawtx):
-    # Estimate size of Tx in bytes
-    if isinstance(rawtx, basestring) and RE_HEX_CHARS.match(rawtx):
-        return estimate_tx_size(deserialize(rawtx))
-    outs = rawtx.get("outs", [])
-    ins = rawtx.get("ins", [])
-    return (len(ins) or 1) * 148 + (34 * len(outs)) + 10
+    """vsize in bytes of rawtx once signed; unsigned inputs are counted as
+    P2PKH spends with a compressed key (see TxSize for other spends)"""
+    return TxSize.from_txobj(rawtx).vsize
 
 
 # DER signature related
 
 def deserialize_der(sig):
     """Deserialize DER signature => (r, s, hashcode)"""
-    sig = bytes(bytearray.fromhex(sig)) if RE_HEX_CHARS.match(sig) else bytes(bytearray(sig))
-    totallen = decode(sig[1], 256) + 2
-    rlen = decode(sig[3], 256)
-    slen = decode(sig[5+rlen], 256)
-    sighashlen = len(sig) - totallen
-    r = decode(sig[4:4+rlen], 256)
-    s = decode(sig[6+rlen:6+slen+rlen], 256)
-    sighash = decode(sig[6+rlen+slen:], 256)
-    return r, s, sighash
+    if _is_hex(sig):
+        sig = binascii.unhexlify(sig)
+    r, s, hashcode = parse_der_sig(sig, strict=False)
+    return r, s, hashcode or 0
 
 
 der_deserialize = deserialize_der
@@ -677,25 +1985,28 @@ def der_extract_rs(sig):
 
 
 def is_der(sig):
-    if not isinstance(sig, string_types):
+    """Hex or binary script item framed as a DER signature?"""
+    if not isinstance(sig, string_or_bytes_types + (bytearray, memoryview)):
+        return False
+    if _is_hex(sig):
+        if len(sig) < 16 or sig[:2] != '30':
+            return False
+        sig = binascii.unhexlify(sig[:len(sig) & ~1])
+    try:
+        parse_der_sig(sig, strict=False)
+        return True
+    except (ValueError, struct.error):
         return False
-    return bool(RE_DER.match(sig))
 
 
 def der_extract(tx):
     """Extract DERs from a Tx Object"""
     if isinstance(tx, string_types) and RE_TXHEX.match(tx):
         tx = deserialize(tx)
-    nin = len(tx.get("ins"))
     ins = tx.get("ins")
-    scripts, ders = [], []
-    for inp in ins:
-        scripts.append(inp.get("script"))
-    for scr in scripts:
-        descr = deserialize_script(scr)
-        der = filter(lambda s: is_der(s), descr)
-        ders.extend(der)
-    return ders if nin > 1 else ders[0] if nin == 1 else []
+    ders = [item for inp in ins for item in deserialize_script(inp.get("script"))
+            if isinstance(item, string_or_bytes_types) and is_der(item)]
+    return ders if len(ins) > 1 else ders[0] if len(ins) == 1 else []
 
 
 get_tx_sigs = extract_ders = der_extract
@@ -0,0 +1,896 @@
+#!/usr/bin/python
+import binascii
+import hashlib
+import struct
+import weakref
+from array import array
+from itertools import chain
+
+from bitcoin.main import num_to_var_int, bin_hash160
+from bitcoin.pyspecials import safe_hexlify, as_buffer
+from bitcoin.transaction import (serialize_fields, read_var_int, bin_splice_scripts, bin_strip_witness,
+                                 classify_script, SCRIPT_P2PKH, SCRIPT_P2SH, SCRIPT_P2WPKH,
+                                 SCRIPT_P2PK, _is_hex_txobj, _unhexlify_txobj,
+                                 script_pushes, parse_der_sig)
+
+# Typed transaction model
+#
+# Tx / TxIn / TxOut / OutPoint use __slots__ and are parsed straight off a
+# memoryview with struct.unpack_from. Scripts and prevout hashes stay as
+# views into the original buffer until they are first read. TxView goes one
+# step further and only records field offsets.
+
+_u8 = struct.Struct('<B').unpack_from
+_u32 = struct.Struct('<I').unpack_from
+_u64 = struct.Struct('<Q').unpack_from
+_pack_u32 = struct.Struct('<I').pack
+_pack_u64 = struct.Struct('<Q').pack
+
+
+def _tobytes(b):
+    return b.tobytes() if isinstance(b, memoryview) else b
+
+
+# A Tx memoises its serialization & txid. Every field setter, and every
+# change to an ins / outs / witness list, calls _changed(), which follows
+# the _owner links (OutPoint -> TxIn -> Tx, TxOut -> Tx) up to the Tx and
+# drops that Tx's cache only. An item usually has one owner, held as a weak
+# reference; one that is put in several Txs gets a WeakSet of them
+# instead, and a list disowns the items taken out of it. The links are weak, so they make no reference cycles and a parsed
+# Tx (and the buffer its fields view) is freed once it is dropped.
+
+class _Owned(object):
+    __slots__ = ('_owner', '__weakref__')
+
+    def _changed(self):
+        link = self._owner
+        if isinstance(link, weakref.ref):
+            owner = link()
+            if owner is not None:
+                owner._changed()
+        elif link is not None:
+            for owner in list(link):
+                owner._changed()
+
+
+def _adopt(item, ref):
+    """Add the object ref points to to the owners of item (if it is a tx
+    part)"""
+    if isinstance(item, _Owned) and ref is not None:
+        link = item._owner
+        if link is None or link is ref:
+            item._owner = ref
+        elif isinstance(link, weakref.ref):
+            first = link()
+            if first is None:
+                item._owner = ref
+            elif first is not ref():
+                item._owner = weakref.WeakSet((first, ref()))
+        else:
+            link.add(ref())
+    return item
+
+
+def _disown(item, ref):
+    """Remove the object ref points to from the owners of item"""
+    if isinstance(item, _Owned) and ref is not None:
+        link, owner = item._owner, ref()
+        if isinstance(link, weakref.ref):
+            if link() is owner:
+                item._owner = None
+        elif link is not None and owner is not None:
+            link.discard(owner)
+
+
+class OutPoint(_Owned):
+    """Previous output reference; hash is in txid (display) byte order"""
+    __slots__ = ('_hash', '_index')
+
+    def __init__(self, hash, index):
+        self._hash = hash[::-1]
+        self._index = index
+        self._owner = None
+
+    @classmethod
+    def _from_wire(cls, wire_hash, index, ref=None):
+        o = cls.__new__(cls)
+        o._hash = wire_hash
+        o._index = index
+        o._owner = ref
+        return o
+
+    @property
+    def hash(self):
+        return _tobytes(self._hash)[::-1]
+
+    @hash.setter
+    def hash(self, value):
+        self._hash = value[::-1]
+        self._changed()
+
+    @property
+    def index(self):
+        return self._index
+
+    @index.setter
+    def index(self, value):
+        self._index = value
+        self._changed()
+
+    @property
+    def txid(self):
+        return safe_hexlify(self.hash)
+
+    def serialize(self):
+        return _tobytes(self._hash) + _pack_u32(self._index)
+
+    def __eq__(self, other):
+        return isinstance(other, OutPoint) and self._index == other._index and \
+            _tobytes(self._hash) == _tobytes(other._hash)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((_tobytes(self._hash), self._index))
+
+    def __repr__(self):
+        return "OutPoint(%s:%d)" % (self.txid, self._index)
+
+
+class TxIn(_Owned):
+    __slots__ = ('_outpoint', '_script', '_sequence', '_witness')
+
+    def __init__(self, outpoint, script=b'', sequence=0xffffffff, witness=None):
+        self._owner = None
+        self._outpoint = _adopt(outpoint, weakref.ref(self))
+        self._script = script
+        self._sequence = sequence
+        self._witness = _Items(witness or (), weakref.ref(self))
+
+    @property
+    def outpoint(self):
+        return self._outpoint
+
+    @outpoint.setter
+    def outpoint(self, value):
+        ref = weakref.ref(self)
+        _disown(self._outpoint, ref)
+        self._outpoint = _adopt(value, ref)
+        self._changed()
+
+    @property
+    def script(self):
+        s = self._script
+        if isinstance(s, memoryview):
+            s = self._script = s.tobytes()
+        return s
+
+    @script.setter
+    def script(self, value):
+        self._script = value
+        self._changed()
+
+    @property
+    def sequence(self):
+        return self._sequence
+
+    @sequence.setter
+    def sequence(self, value):
+        self._sequence = value
+        self._changed()
+
+    @property
+    def witness(self):
+        """BIP144 witness stack, a list of binary items (empty if none)"""
+        w = self._witness
+        for j, item in enumerate(w):
+            if isinstance(item, memoryview):
+                list.__setitem__(w, j, item.tobytes())
+        return w
+
+    @witness.setter
+    def witness(self, value):
+        self._witness._disown_all()
+        self._witness = _Items(value or (), weakref.ref(self))
+        self._changed()
+
+    def serialize(self):
+        """The input as in the txid serialization; the witness is not included"""
+        script = _tobytes(self._script)
+        return self._outpoint.serialize() + num_to_var_int(len(script)) + script + \
+            _pack_u32(self._sequence)
+
+    def __repr__(self):
+        return "TxIn(%r, script=%s, sequence=%d)" % (
+            self._outpoint, safe_hexlify(self.script), self._sequence)
+
+
+class TxOut(_Owned):
+    __slots__ = ('_value', '_script')
+
+    def __init__(self, value, script=b''):
+        self._value = value
+        self._script = script
+        self._owner = None
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        self._changed()
+
+    @property
+    def script(self):
+        s = self._script
+        if isinstance(s, memoryview):
+            s = self._script = s.tobytes()
+        return s
+
+    @script.setter
+    def script(self, value):
+        self._script = value
+        self._changed()
+
+    def serialize(self):
+        script = _tobytes(self._script)
+        return _pack_u64(self._value) + num_to_var_int(len(script)) + script
+
+    def __repr__(self):
+        return "TxOut(%d, script=%s)" % (self._value, safe_hexlify(self.script))
+
+
+class _Items(list):
+    """Tx.ins / Tx.outs / TxIn.witness: a list that adopts the items put in
+    it and tells its owner when it changes"""
+    __slots__ = ('_owner',)
+
+    def __init__(self, items=(), ref=None):
+        list.__init__(self, items)
+        self._owner = ref
+        for item in self:
+            _adopt(item, ref)
+
+    def _disown_all(self):
+        for item in self:
+            _disown(item, self._owner)
+
+    def _changed(self):
+        ref = self._owner
+        if ref is not None:
+            owner = ref()
+            if owner is not None:
+                owner._changed()
+
+
+# list methods => position of the argument they add items from, and
+# whether it is a single item (False), a sequence (True) or either (None)
+_ADDERS = {'append': (0, False), 'insert': (1, False), 'extend': (0, True),
+           '__iadd__': (0, True), '__setslice__': (2, True), '__setitem__': (1, None)}
+
+
+# list methods that may take items out
+_REMOVERS = frozenset(['__setitem__', '__delitem__', '__setslice__', '__delslice__',
+                       '__imul__', 'pop', 'remove', 'clear'])
+
+
+def _mutator(name):
+    method = getattr(list, name)
+    arg, many = _ADDERS.get(name, (None, None))
+    removes = name in _REMOVERS
+
+    def mutate(self, *args, **kwargs):
+        before = list(self) if removes else ()
+        if arg is not None:
+            ref, new = self._owner, args[arg]
+            if many or (many is None and isinstance(args[0], slice)):
+                new = list(new)
+                args = args[:arg] + (new,) + args[arg+1:]
+                for item in new:
+                    _adopt(item, ref)
+            else:
+                _adopt(new, ref)
+        result = method(self, *args, **kwargs)
+        if before:
+            kept = set(map(id, self))
+            for item in before:
+                if id(item) not in kept:
+                    _disown(item, self._owner)
+        self._changed()
+        return result
+    mutate.__name__ = name
+    return mutate
+
+
+for _name in ('__setitem__', '__delitem__', '__setslice__', '__delslice__', '__iadd__',
+              '__imul__', 'append', 'extend', 'insert', 'pop', 'remove', 'reverse', 'sort',
+              'clear'):
+    if hasattr(list, _name):
+        setattr(_Items, _name, _mutator(_name))
+del _name
+
+
+class Tx(object):
+    """Mutable transaction. The serialization & txid are memoised and
+    recomputed only after a change to the tx since"""
+    __slots__ = ('_version', '_ins', '_outs', '_locktime', '_raw', '_bin_txid', '__weakref__')
+
+    def __init__(self, version=1, ins=None, outs=None, locktime=0):
+        self._version = version
+        self._ins = _Items(ins or (), weakref.ref(self))
+        self._outs = _Items(outs or (), weakref.ref(self))
+        self._locktime = locktime
+        self._raw = self._bin_txid = None
+
+    def _changed(self):
+        self._raw = self._bin_txid = None
+
+    def _setter(name):
+        slot = '_' + name
+
+        def get(self):
+            return getattr(self, slot)
+
+        def set(self, value):
+            setattr(self, slot, value)
+            self._changed()
+        return property(get, set)
+
+    version = _setter('version')
+    locktime = _setter('locktime')
+    del _setter
+
+    @property
+    def ins(self):
+        return self._ins
+
+    @ins.setter
+    def ins(self, value):
+        self._ins._disown_all()
+        self._ins = _Items(value, weakref.ref(self))
+        self._changed()
+
+    @property
+    def outs(self):
+        return self._outs
+
+    @outs.setter
+    def outs(self, value):
+        self._outs._disown_all()
+        self._outs = _Items(value, weakref.ref(self))
+        self._changed()
+
+    @classmethod
+    def from_bytes(cls, data, pos=0):
+        """Parse a binary tx; data may be bytes, bytearray, mmap or memoryview"""
+        try:
+            tx, _ = cls._parse(memoryview(data), pos)
+        except struct.error:
+            raise ValueError("Truncated transaction")
+        return tx
+
+    @classmethod
+    def _parse(cls, buf, pos):
+        """Parse one tx (BIP144 or legacy) at buf[pos:] => (Tx, end pos)"""
+        start = pos
+        version = _u32(buf, pos)[0]
+        # BIP144 marker & flag, as bin_deserialize reads them
+        segwit = _u8(buf, pos + 4)[0] == 0 and _u8(buf, pos + 5)[0] == 1
+        n, pos = read_var_int(buf, pos + (6 if segwit else 4))
+        tx = cls.__new__(cls)
+        ref = weakref.ref(tx)
+        ins = _Items((), ref)
+        for _ in range(n):
+            txin = TxIn.__new__(TxIn)
+            txin._owner = ref
+            iref = weakref.ref(txin)
+            txin._outpoint = OutPoint._from_wire(buf[pos:pos+32], _u32(buf, pos + 32)[0], iref)
+            size, pos = read_var_int(buf, pos + 36)
+            txin._script = buf[pos:pos+size]
+            txin._sequence = _u32(buf, pos + size)[0]
+            txin._witness = _Items((), iref)
+            pos += size + 4
+            list.append(ins, txin)
+        n, pos = read_var_int(buf, pos)
+        outs = _Items((), ref)
+        for _ in range(n):
+            txout = TxOut.__new__(TxOut)
+            txout._owner = ref
+            txout._value = _u64(buf, pos)[0]
+            size, pos = read_var_int(buf, pos + 8)
+            txout._script = buf[pos:pos+size]
+            pos += size
+            list.append(outs, txout)
+        if segwit:
+            for txin in ins:
+                n, pos = read_var_int(buf, pos)
+                witness = txin._witness
+                for _ in range(n):
+                    size, pos = read_var_int(buf, pos)
+                    list.append(witness, buf[pos:pos+size])
+                    pos += size
+        if pos + 4 > len(buf):
+            raise ValueError("Truncated transaction")
+        tx._version, tx._ins, tx._outs = version, ins, outs
+        tx._locktime = _u32(buf, pos)[0]
+        # the parsed bytes are the serialization
+        tx._raw, tx._bin_txid = buf[start:pos+4], None
+        return tx, pos + 4
+
+    @classmethod
+    def from_hex(cls, txhex):
+        return cls.from_bytes(binascii.unhexlify(txhex))
+
+    @classmethod
+    def from_dict(cls, txobj):
+        """From a deserialize() style dict (hex or binary fields)"""
+        if _is_hex_txobj(txobj):
+            txobj = _unhexlify_txobj(txobj)
+        return cls(
+            txobj["version"],
+            [TxIn(OutPoint(i["outpoint"]["hash"], i["outpoint"]["index"]),
+                  i["script"] or b'', i["sequence"], i.get("witness")) for i in txobj["ins"]],
+            [TxOut(o["value"], o["script"] or b'') for o in txobj["outs"]],
+            txobj["locktime"])
+
+    def to_dict(self, hexlify=True):
+        """deserialize() style dict; hex fields by default, binary otherwise"""
+        conv = safe_hexlify if hexlify else (lambda x: x)
+        txobj = {
+            "version": self._version,
+            "ins": [{
+                "outpoint": {"hash": conv(i.outpoint.hash), "index": i.outpoint.index},
+                "script": conv(i.script),
+                "sequence": i.sequence
+            } for i in self._ins],
+            "outs": [{"value": o.value, "script": conv(o.script)} for o in self._outs],
+            "locktime": self._locktime
+        }
+        if self.has_witness:
+            for i, inp in zip(self._ins, txobj["ins"]):
+                inp["witness"] = [conv(w) for w in i.witness]
+        return txobj
+
+    @property
+    def has_witness(self):
+        return any(i._witness for i in self._ins)
+
+    def serialize(self):
+        raw = self._raw
+        if raw is None:
+            raw = serialize_fields(
+                self._version,
+                [(i._outpoint._hash, i._outpoint._index, i._script, i._sequence)
+                 for i in self._ins],
+                [(o._value, o._script) for o in self._outs],
+                self._locktime,
+                [i._witness for i in self._ins])
+            self._raw, self._bin_txid = raw, None
+        elif isinstance(raw, memoryview):
+            raw = self._raw = raw.tobytes()
+        return raw
+
+    def to_hex(self):
+        return safe_hexlify(self.serialize())
+
+    def detach(self):
+        """Copy the fields still viewing the buffer the tx was parsed from
+        (e.g. an mmap that is to be closed) into bytes => self"""
+        for txin in self._ins:
+            txin.script, txin.witness
+            outpoint = txin._outpoint
+            outpoint._hash = _tobytes(outpoint._hash)
+        for txout in self._outs:
+            txout.script
+        self.serialize()
+        return self
+
+    @property
+    def size(self):
+        return len(self.serialize())
+
+    @property
+    def bin_txid(self):
+        """txid in display byte order (binary); witnesses aren't hashed"""
+        raw = self.serialize()
+        h = self._bin_txid
+        if h is None:
+            h = self._bin_txid = hashlib.sha256(hashlib.sha256(
+                bin_strip_witness(raw)).digest()).digest()[::-1]
+        return h
+
+    @property
+    def txid(self):
+        return safe_hexlify(self.bin_txid)
+
+    @property
+    def bin_wtxid(self):
+        """BIP141 wtxid in display byte order (binary)"""
+        return hashlib.sha256(hashlib.sha256(self.serialize()).digest()).digest()[::-1]
+
+    @property
+    def wtxid(self):
+        return safe_hexlify(self.bin_wtxid)
+
+    def __repr__(self):
+        return "Tx(version=%d, ins=%d, outs=%d, locktime=%d)" % (
+            self._version, len(self._ins), len(self._outs), self._locktime)
+
+
+class _LazyItems(object):
+    """ins/outs of a TxView; items are built on access only"""
+    __slots__ = ('_make', '_count')
+
+    def __init__(self, make, count):
+        self._make, self._count = make, count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("index out of range")
+        return self._make(i)
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._make(i)
+
+
+class TxView(object):
+    """Offset index over a raw transaction; one scan, no decoding.
+
+    Per input the index holds (outpoint pos, script pos, script len), per
+    output (value pos, script pos, script len). A BIP144 tx also gets the
+    position of each input's witness stack, and _body, the end of the
+    outputs, so the txid can hash the stripped bytes in place. Fields are
+    unpacked only when asked for."""
+    __slots__ = ('_buf', '_start', 'end', '_ins', '_outs', '_wits', '_body', '_bin_txid')
+
+    def __init__(self, data, pos=0):
+        buf = self._buf = data if isinstance(data, memoryview) else memoryview(data)
+        self._start = pos
+        self._bin_txid = None
+        self._wits = None
+        try:
+            segwit = _u8(buf, pos + 4)[0] == 0 and _u8(buf, pos + 5)[0] == 1
+            n, pos = read_var_int(buf, pos + (6 if segwit else 4))
+            ins = self._ins = array('L', [0]) * (3 * n)
+            for j in range(0, 3 * n, 3):
+                ins[j] = pos
+                size, spos = read_var_int(buf, pos + 36)
+                ins[j+1], ins[j+2] = spos, size
+                pos = spos + size + 4
+            n, pos = read_var_int(buf, pos)
+            outs = self._outs = array('L', [0]) * (3 * n)
+            for j in range(0, 3 * n, 3):
+                outs[j] = pos
+                size, spos = read_var_int(buf, pos + 8)
+                outs[j+1], outs[j+2] = spos, size
+                pos = spos + size
+            self._body = pos
+            if segwit:
+                wits = self._wits = array('L', [0]) * (len(ins) // 3)
+                for j in range(len(wits)):
+                    wits[j] = pos
+                    n, pos = read_var_int(buf, pos)
+                    for _ in range(n):
+                        size, pos = read_var_int(buf, pos)
+                        pos += size
+        except struct.error:
+            raise ValueError("Truncated transaction")
+        if pos + 4 > len(buf):
+            raise ValueError("Truncated transaction")
+        self.end = pos + 4
+
+    @property
+    def version(self):
+        return _u32(self._buf, self._start)[0]
+
+    @property
+    def locktime(self):
+        return _u32(self._buf, self.end - 4)[0]
+
+    @property
+    def input_count(self):
+        return len(self._ins) // 3
+
+    @property
+    def output_count(self):
+        return len(self._outs) // 3
+
+    @property
+    def size(self):
+        return self.end - self._start
+
+    def raw(self):
+        return self._buf[self._start:self.end].tobytes()
+
+    serialize = raw
+
+    @property
+    def has_witness(self):
+        return self._wits is not None
+
+    @property
+    def bin_txid(self):
+        """txid in display byte order (binary); witnesses aren't hashed"""
+        h = self._bin_txid
+        if h is None:
+            buf, start = self._buf, self._start
+            if self._wits is None:
+                inner = hashlib.sha256(buf[start:self.end])
+            else:
+                inner = hashlib.sha256(buf[start:start+4])
+                inner.update(buf[start+6:self._body])
+                inner.update(buf[self.end-4:self.end])
+            h = self._bin_txid = hashlib.sha256(inner.digest()).digest()[::-1]
+        return h
+
+    @property
+    def txid(self):
+        return safe_hexlify(self.bin_txid)
+
+    @property
+    def bin_wtxid(self):
+        """BIP141 wtxid in display byte order (binary)"""
+        if self._wits is None:
+            return self.bin_txid
+        return hashlib.sha256(hashlib.sha256(
+            self._buf[self._start:self.end]).digest()).digest()[::-1]
+
+    @property
+    def wtxid(self):
+        return safe_hexlify(self.bin_wtxid)
+
+    # direct field access, no objects built
+
+    def outpoint(self, i):
+        """(hash in txid order, index) of input i"""
+        p = self._ins[3*i]
+        return self._buf[p:p+32].tobytes()[::-1], _u32(self._buf, p + 32)[0]
+
+    def in_script(self, i):
+        p, n = self._ins[3*i+1], self._ins[3*i+2]
+        return self._buf[p:p+n]
+
+    def sequence(self, i):
+        return _u32(self._buf, self._ins[3*i+1] + self._ins[3*i+2])[0]
+
+    def witness(self, i):
+        """Witness stack of input i, as views; [] for a non-segwit tx"""
+        if self._wits is None:
+            return []
+        buf = self._buf
+        n, pos = read_var_int(buf, self._wits[i])
+        items = []
+        for _ in range(n):
+            size, pos = read_var_int(buf, pos)
+            items.append(buf[pos:pos+size])
+            pos += size
+        return items
+
+    def out_value(self, i):
+        return _u64(self._buf, self._outs[3*i])[0]
+
+    def out_script(self, i):
+        p, n = self._outs[3*i+1], self._outs[3*i+2]
+        return self._buf[p:p+n]
+
+    def outpoints(self):
+        return [self.outpoint(i) for i in range(self.input_count)]
+
+    def total_out(self):
+        return sum(self.out_value(i) for i in range(self.output_count))
+
+    # typed access, built on demand from the index
+
+    def _make_in(self, i):
+        ins, buf = self._ins, self._buf
+        p, sp, n = ins[3*i], ins[3*i+1], ins[3*i+2]
+        txin = TxIn.__new__(TxIn)
+        txin._owner = None
+        iref = weakref.ref(txin)
+        txin._outpoint = OutPoint._from_wire(buf[p:p+32], _u32(buf, p + 32)[0], iref)
+        txin._script = buf[sp:sp+n]
+        txin._sequence = _u32(buf, sp + n)[0]
+        txin._witness = _Items(self.witness(i), iref)
+        return txin
+
+    def _make_out(self, i):
+        outs, buf = self._outs, self._buf
+        sp, n = outs[3*i+1], outs[3*i+2]
+        txout = TxOut.__new__(TxOut)
+        txout._owner = None
+        txout._value = _u64(buf, outs[3*i])[0]
+        txout._script = buf[sp:sp+n]
+        return txout
+
+    @property
+    def ins(self):
+        return _LazyItems(self._make_in, self.input_count)
+
+    @property
+    def outs(self):
+        return _LazyItems(self._make_out, self.output_count)
+
+    def to_tx(self):
+        tx = Tx(self.version, list(self.ins), list(self.outs), self.locktime)
+        tx._raw, tx._bin_txid = self._buf[self._start:self.end], self._bin_txid
+        return tx
+
+    def detach(self):
+        """Copy the tx's bytes out of the buffer it views (e.g. an mmap that
+        is to be closed) and index those instead => self"""
+        start = self._start
+        buf = memoryview(self.raw())
+        for index in (self._ins, self._outs):
+            for j in range(0, len(index), 3):
+                index[j] -= start
+                index[j+1] -= start
+        if self._wits is not None:
+            for j in range(len(self._wits)):
+                self._wits[j] -= start
+        self._buf, self._start = buf, 0
+        self._body -= start
+        self.end -= start
+        return self
+
+    def with_scripts(self, scripts):
+        """{input index: scriptSig} => raw tx with those scripts replaced"""
+        ins, start = self._ins, self._start
+        spans = [(ins[j] + 36 - start, ins[j+1] + ins[j+2] - start)
+                 for j in range(0, len(ins), 3)]
+        return bin_splice_scripts(self._buf[start:self.end], scripts, spans)
+
+    def __repr__(self):
+        return "TxView(%s, ins=%d, outs=%d)" % (self.txid, self.input_count, self.output_count)
+
+
+# Streaming
+
+def _scan_tx_end(buf, pos):
+    """End offset of the tx at buf[pos:]; struct.error if it is incomplete"""
+    segwit = _u8(buf, pos + 4)[0] == 0 and _u8(buf, pos + 5)[0] == 1
+    n, pos = read_var_int(buf, pos + (6 if segwit else 4))
+    nins = n
+    for _ in range(n):
+        size, pos = read_var_int(buf, pos + 36)
+        pos += size + 4
+    n, pos = read_var_int(buf, pos)
+    for _ in range(n):
+        size, pos = read_var_int(buf, pos + 8)
+        pos += size
+    if segwit:
+        for _ in range(nins):
+            n, pos = read_var_int(buf, pos)
+            for _ in range(n):
+                size, pos = read_var_int(buf, pos)
+                pos += size
+    if pos + 4 > len(buf):
+        raise struct.error("incomplete")
+    return pos + 4
+
+
+_STREAM_FORMATS = {
+    'raw': lambda raw: raw,
+    'tx': Tx.from_bytes,
+    'view': TxView,
+    'dict': lambda raw: Tx.from_bytes(raw).to_dict(),
+    'bin': lambda raw: Tx.from_bytes(raw).to_dict(hexlify=False),
+}
+
+
+def iter_transactions(source, fmt='tx', chunk_size=1 << 16, copy=False):
+    """Yield transactions one at a time from concatenated raw transactions.
+
+    source is bytes/bytearray/mmap/memoryview (parsed in place, no copies),
+    or a file-like object with read() / socket with recv(), which is read
+    chunk_size bytes at a time so memory stays bounded by roughly one
+    transaction plus one chunk. fmt is one of 'tx' (Tx), 'view' (TxView),
+    'dict' (deserialize() style hex dict), 'bin' (binary dict), 'raw' (bytes).
+
+    A Tx or TxView parsed from a buffer views it: an mmap can't be closed
+    (BufferError) and stays mapped while any of them, or this generator, is
+    alive. Call detach() on those to be kept, or pass copy=True to have
+    each one detached as it is yielded.
+    """
+    make = _STREAM_FORMATS[fmt]
+    # mmap has read() too, but is parsed in place like any buffer
+    buf = as_buffer(source)
+    if buf is not None:
+        pos, end = 0, len(buf)
+        while pos < end:
+            try:
+                if fmt == 'tx':
+                    tx, pos = Tx._parse(buf, pos)
+                elif fmt == 'view':
+                    tx = TxView(buf, pos)
+                    pos = tx.end
+                else:
+                    nxt = _scan_tx_end(buf, pos)
+                    tx, pos = make(buf[pos:nxt].tobytes()), nxt
+            except struct.error:
+                raise ValueError("Truncated transaction at offset %d" % pos)
+            yield tx.detach() if copy and fmt in ('tx', 'view') else tx
+        return
+
+    read = getattr(source, 'read', None) or getattr(source, 'recv', None)
+    if read is None:
+        raise TypeError("Expected a buffer or a file-like object, got %r" % type(source))
+    buf = bytearray()
+    pos, eof = 0, False
+    while True:
+        try:
+            end = _scan_tx_end(buf, pos)
+        except (struct.error, IndexError):
+            if eof:
+                if pos < len(buf):
+                    raise ValueError("Truncated transaction at end of stream")
+                return
+            if pos:
+                del buf[:pos]
+                pos = 0
+            data = read(chunk_size)
+            if not data:
+                eof = True
+            else:
+                buf.extend(data)
+            continue
+        raw = bytes(buf[pos:end])
+        pos = end
+        yield make(raw)
+
+
+# Block output classification
+
+def classify_block_outputs(block):
+    """Raw block => (array('B') of SCRIPT_* types, bytearray of hash160s,
+    array('L') of outputs per tx), covering every output in block order.
+    Scripts are classified in place in the block buffer."""
+    buf = block if isinstance(block, memoryview) else memoryview(block)
+    ntx, pos = read_var_int(buf, 80)
+    types, counts = array('B'), array('L')
+    hashes = bytearray()
+    for _ in range(ntx):
+        view = TxView(buf, pos)
+        n = view.output_count
+        counts.append(n)
+        for j in range(n):
+            t, payload = classify_script(view.out_script(j))
+            types.append(t)
+            if t == SCRIPT_P2PKH or t == SCRIPT_P2SH or t == SCRIPT_P2WPKH:
+                hashes += payload
+            elif t == SCRIPT_P2PK:
+                hashes += bin_hash160(payload.tobytes())
+            else:
+                hashes += b'\x00' * 20
+        pos = view.end
+    return types, hashes, counts
+
+
+def extract_block_sigs(block, strict=False):
+    """Raw block => [(tx index, input index, r, s, hashcode), ...] for every
+    DER signature pushed by an input script or on its witness stack, in
+    block order. Items that don't parse (as BIP66 when strict) are skipped."""
+    buf = block if isinstance(block, memoryview) else memoryview(block)
+    ntx, pos = read_var_int(buf, 80)
+    out = []
+    for t in range(ntx):
+        view = TxView(buf, pos)
+        for i in range(view.input_count):
+            for item in chain(script_pushes(view.in_script(i)), view.witness(i)):
+                if len(item) < 9 or _u8(item, 0)[0] != 0x30:
+                    continue
+                try:
+                    r, s, hashcode = parse_der_sig(item, strict)
+                except ValueError:
+                    continue
+                out.append((t, i, r, s, hashcode))
+        pos = view.end
+    return out
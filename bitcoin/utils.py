@@ -1,10 +1,11 @@
 import re
 from pprint import pprint as pp
-from struct import pack
+from struct import pack, Struct
 from bitcoin.main import *
 from bitcoin.main import privtopub, privtoaddr, pubtoaddr
 from bitcoin.transaction import *
 from bitcoin.bci import *
+from bitcoin.script import encode_num
 
 
 
@@ -142,38 +143,28 @@ def get_op(s):
         return getop(s)
 
 def parse_script(s):
-    def ishex(s):
-        return set(s).issubset(set('0123456789abcdefABCDEF'))
-    r = []
-
-    opcodes_by_name = {}
-    for name, code in OPCODES_BY_NAME.items():
-        opcodes_by_name[name] = code
-        opcodes_by_name[name[3:]] = code
+    """Bitcoin Core test-vector script notation => hex script
 
+    Numbers -1 & 1..16 become OP_N, other numbers minimal pushes; 0x.. is
+    inserted raw; 'text' is pushed; opcodes are named with or without OP_."""
+    out = []
     for word in s.split():
         if word.isdigit() or (word[0] == '-' and word[1:].isdigit()):
-            r.append(int(word))
-        elif word.startswith('0x') and ishex(word[2:]):
-            if int(word[2:], 16) <= 0x4e:
-                continue
+            n = int(word)
+            if n == -1 or 1 <= n <= 16:
+                out.append(from_int_to_byte(n + 80))
             else:
-                r.append(word[2:])
+                out.append(serialize_script_unit(encode_num(n)))
+        elif word.startswith('0x') and len(word) > 2 and RE_HEX_CHARS.match(word[2:]):
+            out.append(binascii.unhexlify(word[2:]))
         elif len(word) >= 2 and word[0] == "'" and word[-1] == "'":
-            r.append(word[1:-1])
-        elif word in opcodes_by_name:
-            r.append(opcodes_by_name[word])  # r.append(get_op(v[3:]))
+            out.append(serialize_script_unit(word[1:-1].encode('latin-1')))
+        elif word in OPCODES_BY_NAME:
+            out.append(from_int_to_byte(OPCODES_BY_NAME[word]))
         else:
             raise ValueError("could not parse script! (word=\t%s)" % str(word))
+    return safe_hexlify(b''.join(out))
 
-    try:
-        sc = serialize_script(r)
-    except:
-        sys.stderr.write("Didnt work!\nr = %s" % repr(r))
-        raw_input("??")
-        #FIXME: index #s 7,12,13,24 don't work
-        sc = r
-    return sc
 
 priv, pub, addr = '', '', ''
 
@@ -237,6 +228,12 @@ PK = "3081d30201010420{0:064x}a081a53081a2020101302c06072a8648ce3d0101022100" \
 # https://gist.github.com/simcity4242/b0bb0f0281fcf58deec2
 
 
+_uint8 = Struct('<B').pack
+_uint16 = Struct('<H').pack
+_uint32 = Struct('<I').pack
+_uint64 = Struct('<Q').pack
+
+
 def little_endian_varint(integer):
     """Convert an integer to the Bitcoin variable length integer.
     See here for the protocol specification:
@@ -245,39 +242,32 @@ def little_endian_varint(integer):
         https://docs.python.org/2/library/struct.html#format-characters
     """
     if integer < 0xfd:
-        prefix = b''
-        format = b'<B'
+        return _uint8(integer)
     elif integer <= 0xffff:
-        prefix = b'\xfd'
-        format = b'<H'
+        return b'\xfd' + _uint16(integer)
     elif integer <= 0xffffffff:
-        prefix = b'\xfe'
-        format = b'<I'
-    else:
-        prefix = b'\xff'
-        format = b'<Q'
-
-    return prefix + pack(format, integer)
+        return b'\xfe' + _uint32(integer)
+    return b'\xff' + _uint64(integer)
 
 
 def little_endian_uint8(int8):
     """Convert an integer into a 1 byte little endian string."""
-    return pack(b'<B', int8)
+    return _uint8(int8)
 
 
 def little_endian_uint16(int16):
     """Convert an integer into a 2 bytes little endian string."""
-    return pack(b'<H', int16)
+    return _uint16(int16)
 
 
 def little_endian_uint32(int32):
     """Convert an integer into a 4 bytes little endian string."""
-    return pack(b'<I', int32)
+    return _uint32(int32)
 
 
 def little_endian_uint64(int32):
     """Convert an integer into a 8 bytes little endian string."""
-    return pack(b'<Q', int32)
+    return _uint64(int32)
 
 
 def little_endian_str(string):
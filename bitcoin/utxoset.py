@@ -0,0 +1,410 @@
+#!/usr/bin/python
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from bitcoin.pyspecials import safe_hexlify, safe_unhexlify, string_types
+from bitcoin.transaction import _is_hex
+
+# UTXO set
+#
+# A dict of unspent outputs per coin costs the better part of a kilobyte;
+# at millions of coins that is gigabytes. UTXOSet keeps one slot per coin:
+# the only per coin Python object is its 36 byte key (the outpoint as it
+# appears on the wire, hash || index LE) in a dict mapping it to the slot,
+# while values, heights and script offsets live in flat arrays and the
+# scriptPubKeys in one bytearray. Spent slots are reused; the script bytes
+# they held are reclaimed once they make up half the arena.
+#
+# For coin selection the set also orders its slots by value (two more
+# arrays, built by a sort on first use), so it serves as its own pool:
+# select_coins bisects and sums the sorted values directly and only the
+# coins it picks become utxo dicts. add / spend just drop that order, so
+# they stay O(1) however the set is used; the next selection re-sorts.
+#
+# Snapshots are b'PBCU', a format version, the coin count and script arena
+# size, then each array as one little endian section (keys, values, codes,
+# script offsets, script lengths, scripts). A restore maps the file and,
+# apart from the keys (which the index needs as objects), uses the sections
+# in place as views of the mapping; they are copied into arrays by the
+# first write (add or compaction; spend only marks slots free). Python 2
+# has no memoryview.cast and big endian hosts must byteswap, so those copy
+# the sections on load.
+
+SNAPSHOT_MAGIC = b'PBCU'
+SNAPSHOT_VERSION = 1
+
+_HEADER = struct.Struct('<4sB3xQQ')
+_pack_u32 = struct.Struct('<I').pack
+_u32 = struct.Struct('<I').unpack_from
+_MIN_COMPACT = 1 << 20          # don't bother compacting arenas below 1MB of garbage
+
+
+def _typecode(size):
+    for code in 'BHILQ':
+        try:
+            if array(code).itemsize == size:
+                return code
+        except ValueError:      # no 'Q' on python 2
+            pass
+    raise ValueError("No %d byte array type" % size)
+
+_U32, _U64 = _typecode(4), _typecode(8)
+_frombytes = getattr(array, 'frombytes', None) or array.fromstring
+_tobytes = getattr(array, 'tobytes', None) or array.tostring
+_VIEWS = hasattr(memoryview, 'cast') and sys.byteorder == 'little'
+_SECTIONS = (('_values', 8, _U64), ('_codes', 4, _U32), ('_spos', 8, _U64), ('_slen', 4, _U32))
+
+
+def outpoint_key(outpoint, index=None):
+    """"txid:n" | (txid, n) | txid, n | 36 byte key => 36 byte key"""
+    if index is None:
+        if isinstance(outpoint, (bytes, bytearray)) and len(outpoint) == 36:
+            return bytes(outpoint)
+        if isinstance(outpoint, string_types):
+            outpoint, index = outpoint.split(':')
+        else:
+            outpoint, index = outpoint
+    h = safe_unhexlify(outpoint) if len(outpoint) == 64 else outpoint
+    if len(h) != 32:
+        raise ValueError("Invalid txid: %r" % (outpoint,))
+    return h[::-1] + _pack_u32(int(index))
+
+
+def key_to_outpoint(key):
+    """36 byte key => "txid:n" """
+    return "%s:%d" % (safe_hexlify(key[31::-1]), _u32(key, 32)[0])
+
+
+class UTXOSet(object):
+    """Unspent outputs keyed by outpoint, stored as arrays.
+
+    Outpoints may be given as "txid:n", (txid, n) or 36 byte keys. unspent
+    is a list of utxo dicts ({"output": "txid:n", "value": v[, "script":
+    hex or binary, "height": h, "coinbase": bool]})."""
+    __slots__ = ('_index', '_keys', '_values', '_codes', '_spos', '_slen',
+                 '_scripts', '_free', '_garbage', '_total', '_sorted', '_order', '_prefix',
+                 '_mm')
+
+    def __init__(self, unspent=()):
+        self._index = {}
+        self._keys = []
+        self._values = array(_U64)
+        self._codes = array(_U32)       # height * 2 + coinbase, as in Core
+        self._spos = array(_U64)
+        self._slen = array(_U32)
+        self._scripts = bytearray()
+        self._free = []
+        self._garbage = 0
+        self._total = 0
+        self._sorted = None     # values, ascending, while selected from
+        self._order = None      # the slot of each sorted value
+        self._prefix = None
+        self._mm = None         # snapshot mapping the arrays are views of
+        for u in unspent:
+            self.add_utxo(u)
+
+    def add(self, outpoint, value, script=b'', height=0, coinbase=False):
+        key = outpoint_key(outpoint)
+        if key in self._index:
+            raise ValueError("Outpoint already in set: %s" % key_to_outpoint(key))
+        if _is_hex(script):
+            script = safe_unhexlify(script)
+        self._own()
+        value, code = int(value), int(height) * 2 + bool(coinbase)
+        pos = len(self._scripts)
+        self._scripts += script
+        if self._free:
+            slot = self._free.pop()
+            self._keys[slot] = key
+            self._values[slot], self._codes[slot] = value, code
+            self._spos[slot], self._slen[slot] = pos, len(script)
+        else:
+            slot = len(self._keys)
+            self._keys.append(key)
+            self._values.append(value)
+            self._codes.append(code)
+            self._spos.append(pos)
+            self._slen.append(len(script))
+        self._index[key] = slot
+        self._total += value
+        self._sorted = self._order = self._prefix = None
+
+    def add_utxo(self, utxo):
+        self.add(utxo["output"], utxo["value"], utxo.get("script", b''),
+                 utxo.get("height", 0), utxo.get("coinbase", False))
+
+    def _script(self, slot):
+        p = self._spos[slot]
+        return bytes(self._scripts[p:p+self._slen[slot]])
+
+    def spend(self, outpoint):
+        """Remove a coin => (value, binary script); KeyError if unknown"""
+        slot = self._index.pop(outpoint_key(outpoint))
+        value, script = self._values[slot], self._script(slot)
+        self._keys[slot] = None
+        self._free.append(slot)
+        self._total -= value
+        self._sorted = self._order = self._prefix = None
+        self._garbage += len(script)
+        if self._garbage >= _MIN_COMPACT and 2 * self._garbage >= len(self._scripts):
+            self._compact_scripts()
+        return value, script
+
+    def remove(self, outpoint):
+        """Remove a coin => its utxo dict (as coin()), as UTXOPool.remove"""
+        utxo = self.coin(outpoint)
+        self.spend(outpoint)
+        return utxo
+
+    def get(self, outpoint, default=None):
+        """=> (value, binary script), or default"""
+        slot = self._index.get(outpoint_key(outpoint))
+        if slot is None:
+            return default
+        return self._values[slot], self._script(slot)
+
+    def __getitem__(self, outpoint):
+        slot = self._index[outpoint_key(outpoint)]
+        return self._values[slot], self._script(slot)
+
+    def coin(self, outpoint):
+        """=> utxo dict with hex script, height & coinbase flag"""
+        key = outpoint_key(outpoint)
+        slot = self._index[key]
+        code = self._codes[slot]
+        return {"output": key_to_outpoint(key), "value": self._values[slot],
+                "script": safe_hexlify(self._script(slot)),
+                "height": code >> 1, "coinbase": bool(code & 1)}
+
+    def __contains__(self, outpoint):
+        return outpoint_key(outpoint) in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        """utxo dicts ({"output": "txid:n", "value": v}), as bci.unspent"""
+        values = self._values
+        for slot, key in enumerate(self._keys):
+            if key is not None:
+                yield {"output": key_to_outpoint(key), "value": values[slot]}
+
+    @property
+    def total(self):
+        return self._total
+
+    def unspent(self, script):
+        """utxo dicts of the coins paying scriptPubKey script (hex or binary)"""
+        if _is_hex(script):
+            script = safe_unhexlify(script)
+        n, arena, values = len(script), self._scripts, self._values
+        return [{"output": key_to_outpoint(key), "value": values[slot]}
+                for slot, key in enumerate(self._keys)
+                if key is not None and self._slen[slot] == n
+                and arena[self._spos[slot]:self._spos[slot]+n] == script]
+
+    # Coin selection: the UTXOPool interface, over the sorted arrays
+
+    def pool(self):
+        """The set itself, for select / select_coins / mksend"""
+        return self
+
+    def _by_value(self):
+        if self._order is None:
+            values = self._values
+            self._order = array(_U32, sorted((slot for slot, key in enumerate(self._keys)
+                                              if key is not None), key=values.__getitem__))
+            self._sorted = array(_U64, [values[slot] for slot in self._order])
+        return self._sorted
+
+    @property
+    def values(self):
+        """Coin values in ascending order (don't mutate)"""
+        return self._by_value()
+
+    @property
+    def utxos(self):
+        """Coins in ascending value order, as utxo dicts built on access"""
+        return _CoinsByValue(self)
+
+    def bisect(self, value):
+        """Position of the smallest coin worth at least value"""
+        return bisect_left(self._by_value(), value)
+
+    def sum_range(self, lo, hi):
+        """Sum of the values of coins lo..hi-1 (ascending positions)"""
+        if self._prefix is None:
+            values = self._by_value()
+            prefix, acc = array(_U64, [0]) * (len(values) + 1), 0
+            for i, v in enumerate(values):
+                acc += v
+                prefix[i+1] = acc
+            self._prefix = prefix
+        return self._prefix[hi] - self._prefix[lo]
+
+    def apply_tx(self, tx, height=0, coinbase=False):
+        """Spend the inputs of tx (hex, binary, Tx or TxView) and add its
+        outputs; provably unspendable (OP_RETURN) outputs are skipped.
+        => [(value, script), ...] spent, in input order"""
+        from bitcoin.tx import TxView
+        if isinstance(tx, string_types) and _is_hex(tx):
+            tx = safe_unhexlify(tx)
+        if not isinstance(tx, TxView):
+            tx = TxView(tx.serialize() if hasattr(tx, 'serialize') else tx)
+        spent = []
+        if not coinbase:
+            for i in range(tx.input_count):
+                h, index = tx.outpoint(i)
+                spent.append(self.spend((h, index)))
+        txid = tx.bin_txid
+        for i in range(tx.output_count):
+            script = tx.out_script(i).tobytes()
+            if script[:1] != b'\x6a':
+                self.add((txid, i), tx.out_value(i), script, height, coinbase)
+        return spent
+
+    # Storage
+
+    def _own(self):
+        """Copy sections still viewing a snapshot mapping into arrays, and
+        unmap it"""
+        if self._mm is None:
+            return
+        for name, _, code in _SECTIONS:
+            view = getattr(self, name)
+            raw, a = view.cast('B'), array(code)
+            _frombytes(a, raw)
+            setattr(self, name, a)
+            raw.release()
+            view.release()
+        view, self._scripts = self._scripts, bytearray(self._scripts)
+        view.release()
+        self._mm.close()
+        self._mm = None
+
+    def _compact_scripts(self):
+        self._own()
+        arena, spos, slen = self._scripts, self._spos, self._slen
+        out = bytearray()
+        for slot, key in enumerate(self._keys):
+            if key is not None:
+                p = spos[slot]
+                spos[slot] = len(out)
+                out += arena[p:p+slen[slot]]
+        self._scripts, self._garbage = out, 0
+
+    def compact(self):
+        """Drop spent slots and the script bytes they held"""
+        self._own()
+        live = [slot for slot, key in enumerate(self._keys) if key is not None]
+        if len(live) < len(self._keys):
+            self._keys = [self._keys[s] for s in live]
+            for name in ('_values', '_codes', '_spos', '_slen'):
+                old = getattr(self, name)
+                setattr(self, name, array(old.typecode, [old[s] for s in live]))
+            self._sorted = self._order = self._prefix = None
+            self._index = dict(zip(self._keys, range(len(live))))
+            self._free = []
+        self._compact_scripts()
+
+    def save(self, path):
+        """Snapshot the set to path (written to path.tmp, then renamed)"""
+        self.compact()
+        sections = [self._values, self._codes, self._spos, self._slen]
+        if sys.byteorder == 'big':
+            sections = [array(a.typecode, a) for a in sections]
+            for a in sections:
+                a.byteswap()
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                 len(self._keys), len(self._scripts)))
+            f.write(b''.join(self._keys))
+            for a in sections:
+                f.write(_tobytes(a))
+            f.write(self._scripts)
+        if os.path.exists(path) and os.name == 'nt':
+            os.remove(path)
+        os.rename(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Restore a set written by save(). The arrays and scripts are views
+        of a read only mapping of path until the set is first written to
+        (see above), so the file must not be modified while the set is in
+        use; replacing it (as save() does) is fine."""
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self = cls()
+        try:
+            if len(mm) < _HEADER.size:
+                raise ValueError("Truncated UTXO snapshot")
+            magic, version, n, arena_size = _HEADER.unpack_from(mm, 0)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError("Not a UTXO snapshot: %s" % path)
+            if len(mm) != _HEADER.size + 60 * n + arena_size:
+                raise ValueError("Truncated UTXO snapshot")
+            pos = _HEADER.size
+            self._keys = [mm[p:p+36] for p in range(pos, pos + 36 * n, 36)]
+            self._index = dict(zip(self._keys, range(n)))
+            if len(self._index) != n:
+                raise ValueError("Duplicate outpoint in UTXO snapshot")
+            pos += 36 * n
+            view = memoryview(mm) if _VIEWS else None
+            for name, size, code in _SECTIONS:
+                if view is not None:
+                    setattr(self, name, view[pos:pos + size * n].cast(code))
+                else:
+                    a = getattr(self, name)
+                    _frombytes(a, mm[pos:pos + size * n])
+                    if sys.byteorder == 'big':
+                        a.byteswap()
+                pos += size * n
+            if view is not None:
+                self._scripts = view[pos:pos + arena_size]
+                self._mm = mm
+            else:
+                self._scripts = bytearray(mm[pos:pos + arena_size])
+        finally:
+            if self._mm is None:
+                mm.close()
+        self._total = sum(self._values)
+        return self
+
+    def __repr__(self):
+        return "UTXOSet(coins=%d, total=%d)" % (len(self), self._total)
+
+
+class _CoinsByValue(object):
+    """UTXOSet.utxos: the coins in ascending value order; a utxo dict is
+    built only for the positions read"""
+    __slots__ = ('_set',)
+
+    def __init__(self, utxos):
+        self._set = utxos
+
+    def __len__(self):
+        return len(self._set)
+
+    def _coin(self, pos):
+        u = self._set
+        u._by_value()
+        slot = u._order[pos]
+        return {"output": key_to_outpoint(u._keys[slot]), "value": u._values[slot]}
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return [self._coin(i) for i in range(*pos.indices(len(self)))]
+        if pos < 0:
+            pos += len(self)
+        if not 0 <= pos < len(self):
+            raise IndexError("index out of range")
+        return self._coin(pos)
+
+    def __iter__(self):
+        for pos in range(len(self)):
+            yield self._coin(pos)
@@ -1,8 +1,12 @@
+import binascii
+import io
 import json
+import mmap
 import os
 import random
 import unittest
 import string
+import tempfile
 
 import bitcoin.ripemd as ripemd
 from bitcoin import *
@@ -76,6 +80,61 @@ class TestBases(unittest.TestCase):
             self.assertEqual(changebase(encode(x, frm), frm, to), encode(x, to))
             self.assertEqual(decode(changebase(encode(x, frm), frm, to), to), x)
 
+    def test_minlen(self):
+        self.assertEqual(encode(0, 256, 4), b'\x00' * 4)
+        self.assertEqual(encode(0, 16, 4), '0000')
+        self.assertEqual(encode(255, 16, 4), '00ff')
+        self.assertEqual(encode(1, 256, 4)[::-1], from_int_to_le_bytes(1, 4))
+        self.assertEqual(encode(57, 58, 3), '11z')
+        self.assertEqual(decode(b'\x01\x00', 256), 256)
+        self.assertEqual(decode('FF', 16), 255)
+        for x in (0, 0xfc, 0xfd, 0xffff, 0x10000, 0xffffffff, 0x100000000):
+            self.assertEqual(num_to_var_int(x), little_endian_varint(x))
+
+
+class TestBase58(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('Starting base58 codec tests')
+
+    def test_vectors(self):
+        with open('tests/base58_encode_decode.json', 'r') as fo:
+            vectors = json.load(fo)
+        for hexstr, b58 in vectors:
+            raw = binascii.unhexlify(hexstr)
+            self.assertEqual(b58encode(raw), b58)
+            self.assertEqual(b58decode(b58), raw)
+            self.assertEqual(changebase(raw, 256, 58), b58)
+
+    def test_b58check(self):
+        for i in range(50):
+            h160 = binascii.unhexlify(sha256(str(i))[:40])
+            vbyte = random.choice([0, 5, 111, 196])
+            addr = bin_to_b58check(h160, vbyte)
+            self.assertEqual(addr, hex_to_b58check(safe_hexlify(h160), vbyte))
+            self.assertEqual(b58check_decode_address(addr), (vbyte, h160))
+            self.assertEqual(b58check_to_bin(addr), h160)
+            self.assertEqual(get_version_byte(addr), vbyte)
+
+        h160s = [binascii.unhexlify(sha256(str(i))[:40]) for i in range(10)]
+        addrs = b58check_encode_list(h160s, 0)
+        self.assertEqual(addrs, [bin_to_b58check(h, 0) for h in h160s])
+        self.assertEqual(addresses_to_hash160s(addrs), h160s)
+
+        for compressed in (False, True):
+            priv = sha256('wif')
+            wif = encode_privkey(priv, 'wif_compressed' if compressed else 'wif')
+            vbyte, key = b58check_decode_wif(wif)
+            self.assertEqual(vbyte, 0x80)
+            self.assertEqual(safe_hexlify(key[:32]), priv)
+            self.assertEqual(len(key), 33 if compressed else 32)
+
+        addr = bin_to_b58check(h160s[0], 0)
+        bad = addr[:-1] + ('2' if addr[-1] != '2' else '3')
+        self.assertRaises(ValueError, b58check_to_bin, bad)
+        self.assertRaises(ValueError, b58check_decode_address, addr[1:])
+
 
 class TestElectrumWalletInternalConsistency(unittest.TestCase):
 
@@ -201,6 +260,1178 @@ class TestTransaction(unittest.TestCase):
         self.assertEqual(p2sh_scriptaddr(script, 196), "2MuABMvWTgpZRd4tAG25KW6YzvcoGVZDZYP")
 
 
+class TestBinaryTransactionAPI(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing binary transaction API")
+
+    def test_all(self):
+        privs = [sha256(str(x)) for x in range(4)]
+        pubs = [privtopub(priv) for priv in privs]
+        mscript = mk_multisig_script(pubs[1:], 2, 3)
+        tx = mktx(['01'*32+':1', '23'*32+':2'], [p2sh_scriptaddr(mscript)+':20202',
+                                                  pubtoaddr(pubs[0])+':40404'])
+        btx = binascii.unhexlify(tx)
+
+        self.assertEqual(bin_serialize(bin_deserialize(btx)), btx)
+        self.assertEqual(serialize(deserialize(btx)), btx)
+
+        tx1 = sign(tx, 1, privs[0])
+        btx1 = bin_sign(btx, 1, privs[0])
+        self.assertEqual(binascii.unhexlify(tx1), btx1)
+        self.assertEqual(sign(btx, 1, privs[0]), btx1)
+        self.assertEqual(binascii.unhexlify(signall(tx, privs[0])), bin_signall(btx, privs[0]))
+        # unicode hex, as json.loads returns on python 2, is hex too
+        utx = json.loads(json.dumps(tx))
+        self.assertEqual(sign(utx, 1, privs[0]), tx1)
+        self.assertEqual(deserialize(utx), deserialize(tx))
+        self.assertEqual(signature_form(utx, 0, json.loads(json.dumps(mscript))),
+                         signature_form(tx, 0, mscript))
+
+        bmscript = binascii.unhexlify(mscript)
+        bsig1 = bin_multisign(btx, 0, bmscript, privs[1])
+        self.assertEqual(safe_hexlify(bsig1), multisign(tx, 0, mscript, privs[1]))
+        self.assertTrue(bin_verify_tx_input(btx1, 0, bmscript, bsig1, binascii.unhexlify(pubs[1])))
+        self.assertFalse(bin_verify_tx_input(btx1, 0, bmscript, bsig1, binascii.unhexlify(pubs[2])))
+
+        bsig3 = bin_multisign(btx, 0, bmscript, privs[3])
+        btx2 = bin_apply_multisignatures(btx1, 0, bmscript, [bsig1, bsig3])
+        self.assertEqual(btx2, binascii.unhexlify(apply_multisignatures(
+            tx1, 0, mscript, [safe_hexlify(bsig1), safe_hexlify(bsig3)])))
+        self.assertEqual(bin_serialize_script(deserialize_script(bin_deserialize(btx2)["ins"][0]["script"])),
+                         bin_deserialize(btx2)["ins"][0]["script"])
+
+
+    def test_large_serialize(self):
+        outs = [{"value": 1000 + i, "script": b'\x51' * (i % 300)} for i in range(70000)]
+        txobj = {"version": 1, "locktime": 0, "outs": outs,
+                 "ins": [{"outpoint": {"hash": b'\x01' * 32, "index": 0},
+                          "script": b'', "sequence": 4294967295}]}
+        btx = bin_serialize(txobj)
+        self.assertEqual(Tx.from_bytes(btx).serialize(), btx)
+        self.assertEqual(bin_serialize(bin_deserialize(btx)), btx)
+        self.assertEqual(btx[46:51], b'\xfe\x70\x11\x01\x00')
+
+
+    def test_splice_scripts(self):
+        btx = binascii.unhexlify(mktx(['%02x' % x * 32 + ':%d' % x for x in range(3)],
+                                      [privtoaddr(sha256('splice')) + ':5000']))
+        scripts = {2: b'\x51' * 300, 0: b'\x52' * 7}
+        txobj = bin_deserialize(btx)
+        for i, script in scripts.items():
+            txobj["ins"][i]["script"] = script
+        spliced = bin_splice_scripts(btx, scripts)
+        self.assertEqual(spliced, bin_serialize(txobj))
+        self.assertEqual(TxView(b'\x00' * 5 + btx, 5).with_scripts(scripts), spliced)
+        self.assertEqual(bin_splice_scripts(spliced, {0: b'', 2: b''}), btx)
+
+
+    def test_signall_workers(self):
+        privs = [sha256('signall%d' % x) for x in range(3)]
+        ins = ['%02x' % x * 32 + ':%d' % x for x in range(6)]
+        tx = mktx(ins, [privtoaddr(privs[0]) + ':9000'])
+        keys = dict((inp, privs[x % 3]) for x, inp in enumerate(ins))
+        for priv in [privs[0], keys]:
+            serial = signall(tx, priv)
+            self.assertEqual(signall(tx, priv, workers=3), serial)
+            self.assertEqual(bin_signall(binascii.unhexlify(tx), priv, 2), binascii.unhexlify(serial))
+
+
+class TestSighashCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing cached sighash engine")
+
+    def test_all(self):
+        ins = ['%02x' % x * 32 + ':%d' % x for x in range(4)]
+        outs = [privtoaddr(sha256(str(x))) + ':%d' % (1000 * x) for x in range(1, 4)]
+        btx = binascii.unhexlify(mktx(ins, outs))
+        txobj = bin_deserialize(btx)
+        cache = SighashCache(btx)
+        script = b'\x76\xa9\x14' + b'\x07' * 20 + b'\x88\xac'
+        for i in [3, 0, 2, 1, 1]:
+            for hashcode in [SIGHASH_ALL, SIGHASH_NONE, SIGHASH_SINGLE, SIGHASH_ANYONECANPAY,
+                             0x82, 0x83, 0, 0x44]:
+                if hashcode & 0x1f == SIGHASH_SINGLE and i == 3:
+                    # no output 3: the digest is 1 (the SIGHASH_SINGLE bug)
+                    self.assertEqual(cache.sighash(i, script, hashcode), b'\x01' + b'\x00' * 31)
+                    self.assertRaises(ValueError, signature_form, txobj, i, script, hashcode)
+                    continue
+                form = bin_serialize(signature_form(txobj, i, script, hashcode))
+                self.assertEqual(cache.signature_form(i, script, hashcode), form)
+                self.assertEqual(cache.sighash(i, script, hashcode), bin_sighash(form, hashcode))
+        # NONE / SINGLE zero the other inputs' sequences, ANYONECANPAY is the 0x80 bit
+        form = bin_deserialize(cache.signature_form(1, script, SIGHASH_SINGLE))
+        self.assertEqual([inp["sequence"] for inp in form["ins"]], [0, 0xffffffff, 0, 0])
+        self.assertEqual(len(form["outs"]), 2)
+        self.assertEqual(len(bin_deserialize(cache.signature_form(1, script, 0x82))["ins"]), 1)
+        # OP_CODESEPARATORs are left out of the scriptCode, pushed 0xab bytes aren't
+        sep = b'\xab\x01\xab\xab' + script
+        self.assertEqual(cache.sighash(0, sep), cache.sighash(0, b'\x01\xab' + script))
+
+    def test_core_vectors(self):
+        # every P2PKH / P2PK signature in tx_valid.json checks against its digest
+        checked = 0
+        for tv in json.load(open('tests/tx_valid.json')):
+            if len(tv) != 3:
+                continue
+            prevouts = dict(((p[0], p[1] & 0xffffffff), binascii.unhexlify(parse_script(p[2])))
+                            for p in tv[0])
+            btx = binascii.unhexlify(str(tv[1]))
+            cache = SighashCache(btx)
+            for i, inp in enumerate(bin_deserialize(btx)["ins"]):
+                spk = prevouts[(safe_hexlify(inp["outpoint"]["hash"]), inp["outpoint"]["index"])]
+                t, payload = classify_script(spk)
+                pushes = [p.tobytes() for p in script_pushes(inp["script"])]
+                if t not in (SCRIPT_P2PKH, SCRIPT_P2PK) or len(pushes) != (2 if t == SCRIPT_P2PKH else 1):
+                    continue
+                sig, pub = pushes[0], pushes[-1] if t == SCRIPT_P2PKH else payload.tobytes()
+                z = cache.sighash(i, spk, bytearray(sig[-1:])[0])
+                self.assertTrue(ecdsa_raw_verify(z, der_decode_sig(sig), pub), (tv[1], i))
+                checked += 1
+        self.assertTrue(checked >= 10)
+
+
+class TestSegwitSighash(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing BIP143 sighash & P2WPKH signing")
+
+    def test_native_p2wpkh(self):
+        # BIP143 native P2WPKH example, input 1
+        tx = ('0100000002fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f000000'
+              '0000eeffffffef51e1b804cc89d182d279655c3aa89e815b1b309fe287d9b2b55d57b90ec68a0100'
+              '000000ffffffff02202cb206000000001976a9148280b37df378db99f66f85c95a783a76ac7a6d59'
+              '88ac9093510d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2f0167faa815988ac11000000')
+        cache = SighashCache(tx)
+        z = cache.segwit_sighash(1, '76a9141d0f172a0ecb48aee1be1f2687d2963ae33f71a188ac', 600000000)
+        self.assertEqual(safe_hexlify(z), 'c37af31116d1b27caf68aae9e3ac82f1477929014d5b917657d0eb49478cb670')
+        self.assertEqual([safe_hexlify(h) for h in cache._bip143_hashes()], [
+            '96b827c8483d4e9b96712b6713a7b68d6e8003a781feba36c31143470b4efd37',
+            '52b0a642eea2fb7ae638c36f6252b6750293dbe574a806984b8e4d8548339a3b',
+            '863ef3e1a92afbfdb97f31ad0fc7683ee943e9abcf2501590ff8f6551f47e5e5'])
+
+    def test_p2sh_p2wpkh(self):
+        # BIP143 P2SH-P2WPKH example
+        tx = ('0100000001db6b1b20aa0fd7b23880be2ecbd4a98130974cf4748fb66092ac4d3ceb1a5477010000'
+              '0000feffffff02b8b4eb0b000000001976a914a457b684d7f0d539a46a45bbc043f35b59d0d96388'
+              'ac0008af2f000000001976a914fd270b1ee6abcaea97fea7ad0402e8bd8ad6d77c88ac92040000')
+        priv = 'eb696a065ef48a2192da5b28b694f87544b30fae8327c4510137a922f32c6dcf01'
+        signed = ('01000000000101db6b1b20aa0fd7b23880be2ecbd4a98130974cf4748fb66092ac4d3ceb1a547701'
+                  '0000001716001479091972186c449eb1ded22b78e40d009bdf0089feffffff02b8b4eb0b00000000'
+                  '1976a914a457b684d7f0d539a46a45bbc043f35b59d0d96388ac0008af2f000000001976a914fd27'
+                  '0b1ee6abcaea97fea7ad0402e8bd8ad6d77c88ac02473044022047ac8e878352d3ebbde1c94ce3a1'
+                  '0d057c24175747116f8288e5d794d12d482f0220217f36a485cae903c713331d877c1f64677e3622'
+                  'ad4010726870540656fe9dcb012103ad1d8e89212f0b92c74d23bb710c00662ad1470198ac48c43f'
+                  '7d6f93a2a2687392040000')
+        self.assertEqual(segwit_sign(tx, 0, priv, 1000000000, p2sh=True), signed)
+        self.assertEqual(segwit_signall(tx, priv, [1000000000], p2sh=True), signed)
+        self.assertEqual(serialize(deserialize(signed)), signed)
+        self.assertEqual(mk_p2wpkh_script(privtopub(priv)), '001479091972186c449eb1ded22b78e40d009bdf0089')
+        # the txid skips the witness, the wtxid doesn't
+        txobj = deserialize(signed)
+        for inp in txobj["ins"]:
+            del inp["witness"]
+        stripped = serialize(txobj)
+        self.assertEqual(safe_hexlify(bin_strip_witness(binascii.unhexlify(signed))), stripped)
+        self.assertEqual(txhash(signed), txhash(stripped))
+        self.assertEqual(bin_txhash(binascii.unhexlify(signed)), bin_txhash(stripped))
+        self.assertEqual(wtxid(stripped), txhash(stripped))
+        self.assertEqual(wtxid(signed), safe_hexlify(bin_dbl_sha256(binascii.unhexlify(signed))[::-1]))
+        self.assertNotEqual(wtxid(signed), txhash(signed))
+
+
+class TestVerifyTx(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing whole-transaction verification")
+
+    def test_all(self):
+        privs = [sha256('verify%d' % x) for x in range(4)]
+        pubs = [privtopub(priv) for priv in privs]
+        mscript = mk_multisig_script(pubs[1:], 2, 3)
+        segpriv = privs[0] + '01'
+        prevouts = [mk_pubkey_script(privtoaddr(privs[0])),
+                    '41' + pubs[0] + 'ac',
+                    'a914' + hash160(binascii.unhexlify(mscript)) + '87',
+                    mk_p2wpkh_script(privtopub(segpriv)),
+                    mscript]
+        amounts = [0, 0, 0, 5000, 0]
+        tx = mktx(['%02x' % x * 32 + ':%d' % x for x in range(5)], [privtoaddr(privs[0]) + ':1000'])
+
+        tx = sign(tx, 0, privs[0])
+        txobj = deserialize(tx)
+        txobj["ins"][1]["script"] = serialize_script([multisign(tx, 1, prevouts[1], privs[0])])
+        tx = serialize(txobj)
+        tx = apply_multisignatures(tx, 2, mscript, [multisign(tx, 2, mscript, privs[1]),
+                                                    multisign(tx, 2, mscript, privs[3])])
+        tx = segwit_sign(tx, 3, segpriv, 5000)
+        sigs = [multisign(tx, 4, mscript, privs[2]), multisign(tx, 4, mscript, privs[3])]
+        txobj = deserialize(tx)
+        txobj["ins"][4]["script"] = serialize_script([None] + sigs)
+        tx = serialize(txobj)
+
+        self.assertEqual(verify_tx(tx, prevouts, amounts), [True] * 5)
+        self.assertEqual(verify_tx(binascii.unhexlify(tx), prevouts, [0, 0, 0, 5001, 0]),
+                         [True, True, True, False, True])
+        self.assertEqual(verify_tx(tx, prevouts[1:2] + prevouts[1:], amounts),
+                         [False, True, True, True, True])
+        self.assertEqual(verify_tx(tx, prevouts, amounts[:3]), [True, True, True, False, True])
+        self.assertEqual(verify_tx(tx, prevouts[:4], amounts), [True, True, True, True, False])
+        txobj["ins"][4]["script"] = serialize_script([None] + sigs[::-1])   # out of order
+        self.assertEqual(verify_tx(serialize(txobj), prevouts, amounts)[4], False)
+
+    def test_hashcodes(self):
+        priv = sha256('verify-hashcodes')
+        spk = mk_pubkey_script(privtoaddr(priv))
+        tx = mktx(['%02x' % x * 32 + ':%d' % x for x in range(3)],
+                  [privtoaddr(priv) + ':%d' % (1000 + x) for x in range(2)])
+        for i, hashcode in enumerate([SIGHASH_NONE, SIGHASH_SINGLE, SIGHASH_SINGLE | SIGHASH_ANYONECANPAY]):
+            tx = sign(tx, i, priv, hashcode)
+        self.assertEqual(verify_tx(tx, [spk] * 3), [True] * 3)
+
+    def test_batch_verify(self):
+        items = []
+        for x in range(8):
+            priv, msghash = sha256('batch%d' % (x % 3)), sha256('msg%d' % x)
+            items.append((msghash if x % 4 else sha256('other'), ecdsa_raw_sign(msghash, priv),
+                          privtopub(priv)))
+        self.assertEqual(ecdsa_raw_verify_batch(items), [ecdsa_raw_verify(*item) for item in items])
+        self.assertEqual(ecdsa_raw_verify_batch(items), [x % 4 != 0 for x in range(8)])
+
+
+class TestCheckTransaction(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing transaction sanity checks")
+
+    def test_vectors(self):
+        for f in ['tests/tx_valid.json', 'tests/tx_valid_checktransaction.json']:
+            txs = [str(tv[1]) for tv in json.load(open(f)) if len(tv) == 3]
+            self.assertEqual(check_transactions(txs), [None] * len(txs))
+            self.assertTrue(all(check_transaction(tx) for tx in txs))
+
+        # tx_invalid.json's "Tests for CheckTransaction()" section
+        invalid = json.load(open('tests/tx_invalid.json'))
+        reasons = check_transactions(str(invalid[i][1]) for i in (17, 19, 21, 23, 25, 27, 30, 33))
+        self.assertEqual(reasons, ['bad-txns-vin-empty', 'bad-txns-vout-empty', 'bad-txns-vout-negative',
+                                   'bad-txns-vout-toolarge', 'bad-txns-txouttotal-toolarge',
+                                   'bad-txns-inputs-duplicate', 'bad-cb-length', 'bad-cb-length'])
+        self.assertRaises(ValueError, check_transaction, str(invalid[17][1]))
+
+    def test_framing(self):
+        tx = mktx(['11' * 32 + ':0', '22' * 32 + ':1'], ['76a914' + '33' * 20 + '88ac:1000'])
+        txobj = deserialize(tx)
+        self.assertTrue(check_transaction(txobj) and check_transaction(Tx.from_hex(tx)))
+        txobj["ins"][1]["outpoint"] = {"hash": "00" * 32, "index": 0xffffffff}
+        txobj["ins"][0]["witness"] = ['00' * 72]
+        btx = binascii.unhexlify(serialize(txobj))
+        self.assertEqual(check_transactions([btx, btx[:-1], btx + b'\x00', tx[:-2], {"ins": []}]),
+                         ['bad-txns-prevout-null', 'tx-truncated', 'tx-trailing-data',
+                          'tx-truncated', 'tx-malformed'])
+        # BIP144 framing with no witness data isn't a valid encoding
+        btx = binascii.unhexlify(tx)
+        self.assertEqual(check_transactions([btx[:4] + b'\x00\x01' + btx[4:-4] + b'\x00\x00' + btx[-4:]]),
+                         ['tx-superfluous-witness'])
+
+
+class TestStandardness(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing sigops & standardness prefilter")
+
+    def test_sigops(self):
+        pubs = [privtopub(sha256('sigops%d' % x) + '01') for x in range(3)]
+        ms = mk_multisig_script(pubs, 2, 3)
+        self.assertEqual((count_sigops(ms), count_sigops(ms, accurate=True)), (20, 3))
+        self.assertEqual(count_sigops(mk_pubkey_script(privtoaddr(pubs[0]))), 1)
+        self.assertEqual(count_sigops(''), 0)
+        p2sh = 'a914' + hash160(binascii.unhexlify(ms)) + '87'
+        tx = mktx(['11' * 32 + ':0', '22' * 32 + ':0'], [privtoaddr(pubs[0]) + ':10000'])
+        txobj = deserialize(tx)
+        txobj["ins"][0]["script"] = serialize_script([None, '30' * 71, '30' * 71, ms])
+        txobj["ins"][1]["script"] = serialize_script(['30' * 71, pubs[1]])
+        tx = serialize(txobj)
+        self.assertEqual(tx_sigops(tx), (1, 0))
+        self.assertEqual(tx_sigops(tx, [p2sh, mk_pubkey_script(privtoaddr(pubs[1]))]), (1, 3))
+
+    def test_prefilter(self):
+        priv = sha256('standard') + '01'
+        addr = privtoaddr(priv)
+        spk = mk_pubkey_script(addr)
+        self.assertEqual((dust_threshold(binascii.unhexlify(spk)),
+                          dust_threshold(binascii.unhexlify(mk_p2wpkh_script(privtopub(priv))))), (546, 294))
+        good = signall(mktx(['11' * 32 + ':0'], [addr + ':546', '6a026869:0']), priv)
+        self.assertEqual(standardness(good, [spk]), [])
+
+        txobj = deserialize(good)
+        txobj["version"] = 3
+        txobj["ins"][0]["script"] = '76' + txobj["ins"][0]["script"]
+        txobj["outs"][0]["value"] = 545
+        txobj["outs"] += [{"script": '6a026869', "value": 0}, {"script": '51', "value": 1000}]
+        bad = serialize(txobj)
+        self.assertEqual(standardness(bad, ['ac']),
+                         [('version', None), ('scriptsig-not-pushonly', 0),
+                          ('bad-txns-nonstandard-inputs', 0), ('dust', 0), ('scriptpubkey', 3),
+                          ('multi-op-return', None)])
+
+        dup = mktx(['11' * 32 + ':0', '11' * 32 + ':0'], [addr + ':1000'])
+        results = verify_txs([good, bad, dup], [[spk], [spk], [spk, spk]])
+        self.assertEqual(results[0], ([], [True]))
+        self.assertEqual(results[1][1], None)
+        self.assertEqual(results[2], ([('bad-txns-inputs-duplicate', None)], None))
+
+
+class TestMultisigCombiner(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing multisig signature combining")
+
+    def test_all(self):
+        privs = [sha256('combine%d' % x) + '01' for x in range(6)]
+        pubs = [privtopub(p) for p in privs]
+        ms = mk_multisig_script(pubs[:5], 3, 5)
+        p2sh = 'a914' + hash160(binascii.unhexlify(ms)) + '87'
+        tx = mktx(['11' * 32 + ':0'], [privtoaddr(privs[0]) + ':1000'])
+        sigs = [multisign(tx, 0, ms, privs[x]) for x in (4, 0, 2, 3)]
+
+        # any order, extras ignored: the first 3 in key order go in
+        signed = combine_multisignatures(tx, 0, ms, sigs)
+        self.assertEqual(signed, apply_multisignatures(tx, 0, ms, [sigs[1], sigs[2], sigs[3]]))
+        self.assertEqual(verify_tx(signed, [p2sh]), [True])
+
+        # cosigners take turns, the partially signed tx carrying the state
+        combiner = MultisigCombiner(binascii.unhexlify(tx), 0, ms)
+        self.assertEqual((combiner.add(sigs[0]), combiner.count, combiner.complete), (4, 1, False))
+        self.assertRaises(ValueError, combiner.apply)
+        self.assertRaises(ValueError, combiner.add, multisign(tx, 0, ms, privs[5]))
+        combiner = MultisigCombiner(combiner.partial(), 0, ms)
+        self.assertEqual(combiner.add_all([sigs[2], sigs[0]]), [2, 4])
+        self.assertEqual(combiner.count, 2)
+        combiner.add(sigs[1])
+        self.assertTrue(combiner.complete)
+        self.assertEqual(safe_hexlify(combiner.apply()),
+                         apply_multisignatures(tx, 0, ms, [sigs[1], sigs[2], sigs[0]]))
+        self.assertRaises(ValueError, MultisigCombiner, tx, 0, mk_pubkey_script(privtoaddr(privs[0])))
+
+
+class TestSigCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing signature cache")
+
+    def setUp(self):
+        self.saved = get_sigcache()
+
+    def tearDown(self):
+        set_sigcache(self.saved)
+
+    def test_all(self):
+        # off unless installed
+        self.assertTrue(self.saved is None)
+        cache = SigCache(max_entries=2)
+        set_sigcache(cache)
+        priv = sha256('sigcache')
+        pub = privtopub(priv)
+        items = [(sha256('msg%d' % x), ecdsa_raw_sign(sha256('msg%d' % x), priv), pub) for x in range(3)]
+
+        self.assertTrue(ecdsa_raw_verify(*items[0]))
+        self.assertTrue(ecdsa_raw_verify(*items[0]))
+        self.assertFalse(ecdsa_raw_verify(sha256('bad'), items[0][1], pub))
+        self.assertFalse(ecdsa_raw_verify(sha256('bad'), items[0][1], pub))
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 3, 1))
+
+        self.assertEqual(ecdsa_raw_verify_batch(items), [True] * 3)
+        self.assertEqual(len(cache), 2)     # oldest evicted
+        self.assertEqual(cache.hit_rate, 2.0 / 7)
+
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'sigcache.dat')
+        try:
+            with open(path, 'wb') as f:
+                f.write(b'old')
+            cache.save(path)
+            self.assertEqual(os.listdir(tmpdir), ['sigcache.dat'])     # no temp file left
+            self.assertEqual(os.path.getsize(path), 2 * KEY_LEN)
+            restored = SigCache(path=path)
+        finally:
+            os.remove(path)
+            os.rmdir(tmpdir)
+        self.assertEqual(restored.stats()["entries"], 2)
+        set_sigcache(restored)
+        self.assertTrue(ecdsa_raw_verify(*items[2]))
+        self.assertEqual(restored.hits, 1)
+
+        set_sigcache(None)
+        self.assertTrue(ecdsa_raw_verify(*items[2]))
+
+
+class TestScriptInterpreter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing script interpreter")
+
+    def _vectors(self, path):
+        with open(path) as f:
+            for tv in json.load(f):
+                if len(tv) >= 2:
+                    yield (binascii.unhexlify(parse_script(tv[0])),
+                           binascii.unhexlify(parse_script(tv[1])), tv)
+
+    def test_core_vectors(self):
+        for expected, path in [(True, 'tests/script_valid.json'), (False, 'tests/script_invalid.json')]:
+            for script_sig, script_pubkey, tv in self._vectors(path):
+                for templates in (True, False):
+                    self.assertEqual(verify_script(script_sig, script_pubkey, templates=templates),
+                                     expected, tv)
+
+    def test_signatures(self):
+        privs = [sha256('script%d' % x) for x in range(4)]
+        pubs = [privtopub(priv) for priv in privs]
+        mscript = mk_multisig_script(pubs[1:], 2, 3)
+        tx = mktx(['%02x' % x * 32 + ':%d' % x for x in range(2)], [privtoaddr(privs[0]) + ':1000'])
+        tx = sign(tx, 0, privs[0])
+        sigs = [multisign(tx, 1, mscript, privs[1]), multisign(tx, 1, mscript, privs[3])]
+        btx = binascii.unhexlify(apply_multisignatures(tx, 1, mscript, sigs))
+        ins = bin_deserialize(btx)["ins"]
+        p2pkh = binascii.unhexlify(mk_pubkey_script(privtoaddr(privs[0])))
+        p2sh = binascii.unhexlify('a914' + hash160(binascii.unhexlify(mscript)) + '87')
+        swapped = bin_serialize_script([None] + [binascii.unhexlify(x) for x in sigs[::-1]] +
+                                       [binascii.unhexlify(mscript)])
+        cache = SighashCache(btx)
+        for templates in (True, False):
+            self.assertTrue(verify_script(ins[0]["script"], p2pkh, btx, 0, templates=templates))
+            self.assertTrue(verify_script(ins[1]["script"], p2sh, cache, 1, templates=templates))
+            self.assertFalse(verify_script(ins[0]["script"], p2pkh, btx, 1, templates=templates))
+            self.assertFalse(verify_script(swapped, p2sh, cache, 1, templates=templates))
+            self.assertFalse(verify_script(ins[0]["script"], p2pkh, templates=templates))
+
+    def _tx_vectors(self, path):
+        with open(path) as f:
+            for tv in json.load(f):
+                if len(tv) == 3:
+                    prevouts = dict(((p[0], p[1] & 0xffffffff), binascii.unhexlify(parse_script(p[2])))
+                                    for p in tv[0])
+                    yield prevouts, binascii.unhexlify(str(tv[1])), tv
+
+    def _tx_valid(self, prevouts, btx, p2sh):
+        try:
+            check_transaction(btx)
+        except ValueError:
+            return False
+        cache = SighashCache(btx)
+        for i, inp in enumerate(bin_deserialize(btx)["ins"]):
+            spk = prevouts[(safe_hexlify(inp["outpoint"]["hash"]), inp["outpoint"]["index"])]
+            if not verify_script(inp["script"], spk, cache, i, p2sh=p2sh):
+                return False
+        return True
+
+    def test_tx_vectors(self):
+        for expected, path in [(True, 'tests/tx_valid.json'), (False, 'tests/tx_invalid.json')]:
+            for prevouts, btx, tv in self._tx_vectors(path):
+                self.assertEqual(self._tx_valid(prevouts, btx, tv[2]), expected, tv)
+
+    def test_numbers(self):
+        for n in [0, 1, -1, 127, 128, -128, 255, 2**31 - 1, -2**31 + 1]:
+            self.assertEqual(decode_num(encode_num(n)), n)
+        self.assertEqual(encode_num(-128), b'\x80\x80')
+        self.assertFalse(cast_to_bool(b'\x00\x80'))
+        self.assertTrue(cast_to_bool(b'\x80\x00'))
+
+
+class TestClassifyScript(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing scriptPubKey classifier")
+
+    def test_all(self):
+        pubs = [privtopub(sha256(str(x))) for x in range(3)]
+        h160 = b'\x11' * 20
+        p2pkh = mk_pubkey_script(privtoaddr(sha256('a')))
+        cases = [
+            (p2pkh, SCRIPT_P2PKH, p2pkh[6:46]),
+            ('a914' + '11' * 20 + '87', SCRIPT_P2SH, '11' * 20),
+            ('21' + compress(pubs[0]) + 'ac', SCRIPT_P2PK, compress(pubs[0])),
+            ('41' + pubs[1] + 'ac', SCRIPT_P2PK, pubs[1]),
+            (mk_multisig_script(pubs, 2, 3), SCRIPT_MULTISIG, mk_multisig_script(pubs, 2, 3)),
+            ('6a0568656c6c6f', SCRIPT_NULL_DATA, '0568656c6c6f'),
+            ('0014' + '22' * 20, SCRIPT_P2WPKH, '22' * 20),
+            ('0020' + '33' * 32, SCRIPT_P2WSH, '33' * 32),
+            ('5120' + '44' * 32, SCRIPT_WITNESS_UNKNOWN, '44' * 32),
+            ('0015' + '55' * 21, SCRIPT_NONSTANDARD, '0015' + '55' * 21),
+            ('', SCRIPT_NONSTANDARD, ''),
+        ]
+        scripts = [binascii.unhexlify(script) for script, _, _ in cases]
+        for script, (_, t, payload) in zip(scripts, cases):
+            self.assertEqual(classify_script(script)[0], t)
+            self.assertEqual(safe_hexlify(classify_script(script)[1].tobytes()), payload)
+
+        types, hashes = classify_scripts(scripts)
+        self.assertEqual(list(types), [t for _, t, _ in cases])
+        self.assertEqual(bytes(hashes[20:40]), h160)
+        self.assertEqual(bytes(hashes[40:60]), binascii.unhexlify(hash160(binascii.unhexlify(compress(pubs[0])))))
+        self.assertEqual(bytes(hashes[80:100]), b'\x00' * 20)
+
+        tx = binascii.unhexlify(mktx(['00' * 32 + ':0'], [{'script': script, 'value': 1}
+                                                          for script, _, _ in cases]))
+        btypes, bhashes, counts = classify_block_outputs(b'\x00' * 80 + b'\x02' + tx + tx)
+        self.assertEqual(list(btypes), list(types) * 2)
+        self.assertEqual(bytes(bhashes), bytes(hashes) * 2)
+        self.assertEqual(list(counts), [len(cases)] * 2)
+
+        # a segwit tx in the block is walked past its witnesses
+        segwit = binascii.unhexlify(SEGWIT_TX)
+        btypes, bhashes, counts = classify_block_outputs(b'\x00' * 80 + b'\x03' + tx + segwit + tx)
+        self.assertEqual(list(counts), [len(cases), 2, len(cases)])
+        self.assertEqual(list(btypes), list(types) + [SCRIPT_P2PKH] * 2 + list(types))
+        self.assertEqual(bytes(bhashes[20 * len(cases):20 * len(cases) + 40]),
+                         binascii.unhexlify('a457b684d7f0d539a46a45bbc043f35b59d0d963'
+                                            'fd270b1ee6abcaea97fea7ad0402e8bd8ad6d77c'))
+        self.assertEqual(bytes(bhashes[20 * len(cases) + 40:]), bytes(hashes))
+
+
+class TestDERCodec(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing strict DER signature codec")
+
+    def test_all(self):
+        for r, s in [(1, 1), (0x80, 0x7f), (N - 1, N // 2), (2 ** 255, 3)]:
+            sig = bin_der_encode_sig(r, s, 0x81)
+            self.assertEqual(parse_der_sig(sig), (r, s, 0x81))
+            self.assertEqual(parse_der_sig(sig[:-1]), (r, s, None))
+            self.assertEqual(der_encode_sig(r, s), safe_hexlify(sig[:-1]))
+            self.assertEqual(der_decode_sig(safe_hexlify(sig)), (None, r, s))
+            self.assertTrue(is_bip66(sig) and is_der(safe_hexlify(sig)))
+
+        good = binascii.unhexlify('3006020101020101' + '01')
+        self.assertEqual(parse_der_sig(memoryview(good)), (1, 1, 1))
+        for bad in ['3006020201010201' + '0101',    # bad framing
+                    '300602018102010101',           # negative R
+                    '30070202000102010101',         # padded R
+                    '30060200020101' + '01',        # empty R
+                    '30060201010201010100']:        # trailing byte
+            self.assertRaises(ValueError, parse_der_sig, binascii.unhexlify(bad))
+            self.assertFalse(is_bip66(bad))
+        # padding passes the lax parse
+        self.assertEqual(parse_der_sig(binascii.unhexlify('30070202000102010101'), strict=False),
+                         (1, 1, 1))
+
+        privs = [sha256(str(x)) for x in range(2)]
+        tx = mktx(['11' * 32 + ':0', '22' * 32 + ':1'], [privtoaddr(privs[0]) + ':1000'])
+        tx = signall(tx, privs[0])
+        sigs = [deserialize_der(d) for d in der_extract(tx)]
+        btx = binascii.unhexlify(tx)
+        block = b'\x00' * 80 + b'\x02' + btx + btx
+        self.assertEqual(extract_block_sigs(block, strict=True),
+                         [(t, i) + sigs[i] for t in range(2) for i in range(2)])
+
+        # witness signatures are found too; the P2SH-P2WPKH scriptSig only pushes the program
+        segwit = binascii.unhexlify(SEGWIT_TX)
+        wsig = deserialize(SEGWIT_TX)["ins"][0]["witness"][0]
+        block = b'\x00' * 80 + b'\x02' + segwit + btx
+        self.assertEqual(extract_block_sigs(block),
+                         [(0, 0) + parse_der_sig(binascii.unhexlify(wsig))] +
+                         [(1, i) + sigs[i] for i in range(2)])
+
+
+class TestCoinSelection(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing coin selection")
+
+    def test_all(self):
+        unspent = [{"output": "%064x:0" % i, "value": v}
+                   for i, v in enumerate([50000, 20000, 120000, 7000, 20000, 300000])]
+        pool = UTXOPool(unspent)
+        self.assertEqual(pool.values, [7000, 20000, 20000, 50000, 120000, 300000])
+        self.assertEqual(pool.total, 517000)
+        for value in [1, 20000, 60000, 350000, 517000]:
+            self.assertEqual(select(pool, value), select(unspent, value))
+        self.assertRaises(Exception, select, pool, 517001)
+
+        # 50000 + 20000 + 7000 pays value plus the fee for 3 inputs exactly (no change)
+        fee = 10 + 34 + 148 * 3
+        sel, change = select_coins(pool, 77000 - fee, fee_rate=1)
+        self.assertEqual(sorted(u["value"] for u in sel), [7000, 20000, 50000])
+        self.assertEqual(change, 0)
+        # nothing fits without change => change output of at least the dust threshold
+        sel, change = select_coins(pool, 200000, fee_rate=1, rng=random.Random(0))
+        total = sum(u["value"] for u in sel)
+        self.assertEqual(total - 200000 - change, 10 + 2 * 34 + 148 * len(sel))
+        self.assertTrue(change >= DUST_THRESHOLD)
+        self.assertRaises(ValueError, select_coins, pool, 517000, fee_rate=1)
+
+        pool.spend(sel)
+        pool.add({"output": "ff" * 32 + ":1", "value": 20000})
+        self.assertEqual(len(pool), 7 - len(sel))
+        self.assertEqual(pool.total, 517000 - total + 20000)
+        self.assertRaises(ValueError, pool.add, {"output": "ff" * 32 + ":1", "value": 1})
+
+
+class TestTxSize(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing exact tx size model")
+
+    def test_all(self):
+        privs = [sha256(str(x)) + '01' for x in range(3)]
+        pubs = [privtopub(p) for p in privs]
+        addr = privtoaddr(privs[0])
+        ms = mk_multisig_script(pubs, 2, 3)
+        tx = mktx(['11' * 32 + ':0', '22' * 32 + ':1'], [addr + ':1000', p2sh_scriptaddr(ms) + ':2000'])
+        unsigned = TxSize.from_txobj(tx)
+        signed = signall(tx, privs[0])
+        self.assertEqual(TxSize.from_txobj(signed).size, len(signed) // 2)
+        self.assertEqual(TxSize.from_txobj(deserialize(signed)).vsize, len(signed) // 2)
+        # unsigned inputs are sized with the longest (72 byte) low-S signature
+        self.assertTrue(0 <= unsigned.size - len(signed) // 2 <= 2)
+        self.assertEqual(estimate_tx_size(tx), unsigned.vsize)
+
+        sigs = [multisign(tx, 0, ms, privs[x]) for x in (0, 2)]
+        signed = apply_multisignatures(tx, 0, ms, sigs)
+        self.assertEqual([len(sig) // 2 for sig in sigs], [71, 72])
+        sizer = TxSize().add_spend(SCRIPT_P2SH, m=2, n=3)
+        sizer.add_input(0).add_output(25).add_output(23)
+        self.assertEqual(sizer.size, len(signed) // 2 + 1)
+
+        # BIP143 P2SH-P2WPKH example: 71 byte signature
+        signed = ('01000000000101db6b1b20aa0fd7b23880be2ecbd4a98130974cf4748fb66092ac4d3ceb1a547701'
+                  '0000001716001479091972186c449eb1ded22b78e40d009bdf0089feffffff02b8b4eb0b00000000'
+                  '1976a914a457b684d7f0d539a46a45bbc043f35b59d0d96388ac0008af2f000000001976a914fd27'
+                  '0b1ee6abcaea97fea7ad0402e8bd8ad6d77c88ac02473044022047ac8e878352d3ebbde1c94ce3a1'
+                  '0d057c24175747116f8288e5d794d12d482f0220217f36a485cae903c713331d877c1f64677e3622'
+                  'ad4010726870540656fe9dcb012103ad1d8e89212f0b92c74d23bb710c00662ad1470198ac48c43f'
+                  '7d6f93a2a2687392040000')
+        sizer = TxSize().add_spend(SCRIPT_P2WPKH, sig_size=71, p2sh=True).add_output().add_output()
+        self.assertEqual(TxSize.from_txobj(signed).size, sizer.size)
+        self.assertEqual(sizer.size, len(signed) // 2)
+        self.assertEqual(sizer.weight, 4 * (sizer.size - 2 - 107) + 2 + 107)     # 107 byte witness
+        self.assertEqual(sizer.vsize, (sizer.weight + 3) // 4)
+
+        # mksend pays fee_rate on the signed vsize, change included
+        ins = [{"output": "33" * 32 + ":%d" % x, "value": 100000} for x in range(3)]
+        tx = mksend(ins, [addr + ':150000'], addr, 0, fee_rate=20)
+        fee = 300000 - sum(o["value"] for o in deserialize(tx)["outs"])
+        self.assertEqual(fee, TxSize.from_txobj(tx).fee(20))
+        self.assertEqual(len(deserialize(tx)["outs"]), 2)
+        self.assertTrue(fee >= (len(signall(tx, privs[0])) // 2) * 20)
+
+
+class TestPayouts(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing payout builder")
+
+    def test_all(self):
+        addrs = [privtoaddr(sha256(str(x))) for x in range(40)]
+        change = p2sh_scriptaddr(mk_multisig_script([privtopub(sha256('c'))], 1, 1))
+        self.assertEqual([safe_hexlify(s) for s in addresses_to_scripts(addrs[:2] + [change])],
+                         [address_to_script(a) for a in addrs[:2] + [change]])
+        # other networks' (e.g. litecoin) version bytes aren't taken for P2PKH
+        self.assertEqual(addresses_to_scripts([privtoaddr(sha256('0'), 111)]),
+                         [binascii.unhexlify(mk_pubkey_script(privtoaddr(sha256('0'), 111)))])
+        for vbyte in (48, 50):
+            self.assertRaises(ValueError, addresses_to_scripts, [privtoaddr(sha256('0'), vbyte)])
+
+        payouts = ["%s:%d" % (addrs[x % 40], 10000 + x) for x in range(200)]
+        merged = merge_payouts(payouts + [(addrs[0], 5)])
+        self.assertEqual(len(merged), 40)
+        self.assertEqual(merged[0], (addresses_to_scripts([addrs[0]])[0],
+                                     sum(10000 + x for x in range(0, 200, 40)) + 5))
+
+        unspent = [{"output": "%064x:0" % x, "value": 10 ** 6} for x in range(1, 20)]
+        pool = UTXOPool(unspent)
+        txs = mk_payout_txs(pool, payouts, change, 5, max_weight=4000, max_inputs=5)
+        self.assertTrue(len(txs) > 1)
+        paid, spent = {}, 0
+        for tx in txs:
+            txobj = deserialize(tx)
+            self.assertTrue(TxSize.from_txobj(txobj).weight <= 4000)
+            fee = len(txobj["ins"]) * 10 ** 6 - sum(o["value"] for o in txobj["outs"])
+            self.assertTrue(fee >= TxSize.from_txobj(txobj).fee(5))
+            spent += len(txobj["ins"])
+            for o in txobj["outs"]:
+                if o["script"] != address_to_script(change):
+                    paid[o["script"]] = paid.get(o["script"], 0) + o["value"]
+        self.assertEqual(paid, dict((safe_hexlify(s), v) for s, v in merge_payouts(payouts)))
+        self.assertEqual(len(pool), 19 - spent)
+        self.assertRaises(ValueError, mk_payout_txs, pool, [addrs[0] + ':100'], change, 5)
+
+        # a batch that can't be funded puts back the coins earlier batches took
+        pool = UTXOPool(unspent)
+        self.assertRaises(ValueError, mk_payout_txs, pool, payouts + [addrs[0] + ':%d' % (10 ** 7)],
+                          change, 5, max_weight=4000, max_inputs=5)
+        self.assertEqual(sorted(u["output"] for u in pool), sorted(u["output"] for u in unspent))
+        # max_inputs is honoured by the selection itself, not checked after it
+        small = [{"output": "%064x:1" % x, "value": 3000} for x in range(1, 40)]
+        sel, _ = select_coins(small + unspent[:1], 20000, fee_rate=1, max_inputs=2)
+        self.assertEqual(len(sel), 1)
+        self.assertRaises(ValueError, select_coins, small, 20000, fee_rate=1, max_inputs=5)
+        txs = mk_payout_txs(small + unspent[:2], [addrs[1] + ':50000'], change, 1, max_inputs=2)
+        self.assertEqual(len(deserialize(txs[0])["ins"]), 1)
+
+        # a UTXOSet is spent from in place, and restored on failure
+        script = address_to_script(addrs[2])
+        utxos = UTXOSet(dict(u, script=script, height=7) for u in unspent)
+        txs = mk_payout_txs(utxos, payouts, change, 5, max_weight=4000, max_inputs=5)
+        spent = [i["outpoint"] for tx in txs for i in deserialize(tx)["ins"]]
+        self.assertEqual(len(utxos), 19 - len(spent))
+        self.assertFalse(any((o["hash"], o["index"]) in utxos for o in spent))
+        before = sorted((u["output"], utxos.coin(u["output"])) for u in utxos)
+        self.assertRaises(ValueError, mk_payout_txs, utxos, payouts + [addrs[0] + ':%d' % (10 ** 7)],
+                          change, 5, max_weight=4000, max_inputs=5)
+        self.assertEqual(sorted((u["output"], utxos.coin(u["output"])) for u in utxos), before)
+
+
+class TestCompression(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing compact tx / utxo encoding")
+
+    def test_amounts(self):
+        # values from Bitcoin Core's compress_tests
+        for value, compressed in [(0, 0), (1, 1), (1000000, 7), (100000000, 9),
+                                  (5000000000, 50), (2100000000000000, 21000000)]:
+            self.assertEqual(compress_amount(value), compressed)
+            self.assertEqual(decompress_amount(compressed), value)
+        for n in [0, 127, 128, 16511, 16512, 2 ** 32 - 1, 2 ** 64 - 1]:
+            self.assertEqual(read_varint(write_varint(n)), (n, len(write_varint(n))))
+        self.assertEqual(write_varint(128), b'\x80\x00')
+
+    def test_roundtrip(self):
+        privs = [sha256(str(x)) for x in range(3)]
+        cprivs = [p + '01' for p in privs]
+        pubs = [privtopub(p) for p in cprivs]
+        ms = mk_multisig_script(pubs, 2, 3)
+        outs = [privtoaddr(privs[0]) + ':50000000', p2sh_scriptaddr(ms) + ':1234567',
+                {'script': '41' + privtopub(privs[1]) + 'ac', 'value': 7},
+                {'script': '21' + pubs[2] + 'ac', 'value': 5000000000}]
+        tx = mktx(['%02x' % x * 32 + ':%d' % x for x in range(1, 5)], outs)
+        tx = sign(tx, 0, privs[0])
+        tx = sign(tx, 1, cprivs[1])
+        tx = apply_multisignatures(tx, 2, ms, [multisign(tx, 2, ms, cprivs[x]) for x in (0, 2)])
+        witness_tx = ('01000000000101db6b1b20aa0fd7b23880be2ecbd4a98130974cf4748fb66092ac4d3ceb1a5477'
+                      '010000001716001479091972186c449eb1ded22b78e40d009bdf0089feffffff02b8b4eb0b0000'
+                      '00001976a914a457b684d7f0d539a46a45bbc043f35b59d0d96388ac0008af2f000000001976a9'
+                      '14fd270b1ee6abcaea97fea7ad0402e8bd8ad6d77c88ac02473044022047ac8e878352d3ebbde1'
+                      'c94ce3a10d057c24175747116f8288e5d794d12d482f0220217f36a485cae903c713331d877c1f'
+                      '64677e3622ad4010726870540656fe9dcb012103ad1d8e89212f0b92c74d23bb710c00662ad147'
+                      '0198ac48c43f7d6f93a2a2687392040000')
+        for txh in [tx, witness_tx]:
+            btx = binascii.unhexlify(txh)
+            packed = compress_tx(btx)
+            self.assertEqual(decompress_tx(packed), (btx, len(packed)))
+            self.assertEqual(compress_tx(txh), packed)
+            self.assertTrue(len(packed) < len(btx) - 20)
+
+        for txh in [str(tv[1]).lower() for tv in json.load(open('tests/tx_valid.json')) if len(tv) == 3]:
+            btx = binascii.unhexlify(txh)
+            if bin_serialize(bin_deserialize(btx)) == btx:
+                self.assertEqual(decompress_tx(compress_tx(btx))[0], btx)
+
+        # Core's script templates: 21 / 21 / 33 / 33 bytes
+        for out in deserialize(tx)["outs"]:
+            script = binascii.unhexlify(out["script"])
+            packed = compress_script(script)
+            self.assertEqual(len(packed), 21 if len(script) < 30 else 33)
+            self.assertEqual(decompress_script(packed), (script, len(packed)))
+
+        utxos = [{"output": "%064x:%d" % (x, x), "value": out["value"], "script": out["script"],
+                  "height": 100 + x, "coinbase": x == 0}
+                 for x, out in enumerate(deserialize(tx)["outs"])]
+        f = io.BytesIO()
+        w = CompressedWriter(f, KIND_UTXO)
+        w.write_all(utxos)
+        self.assertEqual(list(iter_compressed(f.getvalue())), utxos)
+
+        f = io.BytesIO()
+        CompressedWriter(f).write_all([tx, witness_tx] * 20)
+        f.seek(0)
+        self.assertEqual(list(iter_compressed(f, chunk_size=64)),
+                         [binascii.unhexlify(t) for t in [tx, witness_tx] * 20])
+        self.assertRaises(ValueError, list, iter_compressed(f.getvalue()[:-3]))
+        data = f.getvalue()
+        self.assertEqual(data[5:6], KIND_TX)
+        self.assertRaises(ValueError, list, iter_compressed(data[:5] + b'x' + data[6:]))
+
+        # an mmap is decoded in place, its file position is left alone
+        with tempfile.TemporaryFile() as fo:
+            fo.write(f.getvalue())
+            fo.flush()
+            mm = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self.assertEqual(list(iter_compressed(mm)),
+                                 [binascii.unhexlify(t) for t in [tx, witness_tx] * 20])
+                self.assertEqual(mm.tell(), 0)
+            finally:
+                mm.close()
+
+
+class TestUTXOSet(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing array backed UTXO set")
+
+    def test_all(self):
+        priv = sha256('utxoset') + '01'
+        addr = privtoaddr(priv)
+        script = binascii.unhexlify(mk_pubkey_script(addr))
+        utxos = UTXOSet({"output": "%064x:%d" % (i, i % 3), "value": 1000 * (i + 1),
+                         "script": script, "height": i} for i in range(10))
+        self.assertEqual((len(utxos), utxos.total), (10, 55000))
+        key = outpoint_key("%064x:2" % 5)
+        self.assertEqual(len(key), 36)
+        self.assertEqual(key_to_outpoint(key), "%064x:2" % 5)
+        self.assertTrue(key in utxos and ("%064x" % 5, 2) in utxos)
+        self.assertEqual(utxos["%064x:2" % 5], (6000, script))
+        self.assertEqual(utxos.coin(key)["height"], 5)
+        self.assertEqual(utxos.get("%064x:0" % 5), None)
+        self.assertRaises(ValueError, utxos.add, key, 1)
+
+        # spent slots (and, once compacted, their script bytes) are reused
+        self.assertEqual(utxos.spend(key), (6000, script))
+        self.assertRaises(KeyError, utxos.spend, key)
+        utxos.add("ff" * 32 + ":0", 500, b'\x6a')
+        self.assertEqual(len(utxos._keys), 10)
+        self.assertEqual(utxos.total, 49500)
+
+        # selection straight from the set
+        self.assertEqual(select(utxos, 9500), [{"output": "%064x:0" % 9, "value": 10000}])
+        self.assertEqual(len(utxos.unspent(script)), 9)
+        tx = mksend(utxos, "1Q1wVsNNiUo68caU7BfyFFQ8fVBqxC2DSc:20000", addr, 0, fee_rate=2)
+        txobj = deserialize(tx)
+        fee = (sum(utxos[i["outpoint"]["hash"], i["outpoint"]["index"]][0] for i in txobj["ins"]) -
+               sum(o["value"] for o in txobj["outs"]))
+        # changeless if the change would be dust
+        self.assertTrue(0 <= fee - TxSize.from_txobj(txobj).fee(2) < DUST_THRESHOLD + 68)
+
+        # confirming the tx moves its inputs' value to its outputs
+        spent = utxos.apply_tx(tx, height=20)
+        self.assertEqual(len(spent), len(txobj["ins"]))
+        self.assertEqual(utxos.coin(txhash(tx) + ":0"),
+                         {"output": txhash(tx) + ":0", "value": 20000, "height": 20, "coinbase": False,
+                          "script": mk_pubkey_script("1Q1wVsNNiUo68caU7BfyFFQ8fVBqxC2DSc")})
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            utxos.save(path)
+            restored = UTXOSet.load(path)
+            self.assertEqual(sorted(restored, key=lambda u: u["output"]),
+                             sorted(utxos, key=lambda u: u["output"]))
+            self.assertEqual([restored.coin(u["output"]) for u in utxos],
+                             [utxos.coin(u["output"]) for u in utxos])
+            self.assertEqual(restored.total, utxos.total)
+            self.assertEqual(list(restored.utxos), list(utxos.utxos))
+            self.assertEqual(restored.unspent(script), utxos.unspent(script))
+            # spends leave the mapped sections alone; the first add copies them
+            out = next(iter(utxos))["output"]
+            self.assertEqual(restored.spend(out), utxos[out])
+            restored.add(out, 1234, script)
+            self.assertTrue(restored._mm is None)
+            self.assertEqual(restored[out], (1234, script))
+            self.assertEqual(restored.total, utxos.total - utxos[out][0] + 1234)
+            restored.save(path)
+            self.assertEqual(UTXOSet.load(path).coin(out), restored.coin(out))
+            with open(path, 'r+b') as f:
+                f.truncate(os.path.getsize(path) - 1)
+            self.assertRaises(ValueError, UTXOSet.load, path)
+        finally:
+            os.remove(path)
+
+    def test_selection(self):
+        rng = random.Random(7)
+        unspent = [{"output": "%064x:%d" % (i, i % 4), "value": rng.choice([3000, 20000, 75000]) + i}
+                   for i in range(60)]
+        utxos = UTXOSet(unspent)
+        for u in unspent[::3]:
+            utxos.spend(u["output"])
+        left = [u for u in unspent if u["output"] in utxos]
+        utxos.add("ee" * 32 + ":0", 20001)
+        left.append({"output": "ee" * 32 + ":0", "value": 20001})
+        # the set is its own pool
+        self.assertTrue(utxos.pool() is utxos)
+        pool = UTXOPool(left)
+        self.assertEqual(list(utxos.values), pool.values)
+        self.assertEqual(sorted(utxos.utxos, key=lambda u: u["output"]),
+                         sorted(pool.utxos, key=lambda u: u["output"]))
+        self.assertEqual(utxos.sum_range(3, 20), pool.sum_range(3, 20))
+        for value in [1000, 40000, 150000, 600000]:
+            self.assertEqual(sum(u["value"] for u in select(utxos, value)),
+                             sum(u["value"] for u in select(pool, value)))
+            sel, change = select_coins(utxos, value, fee_rate=2, rng=random.Random(1))
+            expected, expected_change = select_coins(pool, value, fee_rate=2, rng=random.Random(1))
+            self.assertEqual(([u["value"] for u in sel], change),
+                             ([u["value"] for u in expected], expected_change))
+        # adds and spends between selections drop the order; it's re-sorted on use
+        for i, value in enumerate([30000, 90000, 5000, 160000]):
+            sel, change = select_coins(utxos, value, fee_rate=2, rng=random.Random(i))
+            expected, expected_change = select_coins(pool, value, fee_rate=2, rng=random.Random(i))
+            self.assertEqual(([u["value"] for u in sel], change),
+                             ([u["value"] for u in expected], expected_change))
+            for u in expected:
+                utxos.spend(u["output"])
+                pool.remove(u["output"])
+            self.assertTrue(utxos._order is None)
+            coin = {"output": "%064x:1" % (0xdd00 + i), "value": 20001 + i}
+            utxos.add_utxo(coin)
+            pool.add(coin)
+            self.assertEqual(utxos.bisect(20001 + i), pool.bisect(20001 + i))
+        self.assertEqual(list(utxos.values), pool.values)
+        self.assertEqual(utxos.sum_range(0, len(pool)), pool.total)
+        utxos.compact()
+        self.assertEqual(list(utxos.values), pool.values)
+        self.assertEqual(sorted(u["output"] for u in utxos.utxos), sorted(pool._index))
+
+    def test_segwit(self):
+        # a segwit tx's outputs are keyed by its txid, not its wtxid
+        outpoint = deserialize(SEGWIT_TX)["ins"][0]["outpoint"]
+        utxos = UTXOSet([{"output": "%s:%d" % (outpoint["hash"], outpoint["index"]), "value": 10 ** 9}])
+        self.assertEqual(len(utxos.apply_tx(SEGWIT_TX, height=5)), 1)
+        self.assertEqual(sorted(u["output"] for u in utxos),
+                         sorted([txhash(SEGWIT_TX) + ":0", txhash(SEGWIT_TX) + ":1"]))
+        self.assertEqual(utxos.total, 199996600 + 800000000)
+
+
+# BIP143 P2SH-P2WPKH example, signed
+SEGWIT_TX = ('01000000000101db6b1b20aa0fd7b23880be2ecbd4a98130974cf4748fb66092ac4d3ceb1a547701'
+             '0000001716001479091972186c449eb1ded22b78e40d009bdf0089feffffff02b8b4eb0b00000000'
+             '1976a914a457b684d7f0d539a46a45bbc043f35b59d0d96388ac0008af2f000000001976a914fd27'
+             '0b1ee6abcaea97fea7ad0402e8bd8ad6d77c88ac02473044022047ac8e878352d3ebbde1c94ce3a1'
+             '0d057c24175747116f8288e5d794d12d482f0220217f36a485cae903c713331d877c1f64677e3622'
+             'ad4010726870540656fe9dcb012103ad1d8e89212f0b92c74d23bb710c00662ad1470198ac48c43f'
+             '7d6f93a2a2687392040000')
+
+
+class TestTxModel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing typed transaction model")
+
+    def test_roundtrip(self):
+        with open('tests/tx_valid.json', 'r') as fo:
+            vectors = [str(tv[1]).lower() for tv in json.load(fo) if len(tv) == 3]
+        for txh in vectors:
+            tx = Tx.from_hex(txh)
+            self.assertEqual(tx.to_hex(), txh)
+            self.assertEqual(tx.to_dict(), deserialize(txh))
+            self.assertEqual(Tx.from_dict(deserialize(txh)).to_hex(), txh)
+            self.assertEqual(Tx.from_dict(tx.to_dict(hexlify=False)).serialize(),
+                             binascii.unhexlify(txh))
+
+    def test_segwit(self):
+        tx = Tx.from_hex(SEGWIT_TX)
+        self.assertTrue(tx.has_witness)
+        self.assertEqual(len(tx.ins), 1)
+        self.assertEqual(len(tx.outs), 2)
+        self.assertEqual([safe_hexlify(w) for w in tx.ins[0].witness],
+                         deserialize(SEGWIT_TX)["ins"][0]["witness"])
+        self.assertEqual(tx.to_hex(), SEGWIT_TX)
+        self.assertEqual(tx.to_dict(), deserialize(SEGWIT_TX))
+        self.assertEqual(Tx.from_dict(deserialize(SEGWIT_TX)).to_hex(), SEGWIT_TX)
+        self.assertEqual(Tx.from_dict(tx.to_dict(hexlify=False)).to_hex(), SEGWIT_TX)
+        self.assertEqual(tx.txid, txhash(SEGWIT_TX))
+        self.assertEqual(tx.wtxid, wtxid(SEGWIT_TX))
+        self.assertNotEqual(tx.txid, tx.wtxid)
+        # dropping the witness leaves the txid alone
+        before = tx.txid
+        tx.ins[0].witness = []
+        self.assertFalse(tx.has_witness)
+        self.assertEqual(tx.txid, before)
+        self.assertEqual(tx.wtxid, before)
+        self.assertEqual(tx.to_hex(), safe_hexlify(bin_strip_witness(binascii.unhexlify(SEGWIT_TX))))
+
+    def test_lazy_scripts(self):
+        txh = mktx(['01'*32+':1'], ['76a914' + '00'*20 + '88ac:1000'])
+        tx = Tx.from_bytes(bytearray(binascii.unhexlify(txh)))
+        self.assertTrue(isinstance(tx.outs[0]._script, memoryview))
+        self.assertEqual(tx.outs[0].script, binascii.unhexlify('76a914' + '00'*20 + '88ac'))
+        self.assertFalse(isinstance(tx.outs[0]._script, memoryview))
+        self.assertEqual(tx.ins[0].outpoint, OutPoint(b'\x01'*32, 1))
+        self.assertRaises(ValueError, Tx.from_hex, txh[:-4])
+
+    def test_memoised(self):
+        txh = mktx(['01'*32+':1', '02'*32+':0'], ['76a914' + '00'*20 + '88ac:1000'])
+        tx = Tx.from_hex(txh)
+        self.assertTrue(tx.serialize() is tx.serialize())
+        self.assertEqual(txhash(tx), txhash(txh))
+        self.assertEqual(bin_txhash(tx), bin_txhash(txh))
+        self.assertEqual(txhash(tx, 1), txhash(txh, 1))
+        self.assertEqual(tx.size, len(txh) // 2)
+
+        def check():
+            self.assertEqual(tx.txid, txhash(Tx.from_dict(tx.to_dict()).to_hex()))
+        # a change only drops the cache of the Tx it was made to
+        other = Tx.from_hex(txh)
+        other_raw = other.serialize()
+        added = TxOut(1, b'\x6a')
+
+        def splice():
+            tx.ins[1:2] = [TxIn(OutPoint(b'\x04' * 32, 0))]
+        for mutate in [lambda: setattr(tx.ins[0], 'sequence', 0),
+                       lambda: setattr(tx.ins[1].outpoint, 'index', 5),
+                       lambda: setattr(tx.outs[0], 'value', 999),
+                       lambda: setattr(tx.outs[0], 'script', b'\x51'),
+                       lambda: tx.outs.append(added),
+                       lambda: setattr(added, 'value', 2),
+                       lambda: tx.ins.reverse(),
+                       lambda: setattr(tx.ins[0], 'outpoint', OutPoint(b'\x03' * 32, 0)),
+                       lambda: setattr(tx.ins[0].outpoint, 'index', 1),
+                       splice,
+                       lambda: setattr(tx.ins[1], 'script', b'\x51'),
+                       lambda: setattr(tx, 'locktime', 7)]:
+            before = tx.txid
+            mutate()
+            self.assertNotEqual(tx.txid, before)
+            check()
+            self.assertTrue(other.serialize() is other_raw)
+        # the witness is left out of the txid but not the serialization
+        before, raw = tx.txid, tx.serialize()
+        tx.ins[0].witness.append(b'\x01')
+        self.assertEqual(tx.txid, before)
+        self.assertNotEqual(tx.serialize(), raw)
+        self.assertEqual(tx.wtxid, wtxid(tx.to_hex()))
+
+        # items shared between Txs invalidate all of them, until taken out
+        t1 = Tx.from_hex(txh)
+        t2 = Tx(1, t1.ins, t1.outs, 0)
+        a, b = t1.txid, t2.txid
+        t1.ins[0].sequence = 5
+        self.assertNotEqual(t1.txid, a)
+        self.assertNotEqual(t2.txid, b)
+        self.assertEqual(Tx.from_bytes(t1.serialize()).ins[0].sequence, 5)
+        self.assertEqual(Tx.from_bytes(t2.serialize()).ins[0].sequence, 5)
+        txin, txout = t1.ins.pop(0), t1.outs[0]
+        del t1.outs[0]
+        t1.ins.append(txin)
+        t2.outs = []
+        a, b = t1.txid, t2.txid
+        txin.sequence = 6
+        txout.value = 5
+        self.assertNotEqual(t1.txid, a)
+        self.assertNotEqual(t2.txid, b)
+        a, b = t1.txid, t2.txid
+        txout.value = 6
+        self.assertEqual((t1.txid, t2.txid), (a, b))
+        t1.ins.remove(txin)
+        t2.ins.remove(txin)
+        a, b = t1.txid, t2.txid
+        txin.outpoint.index = 9
+        self.assertEqual((t1.txid, t2.txid), (a, b))
+        self.assertEqual(t1.serialize(), Tx.from_dict(t1.to_dict()).serialize())
+
+        txs = [Tx.from_hex(mktx(['%02x' % x * 32 + ':0'], ['00' * 20 + ':1'])) for x in range(2)]
+        root = bin_dbl_sha256(txs[0].bin_txid[::-1] + txs[1].bin_txid[::-1])[::-1]
+        header = {'merkle_root': safe_hexlify(root)}
+        self.assertEqual(mk_merkle_proof(header, txs, 1),
+                         mk_merkle_proof(header, [t.txid for t in txs], 1))
+
+
+class TestTxView(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing lazy transaction view")
+
+    def test_all(self):
+        with open('tests/tx_valid.json', 'r') as fo:
+            vectors = [str(tv[1]).lower() for tv in json.load(fo) if len(tv) == 3]
+        blob = b''.join(binascii.unhexlify(txh) for txh in vectors)
+        pos = 0
+        for txh in vectors:
+            view = TxView(blob, pos)
+            txo = deserialize(txh)
+            self.assertEqual(view.txid, txhash(txh))
+            self.assertEqual(view.raw(), binascii.unhexlify(txh))
+            self.assertEqual(view.input_count, len(txo["ins"]))
+            self.assertEqual(view.output_count, len(txo["outs"]))
+            self.assertEqual(view.version, txo["version"])
+            self.assertEqual(view.locktime, txo["locktime"])
+            for i, inp in enumerate(txo["ins"]):
+                self.assertEqual(view.ins[i].outpoint.txid, inp["outpoint"]["hash"])
+                self.assertEqual(view.outpoint(i)[1], inp["outpoint"]["index"])
+                self.assertEqual(safe_hexlify(view.in_script(i).tobytes()), inp["script"])
+                self.assertEqual(view.sequence(i), inp["sequence"])
+            for i, out in enumerate(txo["outs"]):
+                self.assertEqual(view.out_value(i), out["value"])
+                self.assertEqual(safe_hexlify(view.outs[i].script), out["script"])
+            self.assertEqual(view.to_tx().to_hex(), txh)
+            pos = view.end
+        self.assertEqual(pos, len(blob))
+
+    def test_segwit(self):
+        raw = binascii.unhexlify(SEGWIT_TX)
+        txo = deserialize(SEGWIT_TX)
+        view = TxView(b'\x00' * 3 + raw, 3)
+        self.assertTrue(view.has_witness)
+        self.assertEqual(view.end, 3 + len(raw))
+        self.assertEqual((view.input_count, view.output_count), (1, 2))
+        self.assertEqual(safe_hexlify(view.in_script(0).tobytes()), txo["ins"][0]["script"])
+        self.assertEqual(view.sequence(0), txo["ins"][0]["sequence"])
+        self.assertEqual([safe_hexlify(w.tobytes()) for w in view.witness(0)], txo["ins"][0]["witness"])
+        self.assertEqual(view.locktime, txo["locktime"])
+        self.assertEqual(view.txid, txhash(SEGWIT_TX))
+        self.assertEqual(view.wtxid, wtxid(SEGWIT_TX))
+        self.assertEqual(view.to_tx().to_hex(), SEGWIT_TX)
+        self.assertEqual(view.to_tx().txid, view.txid)
+        self.assertEqual(view.ins[0].witness, Tx.from_hex(SEGWIT_TX).ins[0].witness)
+        self.assertFalse(TxView(bin_strip_witness(raw)).has_witness)
+
+
+class TestTxStream(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        print("Testing streaming transaction reader")
+
+    def test_all(self):
+        import io
+        with open('tests/tx_valid.json', 'r') as fo:
+            vectors = [str(tv[1]).lower() for tv in json.load(fo) if len(tv) == 3]
+        blob = b''.join(binascii.unhexlify(txh) for txh in vectors)
+
+        for chunk_size in (5, 4096):
+            txs = list(iter_transactions(io.BytesIO(blob), 'tx', chunk_size))
+            self.assertEqual([tx.to_hex() for tx in txs], vectors)
+        self.assertEqual(list(iter_transactions(blob, 'dict')), [deserialize(h) for h in vectors])
+        self.assertEqual([v.txid for v in iter_transactions(bytearray(blob), 'view')],
+                         [txhash(h) for h in vectors])
+        self.assertRaises(ValueError, list, iter_transactions(io.BytesIO(blob[:-1]), 'raw'))
+        self.assertRaises(ValueError, list, iter_transactions(blob[:-1], 'tx'))
+
+        # an mmap is parsed in place: views point into it and its file position stays put
+        blob += binascii.unhexlify(SEGWIT_TX)
+        vectors.append(SEGWIT_TX)
+        with tempfile.TemporaryFile() as f:
+            f.write(blob)
+            f.flush()
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                views = list(iter_transactions(mm, 'view'))
+                self.assertEqual([v.txid for v in views], [txhash(h) for h in vectors])
+                self.assertEqual(len(set(id(v._buf) for v in views)), 1)
+                self.assertEqual([tx.to_hex() for tx in iter_transactions(mm, 'tx')], vectors)
+                self.assertEqual(mm.tell(), 0)
+                views = None    # release the views before closing the map
+                # detached copies outlive the map
+                views = [v.detach() for v in iter_transactions(mm, 'view')]
+                txs = list(iter_transactions(mm, 'tx', copy=True))
+                kept = list(iter_transactions(mm, 'tx'))
+                self.assertEqual(kept[-1].ins[0].witness, txs[-1].ins[0].witness)
+                kept = [tx.detach() for tx in kept]
+            finally:
+                mm.close()
+        self.assertEqual([v.txid for v in views], [txhash(h) for h in vectors])
+        self.assertEqual([v.raw() for v in views], [binascii.unhexlify(h) for h in vectors])
+        self.assertEqual([v.to_tx().to_hex() for v in views], vectors)
+        self.assertEqual([w.tobytes() for w in views[-1].witness(0)], kept[-1].ins[0].witness)
+        for tx in txs + kept:
+            tx.ins[0].sequence = 0
+        self.assertEqual([tx.to_dict() for tx in txs], [tx.to_dict() for tx in kept])
+        for chunk_size in (5, 4096):
+            self.assertEqual([h for h in iter_transactions(io.BytesIO(blob), 'dict', chunk_size)],
+                             [deserialize(h) for h in vectors])
+
+
 class TestDeterministicGenerate(unittest.TestCase):
     @classmethod
     def setUpClass(cls):